@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Local stand-in of TestRail API, used by tests of HTTP behaviour of clients and by benchmarks """
+import collections
+import email.parser
+import email.policy
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/index.php?/api/v2/'
+
+Request = collections.namedtuple('Request', 'method uri headers data')
+# Response closing the connection without answering, once the request is processed
+DROP_CONNECTION = object()
+
+
+class FakeTestRail:
+    """ HTTP/1.1 server emulating TestRail API, running in a background thread
+
+        `responses` maps an API method (e.g. 'get_run/1') to its response, which is either:
+        - a payload, sent as JSON with HTTP 200,
+        - a tuple `(status, payload)` or `(status, payload, headers)`,
+        - a callable taking the `Request` and returning one of the above,
+        - a list of the above, consumed in order (the last one is kept),
+        - `DROP_CONNECTION`, to close the connection without answering.
+        Unknown API methods get an HTTP 400 error, like TestRail does.
+        Parameters of API methods (e.g. '&offset=250') are ignored to find the response.
+        Received requests are stored in `requests`, with their JSON body decoded, or for multipart bodies (uploads
+        of attachments) a dict giving `name`, `filename` and `content` of the uploaded file.
+
+        Each request is answered after `latency` seconds. If `rate_limit` is set, requests exceeding this
+        number of requests per second get an HTTP 429 error with a `Retry-After` header, like TestRail Cloud.
+        `add_run` and `add_plan` set responses emulating Test Runs and Test Plans, results added in these Test Runs
+        being counted in `added_results`.
+
+        If `gzip` is set, responses are compressed for clients accepting it, and compressed request bodies are
+        accepted. Otherwise compressed request bodies get an HTTP 415 error, like a server not supporting them.
+    """
+
+    def __init__(self, latency=0.0, rate_limit=0):
+        self.responses = {}
+        self.requests = []
+        self.connections = 0
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.throttled = 0
+        self.added_results = 0
+        self.gzip = False
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05, ), daemon=True)
+
+    @property
+    def url(self):
+        """ Base URL of the server, to give to `APIClient` """
+        return 'http://127.0.0.1:%d/' % self._server.server_address[1]
+
+    def start(self):
+        """ Start serving in background """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop the server """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_run(self, run_id, case_ids, status_id=3, is_completed=False, page_size=250):
+        """ Emulate a Test Run containing tests of the given Test Cases, with paginated `get_tests`
+
+        :param run_id: ID of the Test Run
+        :param case_ids: IDs (int) of the Test Cases of the Test Run
+        :param status_id: Status of the tests (default: untested)
+        :param is_completed: True if Test Run is closed
+        :param page_size: Number of tests in a page of `get_tests`
+        """
+        tests = [{'id': run_id * 1000000 + case_id, 'case_id': case_id, 'status_id': status_id}
+                 for case_id in case_ids]
+
+        def _get_tests(request):
+            offset = int(request.uri.split('&offset=')[1].split('&')[0]) if '&offset=' in request.uri else 0
+            next_offset = offset + page_size
+            return {
+                'offset': offset,
+                'limit': page_size,
+                'size': len(tests[offset:next_offset]),
+                '_links': {
+                    'next': '/api/v2/get_tests/%d&limit=%d&offset=%d' % (run_id, page_size, next_offset)
+                            if next_offset < len(tests) else None
+                },
+                'tests': tests[offset:next_offset]
+            }
+
+        def _add_results(request):
+            with self._lock:
+                self.added_results += len(request.data['results'])
+            return [{'id': index, 'test_id': run_id * 1000000 + result['case_id'], 'status_id': result['status_id']}
+                    for index, result in enumerate(request.data['results'])]
+
+        self.responses['get_run/%d' % run_id] = {'id': run_id, 'is_completed': is_completed}
+        self.responses['get_tests/%d' % run_id] = _get_tests
+        self.responses['add_results_for_cases/%d' % run_id] = _add_results
+
+    def add_plan(self, plan_id, run_ids, is_completed=False):
+        """ Emulate a Test Plan containing Test Runs (emulated by `add_run`), one per plan entry """
+        runs = [self.responses['get_run/%d' % run_id] for run_id in run_ids]
+        self.responses['get_plan/%d' % plan_id] = {
+            'id': plan_id,
+            'is_completed': is_completed,
+            'entries': [{'runs': [run]} for run in runs]
+        }
+
+    def get_response(self, request):
+        """ Return `(status, payload, headers)` to answer to a `Request` """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append(request)
+            if self.rate_limit and self._is_throttled():
+                self.throttled += 1
+                return 429, {'error': 'API Rate Limit Exceeded'}, {'Retry-After': '1'}
+            response = self.responses.get(request.uri.split('&')[0], (400, {'error': 'Unknown method'}))
+            if isinstance(response, list):
+                response = response.pop(0) if len(response) > 1 else response[0]
+        if callable(response):
+            response = response(request)
+        if not isinstance(response, tuple):
+            response = (200, response)
+        if len(response) == 2:
+            response += ({}, )
+        return response
+
+    def _is_throttled(self):
+        """ Return True if a request exceeds `rate_limit` in the last second """
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 1:
+            self._window.popleft()
+        if len(self._window) >= self.rate_limit:
+            return True
+        self._window.append(now)
+        return False
+
+    def count_connection(self):
+        """ Called for each accepted connection """
+        with self._lock:
+            self.connections += 1
+
+
+def _make_handler(fake):
+    """ Return a request handler class bound to the given `FakeTestRail` """
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            fake.count_connection()
+
+        def do_GET(self):    # pylint: disable=invalid-name
+            """ Answer GET requests """
+            self._answer('GET', None)
+
+        def do_POST(self):    # pylint: disable=invalid-name
+            """ Answer POST requests """
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.headers.get('Content-Encoding') == 'gzip':
+                if not fake.gzip:
+                    self._send(415, b'{"error": "Unsupported Content-Encoding"}', {})
+                    return
+                body = gzip.decompress(body)
+            if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+                self._answer('POST', _parse_multipart(self.headers['Content-Type'], body))
+            else:
+                self._answer('POST', json.loads(body.decode()) if body else None)
+
+        def _answer(self, method, body):
+            uri = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else self.path
+            status, payload, headers = fake.get_response(Request(method, uri, dict(self.headers), body))
+            if payload is DROP_CONNECTION:
+                self.close_connection = True
+                return
+            content = json.dumps(payload).encode() if payload is not None else b''
+            if fake.gzip and content and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                content = gzip.compress(content)
+                headers = dict(headers, **{'Content-Encoding': 'gzip'})
+            self._send(status, content, headers)
+
+        def _send(self, status, content, headers):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):    # pylint: disable=arguments-differ
+            """ Keep test output quiet """
+
+    return _Handler
+
+
+def _parse_multipart(content_type, body):
+    """ Return the file uploaded by a multipart/form-data body """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    part = next(message.iter_parts())
+    return {
+        'name': part.get_param('name', header='content-disposition'),
+        'filename': part.get_filename(),
+        'content': part.get_payload(decode=True)
+    }
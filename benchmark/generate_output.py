@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Generator of synthetic Robot Framework outputs (output.xml), to benchmark parsing and publishing
+
+Usage::
+
+    python -m benchmark.generate_output --suites 100 --tests 100 output.xml
+"""
+import argparse
+import datetime
+import random
+from xml.sax.saxutils import escape
+
+ID_SOURCES = ('tags', 'metadata', 'mixed')
+
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+         'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua')
+
+
+def generate_output(path, suites=10, tests=10, tags=3, keywords=2, message_length=200, fail_ratio=0.2,
+                    id_source='tags', seed=0):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """ Write a Robot Framework 7 output, and return the IDs (int) of the Test Cases it contains
+
+        Tests of a suite get Test Case IDs from their tags (`test_case_id=C<id>`), or from a `TEST_CASE_ID`
+        metadata of their suite. With 'mixed', suites alternate between both.
+
+        :param path: Path of the output to write
+        :param suites: Number of suites
+        :param tests: Number of tests per suite
+        :param tags: Number of tags per test, besides Test Case ID
+        :param keywords: Number of keywords per test
+        :param message_length: Length of messages of failed tests and of keywords
+        :param fail_ratio: Ratio of failed tests
+        :param id_source: Source of Test Case IDs: 'tags', 'metadata' or 'mixed'
+        :param seed: Seed of random generator, for reproducible outputs
+    """
+    randomizer = random.Random(seed)
+    timestamp = datetime.datetime(2024, 1, 1)
+    case_ids = []
+
+    def _text(length):
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(randomizer.choice(WORDS))
+        return ' '.join(words)[:length]
+
+    def _status(status, message=''):
+        return '<status status="%s" start="%s" elapsed="0.001000">%s</status>\n' % (
+            status, timestamp.isoformat(), escape(message))
+
+    with open(path, 'w', encoding='UTF-8') as output:
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<robot generator="Robot 7.0 (benchmark)" generated="%s" rpa="false" schemaversion="5">\n'
+                     '<suite id="s1" name="Benchmark" source="/benchmark">\n' % timestamp.isoformat())
+        for suite_index in range(1, suites + 1):
+            from_metadata = id_source == 'metadata' or (id_source == 'mixed' and suite_index % 2 == 0)
+            output.write('<suite id="s1-s%d" name="Suite %d" source="/benchmark/suite_%d.robot">\n' %
+                         (suite_index, suite_index, suite_index))
+            if from_metadata:
+                case_ids.append(len(case_ids) + 1)
+            for test_index in range(1, tests + 1):
+                status = 'FAIL' if randomizer.random() < fail_ratio else 'PASS'
+                message = _text(message_length) if status == 'FAIL' else ''
+                output.write('<test id="s1-s%d-t%d" name="Test %d" line="%d">\n' %
+                             (suite_index, test_index, test_index, test_index))
+                for keyword_index in range(keywords):
+                    last = keyword_index == keywords - 1
+                    output.write('<kw name="Log" owner="BuiltIn">\n<msg time="%s" level="INFO">%s</msg>\n'
+                                 '<arg>%s</arg>\n' % (timestamp.isoformat(), escape(_text(message_length)),
+                                                      escape(_text(20))))
+                    output.write(_status(status if last else 'PASS', message if last else ''))
+                    output.write('</kw>\n')
+                for tag_index in range(tags):
+                    output.write('<tag>tag_%d</tag>\n' % tag_index)
+                if not from_metadata:
+                    case_ids.append(len(case_ids) + 1)
+                    output.write('<tag>test_case_id=C%d</tag>\n' % case_ids[-1])
+                output.write(_status(status, message))
+                output.write('</test>\n')
+            if from_metadata:
+                output.write('<meta name="TEST_CASE_ID">%s</meta>\n' % escape('C%d' % case_ids[-1]))
+            output.write(_status('PASS'))
+            output.write('</suite>\n')
+        output.write(_status('PASS'))
+        output.write('</suite>\n<statistics>\n<total>\n</total>\n<tag>\n</tag>\n<suite>\n</suite>\n</statistics>\n'
+                     '<errors>\n</errors>\n</robot>\n')
+    return case_ids
+
+
+def options():
+    """ Manage options """
+    parser = argparse.ArgumentParser(prog='generate_output.py', description='Generate a synthetic output.xml.')
+    parser.add_argument('output', help='Path of the output to write.')
+    parser.add_argument('--suites', type=int, default=10, help='Number of suites (default: %(default)s).')
+    parser.add_argument('--tests', type=int, default=10, help='Number of tests per suite (default: %(default)s).')
+    parser.add_argument('--tags', type=int, default=3, help='Number of tags per test (default: %(default)s).')
+    parser.add_argument('--keywords', type=int, default=2, help='Number of keywords per test (default: %(default)s).')
+    parser.add_argument(
+        '--message-length', type=int, default=200, help='Length of messages (default: %(default)s).')
+    parser.add_argument(
+        '--fail-ratio', type=float, default=0.2, help='Ratio of failed tests (default: %(default)s).')
+    parser.add_argument(
+        '--id-source', choices=ID_SOURCES, default='tags', help='Source of Test Case IDs (default: %(default)s).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of random generator (default: %(default)s).')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGUMENTS = options()
+    CASE_IDS = generate_output(
+        ARGUMENTS.output,
+        suites=ARGUMENTS.suites,
+        tests=ARGUMENTS.tests,
+        tags=ARGUMENTS.tags,
+        keywords=ARGUMENTS.keywords,
+        message_length=ARGUMENTS.message_length,
+        fail_ratio=ARGUMENTS.fail_ratio,
+        id_source=ARGUMENTS.id_source,
+        seed=ARGUMENTS.seed)
+    print('%s: %d Test Case ID(s)' % (ARGUMENTS.output, len(CASE_IDS)))
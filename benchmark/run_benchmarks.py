@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Benchmarks of parsing Robot Framework outputs and of publishing results in a local stand-in of TestRail
+
+Usage::
+
+    python -m benchmark.run_benchmarks --suites 100 --tests 100 --runs 4 --latency 0.05
+
+Scenarios are:
+- startup: time to import `robotframework2testrail` in a new interpreter, as measured by `python -X importtime`,
+- parse: time and peak memory (traced by `tracemalloc`) of each parser of `robotframework2testrail`, and of the
+  'stream' parser extracting traces of failed keywords (`failure_trace`),
+- records: memory held by results stored as dicts and as `result_record.ResultRecord`, and time to encode the
+  bodies of `add_results_for_cases` requests,
+- index: time to index the tests of a Test Run by case ID and to filter results with it (`testrail_utils.RunIndex`),
+  for growing sizes: it should grow linearly,
+- decode: time and memory to decode `get_tests` responses with all fields and with the fields needed to publish,
+  and sizes of responses and of `add_results_for_cases` bodies compressed with gzip,
+- publish: time, number of requests and of connections to publish results in all Test Runs of a Test Plan,
+  sequentially, with threads, and with the asyncio client.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import robotframework2testrail
+import testrail_http
+from benchmark.fake_testrail import FakeTestRail
+from benchmark.generate_output import ID_SOURCES, generate_output
+from result_record import ResultRecord
+from testrail_async import AsyncTestRailApiUtils, publish_results_async
+from testrail_utils import TESTS_FIELDS, RunIndex, TestRailApiUtils
+
+PUBLISH_MODES = {
+    # name: (max_workers, batch_workers, async)
+    'sequential': (1, 1, False),
+    'threads': (4, 2, False),
+    'async': (4, 2, True),
+}
+
+
+def benchmark_import(module='robotframework2testrail', repeat=5):
+    """ Measure the import of a module in a new interpreter
+
+    :param module: Name of the module
+    :param repeat: Number of measures, the best one being kept
+    :return: Dict with `seconds` (cumulative import time of the module) and `modules` (number of modules imported)
+    """
+    measures = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                 cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True,
+                                 check=True)
+        lines = [line for line in process.stderr.splitlines() if line.startswith('import time:') and '|' in line]
+        microseconds = next(int(line.split('|')[1]) for line in lines if line.split('|')[2].strip() == module)
+        measures.append((microseconds / 1000000, len(lines) - 1))    # Without header
+    seconds, modules = min(measures)
+    return {'seconds': seconds, 'modules': modules}
+
+
+def benchmark_parse(output, parser, repeat=3, **options):
+    """ Measure parsing of an output
+
+    :param output: Path of the output
+    :param parser: Parser of `robotframework2testrail.get_testcases`
+    :param repeat: Number of measures of time, the best one being kept
+    :param options: Other options of `robotframework2testrail.get_testcases` (e.g. `failure_trace`)
+    :return: Dict with `results` (number of results), `seconds` and `peak_bytes`
+    """
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        testcases = robotframework2testrail.get_testcases(output, parser=parser, **options)
+        seconds.append(time.perf_counter() - start)
+        del testcases
+
+    gc.collect()
+    tracemalloc.start()
+    testcases = robotframework2testrail.get_testcases(output, parser=parser, **options)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'results': len(testcases), 'seconds': min(seconds), 'peak_bytes': peak_bytes}
+
+
+def benchmark_records(testcases, batch_size=500):
+    """ Measure memory held by results and time to encode them, stored as dicts and as `ResultRecord`
+
+    :param testcases: Results returned by `get_testcases`
+    :param batch_size: Maximum number of results sent in one request
+    :return: Dict with, for `dict` and `record`, `bytes` held by results and `encode_seconds`
+    """
+    factories = {
+        'dict': dict,
+        'record': lambda testcase: ResultRecord(testcase['id'], testcase['status'], testcase['name'],
+                                                testcase['comment'], testcase['duration'])
+    }
+    measures = {}
+    for name, factory in factories.items():
+        gc.collect()
+        tracemalloc.start()
+        records = [factory(testcase) for testcase in testcases]
+        held_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        # pylint: disable=protected-access
+        data = TestRailApiUtils._encode_results('1.0', records)
+        batches = TestRailApiUtils._split_in_batches(data, batch_size, 0)
+        bodies = [TestRailApiUtils._get_body(batch) for batch in batches]
+        measures[name] = {'bytes': held_bytes, 'encode_seconds': time.perf_counter() - start}
+        del records, bodies
+    return measures
+
+
+def benchmark_index(sizes=(5000, 40000), repeat=3):
+    """ Measure indexing of the tests of a Test Run and filtering of results with `RunIndex`
+
+    :param sizes: Numbers of tests and of results to measure
+    :param repeat: Number of measures, the best one being kept
+    :return: Dict with `seconds` for each size
+    """
+    measures = {}
+    for size in sizes:
+        tests = [{'id': i, 'case_id': i, 'status_id': 1 + i % 5} for i in range(size)]
+        testcases = [{'id': 'C{}'.format(i * 2), 'status': 'PASS'} for i in range(size)]
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            RunIndex(tests).filter(testcases, publish_blocked=False)
+            seconds.append(time.perf_counter() - start)
+        measures[size] = {'seconds': min(seconds)}
+    return measures
+
+
+def _get_tests_page(case_ids):
+    """ Return the body of a `get_tests` response, tests having the fields of a typical TestRail instance """
+    tests = [{
+        'id': 1000000 + case_id,
+        'case_id': case_id,
+        'status_id': 3,
+        'assignedto_id': None,
+        'run_id': 1,
+        'title': 'Test case number %d' % case_id,
+        'template_id': 1,
+        'type_id': 7,
+        'priority_id': 2,
+        'estimate': None,
+        'estimate_forecast': None,
+        'refs': 'REQ-%d' % case_id,
+        'milestone_id': None,
+        'custom_automation_type': 1,
+        'custom_preconds': 'Preconditions of the test case',
+        'custom_steps': 'Step 1\nStep 2\nStep 3',
+        'custom_expected': 'Expected result',
+        'labels': []
+    } for case_id in case_ids]
+    page = {'offset': 0, 'limit': len(tests), 'size': len(tests), '_links': {'next': None, 'prev': None}}
+    page['tests'] = tests
+    return json.dumps(page).encode()
+
+
+def benchmark_decode(testcases, case_ids, repeat=3):
+    """ Measure decoding of `get_tests` responses and compression of bodies
+
+    :param testcases: Results returned by `get_testcases`
+    :param case_ids: IDs (int) of Test Cases of the Test Run
+    :param repeat: Number of measures of time, the best one being kept
+    :return: Dict with, for `all_fields` and `projected`, `seconds`, `peak_bytes` and `held_bytes` (memory held by
+             the decoded response), and `bytes` and `gzip_bytes` of the `tests` response and of the `results` body
+    """
+    page = _get_tests_page(case_ids)
+    measures = {}
+    for name, fields in (('all_fields', None), ('projected', TESTS_FIELDS)):
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            testrail_http.decode_response(page, fields=fields)
+            seconds.append(time.perf_counter() - start)
+        gc.collect()
+        tracemalloc.start()
+        response = testrail_http.decode_response(page, fields=fields)
+        held_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        measures[name] = {'seconds': min(seconds), 'peak_bytes': peak_bytes, 'held_bytes': held_bytes}
+        del response
+
+    # pylint: disable=protected-access
+    body = TestRailApiUtils._get_body(TestRailApiUtils._encode_results('1.0', testcases))
+    for name, content in (('tests', page), ('results', body)):
+        measures[name] = {'bytes': len(content), 'gzip_bytes': len(testrail_http.compress_body(content))}
+    return measures
+
+
+def benchmark_publish(testcases, case_ids, mode, runs=1, latency=0.0, rate_limit=0, batch_size=500):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """ Measure publishing of results in a Test Plan of the local stand-in of TestRail
+
+    :param testcases: Results to publish, returned by `get_testcases`
+    :param case_ids: IDs (int) of Test Cases present in Test Runs
+    :param mode: Key of `PUBLISH_MODES`
+    :param runs: Number of Test Runs in the Test Plan
+    :param latency: Latency of each request, in seconds
+    :param rate_limit: Maximum number of requests per second accepted by TestRail (0 for no limit)
+    :param batch_size: Maximum number of results sent in one request
+    :return: Dict with `published`, `results` (number of results added), `seconds`, `requests`, `connections`
+             and `throttled` (number of HTTP 429)
+    """
+    max_workers, batch_workers, use_async = PUBLISH_MODES[mode]
+    run_ids = list(range(1, runs + 1))
+    with FakeTestRail(latency=latency, rate_limit=rate_limit) as server:
+        for run_id in run_ids:
+            server.add_run(run_id, case_ids)
+        server.add_plan(1, run_ids)
+
+        pool_size = max(4, max_workers * batch_workers)
+        api = (AsyncTestRailApiUtils if use_async else TestRailApiUtils)(server.url, pool_size=pool_size)
+        api.retry_policy = testrail_http.RetryPolicy(backoff=0.1, max_backoff=2)
+        api.batch_size = batch_size
+        api.batch_workers = batch_workers
+
+        start = time.perf_counter()
+        if use_async:
+
+            async def _publish():
+                try:
+                    return await publish_results_async(api, testcases, plan_id=1)
+                finally:
+                    await api.close()
+
+            published = asyncio.run(_publish())
+        else:
+            published = robotframework2testrail.publish_results(api, testcases, plan_id=1, max_workers=max_workers)
+            api.close()
+        seconds = time.perf_counter() - start
+
+        return {
+            'published': published,
+            'results': server.added_results,
+            'seconds': seconds,
+            'requests': len(server.requests),
+            'connections': server.connections,
+            'throttled': server.throttled
+        }
+
+
+def run_benchmarks(arguments):
+    """ Run all scenarios, and return their measures """
+    measures = {'startup': benchmark_import(repeat=arguments.repeat), 'parse': {}, 'records': {}, 'publish': {}}
+    print('startup {:<12} {modules:>8} modules  {seconds:8.3f} s'.format('import', **measures['startup']))
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'output.xml')
+        case_ids = generate_output(
+            output,
+            suites=arguments.suites,
+            tests=arguments.tests,
+            tags=arguments.tags,
+            message_length=arguments.message_length,
+            fail_ratio=arguments.fail_ratio,
+            id_source=arguments.id_source)
+        measures['output_bytes'] = os.path.getsize(output)
+
+        parsings = {parser: (parser, {}) for parser in robotframework2testrail.PARSERS}
+        parsings['stream+trace'] = ('stream', {'failure_trace': True})
+        for name, (parser, parse_options) in parsings.items():
+            measures['parse'][name] = benchmark_parse(output, parser, arguments.repeat, **parse_options)
+            print('parse   {:<12} {results:>8} results  {seconds:8.3f} s  {peak_mib:8.1f} MiB peak'.format(
+                name, peak_mib=measures['parse'][name]['peak_bytes'] / 1024 / 1024, **measures['parse'][name]))
+
+        testcases = robotframework2testrail.get_testcases(output, parser='stream')
+        measures['records'] = benchmark_records(testcases, arguments.batch_size)
+        for name, record_measures in measures['records'].items():
+            print('records {:<12} {:>8} results  {encode_seconds:8.3f} s  {mib:8.1f} MiB held'.format(
+                name, len(testcases), mib=record_measures['bytes'] / 1024 / 1024, **record_measures))
+        measures['index'] = benchmark_index(repeat=arguments.repeat)
+        for size, index_measures in measures['index'].items():
+            print('index   {:<12} {:>8} results  {seconds:8.3f} s'.format('run_index', size, **index_measures))
+        measures['decode'] = benchmark_decode(testcases, case_ids, arguments.repeat)
+        for name in ('all_fields', 'projected'):
+            decode_measures = measures['decode'][name]
+            print('decode  {:<12} {:>8} tests    {seconds:8.3f} s  {peak_mib:8.1f} MiB peak  {held_mib:8.1f} MiB held'.
+                  format(name, len(case_ids), peak_mib=decode_measures['peak_bytes'] / 1024 / 1024,
+                         held_mib=decode_measures['held_bytes'] / 1024 / 1024, **decode_measures))
+        for name in ('tests', 'results'):
+            print('gzip    {:<12} {bytes:>12} bytes  {gzip_bytes:>10} bytes compressed'.format(
+                name, **measures['decode'][name]))
+        for mode in arguments.modes:
+            measures['publish'][mode] = benchmark_publish(testcases, case_ids, mode, arguments.runs, arguments.latency,
+                                                          arguments.rate_limit, arguments.batch_size)
+            print('publish {:<12} {results:>8} results  {seconds:8.3f} s  {requests:6} requests  '
+                  '{connections:4} connections  {throttled:4} throttled'.format(mode, **measures['publish'][mode]))
+    return measures
+
+
+def options():
+    """ Manage options """
+    parser = argparse.ArgumentParser(prog='run_benchmarks.py', description='Benchmark parsing and publishing.')
+    parser.add_argument('--suites', type=int, default=20, help='Number of suites (default: %(default)s).')
+    parser.add_argument('--tests', type=int, default=50, help='Number of tests per suite (default: %(default)s).')
+    parser.add_argument('--tags', type=int, default=3, help='Number of tags per test (default: %(default)s).')
+    parser.add_argument(
+        '--message-length', type=int, default=200, help='Length of messages (default: %(default)s).')
+    parser.add_argument(
+        '--fail-ratio', type=float, default=0.2, help='Ratio of failed tests (default: %(default)s).')
+    parser.add_argument(
+        '--id-source', choices=ID_SOURCES, default='tags', help='Source of Test Case IDs (default: %(default)s).')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of measures of import and parse times (default: %(default)s).')
+    parser.add_argument(
+        '--runs', type=int, default=4, help='Number of Test Runs in the Test Plan (default: %(default)s).')
+    parser.add_argument(
+        '--latency', type=float, default=0.02, help='Latency of TestRail, in seconds (default: %(default)s).')
+    parser.add_argument(
+        '--rate-limit',
+        type=int,
+        default=0,
+        help='Maximum number of requests per second accepted by TestRail, 0 for no limit (default: %(default)s).')
+    parser.add_argument(
+        '--batch-size', type=int, default=500, help='Number of results per request (default: %(default)s).')
+    parser.add_argument(
+        '--modes',
+        nargs='+',
+        choices=list(PUBLISH_MODES),
+        default=list(PUBLISH_MODES),
+        help='Publishing modes to measure (default: all).')
+    parser.add_argument('--json', metavar='PATH', help='Write measures to a JSON file, to compare them later.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGUMENTS = options()
+    # Don't measure the console output of the tool
+    logging.getLogger().setLevel(logging.WARNING)
+    MEASURES = run_benchmarks(ARGUMENTS)
+    if ARGUMENTS.json:
+        with open(ARGUMENTS.json, 'w', encoding='UTF-8') as json_file:
+            json.dump(MEASURES, json_file, indent=2)
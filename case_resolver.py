@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Resolution of TestRail Test Case IDs from names of Robot Framework tests and suites """
+import json
+import logging
+import os
+import re
+import time
+
+INDEX_FILENAME = 'testrail-cases-{project_id}-{suite_id}.json'
+INDEX_TTL = 3600
+
+
+def normalize_title(title):
+    """ Return the key of a title in the index: case, underscores and repeated whitespaces are ignored """
+    return re.sub(r'\s+', ' ', title.replace('_', ' ')).strip().casefold()
+
+
+class CaseResolver:
+    """ Index of the Test Cases of a TestRail project (or suite) by normalized title
+
+        The index is built from `get_cases` and stored in a JSON file, to be reused by next invocations.
+        When a title is not found, the index is refreshed once, in case the Test Case was added since, unless it
+        was refreshed less than `ttl` seconds ago: tests that never match a Test Case (e.g. legacy tests) don't
+        download all Test Cases again at each invocation.
+    """
+    # Identity of the index (project, suite, file) and its refresh state are kept together with the index
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, api, project_id, suite_id=None, index_path=None, ttl=INDEX_TTL):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param api: Client to TestRail API (`testrail_utils.TestRailApiUtils`)
+        :param project_id: TestRail ID of the project
+        :param suite_id: TestRail ID of the suite (only needed for projects with several suites)
+        :param index_path: Path of the JSON file storing the index. Default: `INDEX_FILENAME` in current directory.
+        :param ttl: Minimum delay between two refreshes of the index, in seconds
+        """
+        self.api = api
+        self.project_id = project_id
+        self.suite_id = suite_id
+        self.index_path = index_path or INDEX_FILENAME.format(project_id=project_id, suite_id=suite_id or 0)
+        self.ttl = ttl
+        self.refreshed = False
+        self._updated = 0
+        self._index = self._load()
+
+    def resolve(self, name):
+        """ Return the ID (int) of the Test Case whose title matches a name. `None` if not found. """
+        key = normalize_title(name)
+        if key not in self._index and not self.refreshed and time.time() - self._updated >= self.ttl:
+            logging.info('Test Case "%s" not found in index of project #%s: refresh index', name, self.project_id)
+            self.refresh()
+        return self._index.get(key)
+
+    def resolve_testcases(self, testcases):
+        """ Set the Test Case ID of testcases without ID (see `get_testcases` with `keep_unidentified`),
+            from the name of their test, else from the name of their suite. Testcases not resolved are dropped.
+
+        :param testcases: List of testcases, returned by `get_testcases`
+        :return: List of testcases with ID
+        """
+        result = []
+        unresolved = 0
+        for testcase in testcases:
+            suite_name = testcase.pop('suite', None)
+            if testcase['id'] is None:
+                case_id = self.resolve(testcase['name'])
+                if case_id is None and suite_name:
+                    case_id = self.resolve(suite_name)
+                if case_id is None:
+                    logging.debug('No Test Case ID for test "%s"', testcase['name'])
+                    unresolved += 1
+                    continue
+                testcase['id'] = 'C{}'.format(case_id)
+            result.append(testcase)
+        if unresolved:
+            logging.warning('%d test(s) without Test Case ID and not matching a Test Case title: not published',
+                            unresolved)
+        return result
+
+    def refresh(self):
+        """ Build the index from TestRail, and store it """
+        index = {}
+        for case in self.api.iter_cases(self.project_id, self.suite_id, prefetch=True):
+            key = normalize_title(case['title'])
+            if key in index:
+                logging.warning('Several Test Cases titled "%s": C%d is used', case['title'], index[key])
+                continue
+            index[key] = case['id']
+        self._index = index
+        self._updated = time.time()
+        self.refreshed = True
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.index_path, 'w', encoding='UTF-8') as index_file:
+            json.dump({
+                'project_id': self.project_id,
+                'suite_id': self.suite_id,
+                'updated': self._updated,
+                'cases': index
+            }, index_file)
+        logging.info('Index of %d Test Case(s) of project #%s stored in %s', len(index), self.project_id,
+                     self.index_path)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _load(self):
+        """ Return the index stored in `index_path`, and set the time it was built.
+            Empty if not stored, or if it indexes another project or suite.
+        """
+        try:
+            with open(self.index_path, encoding='UTF-8') as index_file:
+                stored = json.load(index_file)
+            cases = stored['cases']
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+        if (stored.get('project_id'), stored.get('suite_id')) != (self.project_id, self.suite_id):
+            logging.warning('Index %s is the one of project #%s (suite #%s): ignored', self.index_path,
+                            stored.get('project_id'), stored.get('suite_id'))
+            return {}
+        self._updated = stored.get('updated') or 0
+        return cases
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Cache of results parsed from Robot Framework outputs """
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+# Version of the format of cached results, to increment when results returned by `get_testcases` change
+CACHE_VERSION = 2
+CACHE_FILENAME = 'parse-{digest}.pickle.gz'
+# Size of each chunk of an output read to compute its content hash
+SAMPLE_SIZE = 1024 * 1024
+
+
+def get_content_hash(path, size):
+    """ Return a fast hash of the content of a file: its first, middle and last chunks
+
+    :param path: Path of the file
+    :param size: Size of the file
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as file:
+        if size <= 3 * SAMPLE_SIZE:
+            digest.update(file.read())
+        else:
+            for offset in (0, (size - SAMPLE_SIZE) // 2, size - SAMPLE_SIZE):
+                file.seek(offset)
+                digest.update(file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """ Cache of the testcases extracted from Robot Framework outputs, reused by next invocations
+
+        An entry is a gzipped pickle, stored in a file named from the path of the output and the parsing options.
+        It is used only if size, modification time and content hash of the output are unchanged: an output
+        rewritten in place is parsed again.
+    """
+
+    def __init__(self, cache_dir):
+        """ Init
+
+        :param cache_dir: Directory of cached results
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, path, parser, keep_unidentified=False, **options):
+        """ Return the testcases cached for an output. `None` if not cached or output changed.
+
+        :param path: Path of the output
+        :param parser: Parser of `robotframework2testrail.get_testcases`
+        :param keep_unidentified: Option of `robotframework2testrail.get_testcases`
+        :param options: Other options of `robotframework2testrail.get_testcases`
+        """
+        try:
+            with gzip.open(self._get_entry_path(path, parser, keep_unidentified, options), 'rb') as entry:
+                signature = pickle.load(entry)
+                if signature == self._get_signature(path):
+                    self.hits += 1
+                    return pickle.load(entry)
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError) as error:
+            logging.warning('Cached results of "%s" ignored: %s', path, error)
+        self.misses += 1
+        return None
+
+    def set(self, path, parser, keep_unidentified, testcases, **options):
+        """ Cache the testcases of an output
+
+        :param path: Path of the output
+        :param parser: Parser of `robotframework2testrail.get_testcases`
+        :param keep_unidentified: Option of `robotframework2testrail.get_testcases`
+        :param testcases: Testcases returned by `get_testcases`
+        :param options: Other options of `robotframework2testrail.get_testcases`
+        """
+        entry_path = self._get_entry_path(path, parser, keep_unidentified, options)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file, gzip.GzipFile(fileobj=temp_file, mode='wb',
+                                                                                compresslevel=1) as entry:
+                pickle.dump(self._get_signature(path), entry, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(testcases, entry, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry_path)    # Atomic: a concurrent invocation never reads a partial entry
+        except OSError as error:
+            logging.warning('Results of "%s" not cached: %s', path, error)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def log_statistics(self):
+        """ Log number of hits and misses """
+        logging.info('Parse cache: %d hit(s), %d miss(es)', self.hits, self.misses)
+
+    def _get_entry_path(self, path, parser, keep_unidentified, options):
+        """ Return the path of the entry of an output. Options left to their default value (False) are ignored. """
+        options = sorted(name for name, value in options.items() if value)
+        key = '{}\n{}\n{}\n{}\n{}'.format(CACHE_VERSION, os.path.realpath(path), parser, bool(keep_unidentified),
+                                          ','.join(options))
+        digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, CACHE_FILENAME.format(digest=digest))
+
+    @staticmethod
+    def _get_signature(path):
+        """ Return the signature of the content of an output: size, modification time and content hash """
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns, get_content_hash(path, stat.st_size))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Write-ahead journal of results published in TestRail, to resume interrupted publishing """
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+
+JOURNAL_FILENAME = 'robotframework2testrail-journal.sqlite'
+
+
+class PublishJournal:
+    """ Journal of the batches of results sent to TestRail, stored in a SQLite database
+
+        A publishing session is identified by a digest of published results (see `get_session_digest`),
+        so that it is recognized when the same output is published again.
+        Each batch is recorded before being sent, then acknowledged with the response of TestRail.
+        When resuming a session, acknowledged batches and completed Test Runs are not sent again.
+    """
+
+    def __init__(self, path, session, resume=False):
+        """ Init
+
+        :param path: Path of the database
+        :param session: Digest identifying the publishing session
+        :param resume: If False, journal of a previous publishing of the same session is cleared
+        """
+        self.session = session
+        self._lock = threading.Lock()
+        self._database = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._database.executescript('''
+            CREATE TABLE IF NOT EXISTS batches (
+                session TEXT, run_id INTEGER, digest TEXT, batch_index INTEGER, size INTEGER,
+                acknowledged INTEGER, results TEXT, PRIMARY KEY (session, run_id, digest));
+            CREATE TABLE IF NOT EXISTS runs (session TEXT, run_id INTEGER, PRIMARY KEY (session, run_id));
+        ''')
+        if not resume:
+            self._execute('DELETE FROM batches WHERE session = ?', (session, ))
+            self._execute('DELETE FROM runs WHERE session = ?', (session, ))
+
+    @staticmethod
+    def get_session_digest(testcases, version=''):
+        """ Return the digest of a publishing session
+
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param version: Version indicated in Test Case results
+        """
+        digest = hashlib.sha256(json.dumps(version).encode())
+        for testcase in testcases:
+            digest.update(json.dumps(dict(testcase), sort_keys=True).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_batch_digest(batch):
+        """ Return the digest of a batch of results encoded in JSON """
+        return hashlib.sha256(b'\n'.join(batch)).hexdigest()
+
+    def plan_batch(self, run_id, digest, batch_index, size):
+        """ Record a batch of results before sending it. Return the results of TestRail if it was already
+            acknowledged, else `None`.
+        """
+        with self._lock:
+            row = self._database.execute(
+                'SELECT results FROM batches WHERE session = ? AND run_id = ? AND digest = ? AND acknowledged = 1',
+                (self.session, run_id, digest)).fetchone()
+            if row:
+                return json.loads(row[0])
+            self._database.execute('INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?, 0, NULL)',
+                                   (self.session, run_id, digest, batch_index, size))
+            self._database.commit()
+        return None
+
+    def acknowledge_batch(self, run_id, digest, results):
+        """ Record that a batch of results was accepted by TestRail """
+        self._execute(
+            'UPDATE batches SET acknowledged = 1, results = ? WHERE session = ? AND run_id = ? AND digest = ?',
+            (json.dumps(results), self.session, run_id, digest))
+
+    def complete_run(self, run_id):
+        """ Record that all results were published in a Test Run """
+        self._execute('INSERT OR REPLACE INTO runs VALUES (?, ?)', (self.session, run_id))
+
+    def is_run_complete(self, run_id):
+        """ Return True if all results were already published in a Test Run """
+        with self._lock:
+            return self._database.execute('SELECT 1 FROM runs WHERE session = ? AND run_id = ?',
+                                          (self.session, run_id)).fetchone() is not None
+
+    def get_pending_batches(self):
+        """ Return the list of tuples (run_id, batch_index, size) of batches sent but not acknowledged """
+        with self._lock:
+            return self._database.execute(
+                'SELECT run_id, batch_index, size FROM batches WHERE session = ? AND acknowledged = 0 '
+                'ORDER BY run_id, batch_index', (self.session, )).fetchall()
+
+    def log_statistics(self):
+        """ Log batches not acknowledged by TestRail """
+        for run_id, batch_index, size in self.get_pending_batches():
+            logging.warning('Batch #%d of %d result(s) not acknowledged in Test Run #%d: use --resume to send it',
+                            batch_index, size, run_id)
+
+    def close(self):
+        """ Close the database """
+        self._database.close()
+
+    def _execute(self, sql, parameters):
+        """ Execute and commit a statement """
+        with self._lock:
+            self._database.execute(sql, parameters)
+            self._database.commit()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Metrics of a publishing: duration of phases, and requests sent to TestRail """
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import threading
+import time
+
+# Upper bounds of buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class PublishMetrics:
+    """ Metrics collected during a publishing
+
+        Phases (e.g. parsing, publishing) are timed with `phase`. Requests are recorded by `record_request`,
+        to be set as `timing_callback` of the client of TestRail API: they are aggregated by API method
+        (e.g. 'get_tests'), with a histogram of latencies.
+    """
+
+    def __init__(self):
+        """ Init """
+        self.phases = collections.OrderedDict()
+        self.values = collections.OrderedDict()
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Context manager timing a phase. Durations of a phase entered several times are summed. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def set(self, name, value):
+        """ Record a value (e.g. number of results) """
+        with self._lock:
+            self.values[name] = value
+
+    def record_request(self, timing):
+        """ Record a request
+
+        :param timing: `testrail_http.RequestTiming` of the request
+        """
+        endpoint = timing.uri.split('/', 1)[0].split('&', 1)[0]
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'requests': 0,
+                    'errors': 0,
+                    'retries': 0,
+                    'reused_connections': 0,
+                    'bytes_sent': 0,
+                    'bytes_received': 0,
+                    'latency_total': 0.0,
+                    'latency_max': 0.0,
+                    'latency_histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'rate_limit_sleep': 0.0,
+                    'retry_sleep': 0.0
+                }
+            stats['requests'] += 1
+            stats['errors'] += timing.status >= 300
+            stats['retries'] += timing.attempt > 1
+            stats['reused_connections'] += bool(timing.reused)
+            stats['bytes_sent'] += timing.sent
+            stats['bytes_received'] += timing.received
+            stats['latency_total'] += timing.elapsed
+            stats['latency_max'] = max(stats['latency_max'], timing.elapsed)
+            stats['latency_histogram'][bisect.bisect_left(LATENCY_BUCKETS, timing.elapsed)] += 1
+            stats['rate_limit_sleep'] += timing.throttled
+            stats['retry_sleep'] += timing.backoff
+
+    def get_summary(self):
+        """ Return metrics as a dict, serializable in JSON """
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self.endpoints.items()):
+                endpoints[endpoint] = dict(stats)
+                endpoints[endpoint]['latency_mean'] = stats['latency_total'] / stats['requests']
+                endpoints[endpoint]['latency_histogram'] = collections.OrderedDict(
+                    zip(['<={}'.format(bound) for bound in LATENCY_BUCKETS] + ['>{}'.format(LATENCY_BUCKETS[-1])],
+                        stats['latency_histogram']))
+            totals = {
+                key: sum(stats[key] for stats in self.endpoints.values())
+                for key in ('requests', 'errors', 'retries', 'bytes_sent', 'bytes_received', 'rate_limit_sleep',
+                            'retry_sleep')
+            }
+            return {
+                'phases': dict(self.phases),
+                'values': dict(self.values),
+                'requests': totals,
+                'endpoints': endpoints
+            }
+
+    def write(self, path):
+        """ Write metrics in a JSON file """
+        with open(path, 'w', encoding='UTF-8') as metrics_file:
+            json.dump(self.get_summary(), metrics_file, indent=2)
+
+    def log_summary(self):
+        """ Log duration of phases and totals of requests """
+        summary = self.get_summary()
+        for name, seconds in summary['phases'].items():
+            logging.info('Phase %s: %.3fs', name, seconds)
+        totals = summary['requests']
+        if totals['requests']:
+            logging.info(
+                '%d request(s) to TestRail: %d error(s), %d retry(ies), %d byte(s) sent, %d byte(s) received, '
+                '%.1fs waited for rate limit, %.1fs waited before retries', totals['requests'], totals['errors'],
+                totals['retries'], totals['bytes_sent'], totals['bytes_received'], totals['rate_limit_sleep'],
+                totals['retry_sleep'])
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Long-lived service publishing in TestRail the Robot Framework outputs submitted in a spool directory
+
+Usage::
+
+    python publish_service.py --tr-config=testrail.cfg --spool=/var/spool/testrail
+    python publish_service.py --spool=/var/spool/testrail --submit --tr-run-id=196 output.xml
+
+A job is a JSON file of the spool directory, giving `outputs` (paths or glob patterns of XML outputs, relative
+to the spool directory), `run_id` or `plan_id`, and `version`. It is written atomically by `submit_job`.
+The service claims a job by moving it to `processing/`, parses its outputs in a pool of workers, publishes its
+results, and moves it to `done/` or `failed/`.
+
+Unlike an invocation of `robotframework2testrail.py` per output, the service keeps between jobs its client of
+TestRail API (kept-alive connections, cached metadata of Test Runs and Test Plans) and its parsing processes.
+Jobs for the same Test Run or Test Plan and version, parsed within `flush_interval` seconds, are published
+together: their results are sent in combined `add_results_for_cases` batches.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+
+from robotframework2testrail import (DUPLICATE_POLICIES, LOG_LEVELS, PARSERS, configure_logging, expand_outputs,
+                                     get_api, get_target_runs, get_testcases_from_files, merge_testcases,
+                                     publish_testruns)
+from testrail_cache import MetadataCache
+from testrail_utils import BATCH_SIZE, log_targets_summary
+
+LOG_FILENAME = 'publish_service.log'
+
+JOB_SUFFIX = '.json'
+PROCESSING_DIR = 'processing'
+DONE_DIR = 'done'
+FAILED_DIR = 'failed'
+
+
+def submit_job(spool_dir, outputs, run_id=0, plan_id=0, version=''):
+    """ Submit a job to the service watching a spool directory
+
+    :param spool_dir: Spool directory of the service
+    :param outputs: Paths or glob patterns of Robot Framework outputs
+    :param run_id: TestRail ID of Test Run to update
+    :param plan_id: TestRail ID of Test Plan to update
+    :param version: Version to indicate in Test Case result
+    :return: Path of the job
+    """
+    job = {
+        'outputs': [os.path.abspath(output) for output in outputs],
+        'run_id': run_id or 0,
+        'plan_id': plan_id or 0,
+        'version': version or ''
+    }
+    # Jobs are claimed in the order of their names
+    path = os.path.join(spool_dir, '{}-{}{}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8], JOB_SUFFIX))
+    temp_path = path + '.tmp'    # Ignored by the service until renamed
+    with open(temp_path, 'w', encoding='UTF-8') as job_file:
+        json.dump(job, job_file)
+    os.replace(temp_path, path)
+    return path
+
+
+class PublishService:
+    """ Publish jobs of a spool directory, coalescing results of jobs targeting the same Test Run or Test Plan
+
+        `serve` runs the service until stopped. It is made of `scan` (claim new jobs and parse their outputs),
+        `collect` (queue parsed jobs by target) and `flush` (publish queued jobs whose delay is over).
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, api, spool_dir, parser='stream', parse_workers=1, flush_interval=2.0, duplicates='all',
+                 publish_blocked=True, max_workers=1):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param api: Client to TestRail API, kept for all jobs
+        :param spool_dir: Directory where jobs are submitted
+        :param parser: Engine used to read outputs (see `robotframework2testrail.get_testcases`)
+        :param parse_workers: Number of processes parsing outputs. Outputs are parsed by a thread if 1.
+        :param flush_interval: Delay in seconds between the parsing of a job and its publishing, to publish
+                               together the jobs for the same target
+        :param duplicates: Policy to merge results of a same Test Case (see `robotframework2testrail.merge_testcases`)
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param max_workers: Maximum number of Test Runs of a Test Plan published concurrently
+        """
+        self.api = api
+        self.spool_dir = spool_dir
+        self.parser = parser
+        self.flush_interval = flush_interval
+        self.duplicates = duplicates
+        self.publish_blocked = publish_blocked
+        self.max_workers = max_workers
+        self.published_jobs = 0
+        self.failed_jobs = 0
+        if parse_workers > 1:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._parsing = {}    # Job by future of its parsing
+        self._pending = {}    # Parsed jobs by target (run_id, plan_id, version)
+        self._deadlines = {}    # Time of publishing by target
+
+        for directory in (PROCESSING_DIR, DONE_DIR, FAILED_DIR):
+            os.makedirs(os.path.join(spool_dir, directory), exist_ok=True)
+        # Jobs interrupted by a stop of the service are processed again
+        for name in os.listdir(os.path.join(spool_dir, PROCESSING_DIR)):
+            logging.warning('Job "%s" interrupted: submitted again', name)
+            os.replace(os.path.join(spool_dir, PROCESSING_DIR, name), os.path.join(spool_dir, name))
+
+    def serve(self, stop_event, poll_interval=1.0):
+        """ Process jobs until `stop_event` is set. Jobs claimed are then published, other jobs are left in the
+            spool directory.
+
+        :param stop_event: `threading.Event` stopping the service
+        :param poll_interval: Delay in seconds between two scans of the spool directory
+        """
+        while not stop_event.is_set():
+            self.scan()
+            self.collect()
+            self.flush()
+            stop_event.wait(poll_interval)
+        self.collect(wait=True)
+        self.flush(force=True)
+
+    def scan(self):
+        """ Claim jobs submitted in the spool directory, and parse their outputs in background
+
+        :return: Number of claimed jobs
+        """
+        names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith(JOB_SUFFIX))
+        claimed = 0
+        for name in names:
+            path = os.path.join(self.spool_dir, PROCESSING_DIR, name)
+            try:
+                os.replace(os.path.join(self.spool_dir, name), path)
+            except FileNotFoundError:
+                continue    # Claimed by another service
+            claimed += 1
+            try:
+                job = self._read_job(name, path)
+            except (OSError, ValueError) as error:
+                logging.error('Job "%s" rejected: %s', name, error)
+                self._finish({'name': name}, False)
+                continue
+            logging.info('Job "%s": %d output(s) to parse', name, len(job['outputs']))
+            self._parsing[self._executor.submit(get_testcases_from_files, job['outputs'], self.parser)] = job
+        return claimed
+
+    def collect(self, wait=False):
+        """ Queue the jobs whose outputs are parsed, to be published after `flush_interval`
+
+        :param wait: If True, wait for the parsing of all claimed jobs
+        """
+        if wait:
+            concurrent.futures.wait(self._parsing)
+        for future in [future for future in self._parsing if future.done()]:
+            job = self._parsing.pop(future)
+            try:
+                job['testcases_lists'] = future.result()
+            except Exception as error:    # pylint: disable=broad-except
+                logging.error('Job "%s": outputs can\'t be parsed: %s', job['name'], error)
+                self._finish(job, False)
+                continue
+            if job['target'] not in self._pending:
+                self._pending[job['target']] = []
+                self._deadlines[job['target']] = time.monotonic() + self.flush_interval
+            self._pending[job['target']].append(job)
+
+    def flush(self, force=False):
+        """ Publish the queued jobs whose delay is over, all jobs for the same target at once
+
+        :param force: If True, publish all queued jobs
+        """
+        now = time.monotonic()
+        for target in [target for target, deadline in self._deadlines.items() if force or deadline <= now]:
+            del self._deadlines[target]
+            jobs = sorted(self._pending.pop(target), key=lambda job: job['name'])
+            self._publish(target, jobs)
+
+    def close(self):
+        """ Stop parsing processes and close the client to TestRail API """
+        self._executor.shutdown()
+        if self.api.cache is not None:
+            self.api.cache.log_statistics()
+            self.api.cache.close()
+        self.api.close()
+        logging.info('%d job(s) published, %d job(s) failed', self.published_jobs, self.failed_jobs)
+
+    def _read_job(self, name, path):
+        """ Return a job read from a file
+
+        :raise ValueError: if job is invalid, or if an output is not found
+        """
+        with open(path, encoding='UTF-8') as job_file:
+            content = json.load(job_file)
+        if not isinstance(content, dict) or not content.get('outputs'):
+            raise ValueError('No output')
+        run_id = int(content.get('run_id') or 0)
+        plan_id = int(content.get('plan_id') or 0)
+        if bool(run_id) == bool(plan_id):
+            raise ValueError('A Test Run or a Test Plan ID is expected')
+        return {
+            'name': name,
+            'outputs': expand_outputs([os.path.join(self.spool_dir, output) for output in content['outputs']]),
+            'target': (run_id, plan_id, content.get('version') or '')
+        }
+
+    def _publish(self, target, jobs):
+        """ Publish results of jobs for the same target. Jobs fail if the target is not available, or if results
+            are not published in one of its Test Runs. Errors are logged: they don't stop the service.
+        """
+        run_id, plan_id, version = target
+        testcases = merge_testcases([testcases for job in jobs for testcases in job['testcases_lists']],
+                                    policy=self.duplicates)
+        logging.info('Publish %d result(s) of %d job(s)', len(testcases), len(jobs))
+        try:
+            target_runs = get_target_runs(self.api, [run_id] if run_id else [], [plan_id] if plan_id else [])
+            run_ids = next(iter(target_runs.values())) or []
+            outcomes = publish_testruns(
+                self.api,
+                testcases,
+                run_ids,
+                version=version,
+                publish_blocked=self.publish_blocked,
+                max_workers=self.max_workers)
+            published = log_targets_summary(target_runs, outcomes) and not any(
+                isinstance(outcome, Exception) for outcome in outcomes.values())
+        except Exception:    # pylint: disable=broad-except
+            logging.exception('Error while publishing results')
+            published = False
+        for job in jobs:
+            self._finish(job, published)
+
+    def _finish(self, job, published):
+        """ Move a processed job to `done/` or `failed/` """
+        directory = DONE_DIR if published else FAILED_DIR
+        os.replace(os.path.join(self.spool_dir, PROCESSING_DIR, job['name']),
+                   os.path.join(self.spool_dir, directory, job['name']))
+        if published:
+            self.published_jobs += 1
+        else:
+            self.failed_jobs += 1
+            logging.error('Job "%s" failed: moved to %s/', job['name'], directory)
+
+
+def options():
+    """ Manage options """
+    parser = argparse.ArgumentParser(prog='publish_service.py', description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--spool', metavar='DIR', required=True, help='Spool directory of jobs.')
+    parser.add_argument(
+        '--submit',
+        action='store_true',
+        help='Submit a job publishing the given XML outputs in --tr-run-id or --tr-plan-id, instead of running '
+        'the service.')
+    parser.add_argument('xml_robotfwk_output', nargs='*', help='XML outputs of the job to submit.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--tr-run-id', dest='run_id', metavar='ID', type=int, help='Test Run of the job to submit.')
+    group.add_argument('--tr-plan-id', dest='plan_id', metavar='ID', type=int, help='Test Plan of the job to submit.')
+    parser.add_argument(
+        '--tr-version', dest='version', metavar='VERSION', help='Version to indicate in results of the job to submit.')
+
+    parser.add_argument(
+        '--tr-config',
+        dest='config',
+        metavar='CONFIG',
+        type=argparse.FileType('r', encoding='UTF-8'),
+        help='TestRail configuration file (required to run the service).')
+    parser.add_argument(
+        '--tr-password', dest='password', metavar='API_KEY', help='API key of TestRail account with write access.')
+    parser.add_argument(
+        '--tr-dont-publish-blocked',
+        action='store_true',
+        help='Do not publish results of "blocked" testcases in TestRail.')
+    parser.add_argument(
+        '--parser',
+        choices=PARSERS,
+        default='stream',
+        help='Engine used to read XML outputs (default: %(default)s, see robotframework2testrail.py).')
+    parser.add_argument(
+        '--parse-workers',
+        metavar='N',
+        type=int,
+        default=2,
+        help='Number of processes parsing XML outputs, kept between jobs (default: %(default)s).')
+    parser.add_argument(
+        '--flush-interval',
+        metavar='SECONDS',
+        type=float,
+        default=2.0,
+        help='Delay between the parsing of a job and its publishing: jobs for the same Test Run or Test Plan '
+        'parsed meanwhile are published together (default: %(default)s).')
+    parser.add_argument(
+        '--poll-interval',
+        metavar='SECONDS',
+        type=float,
+        default=1.0,
+        help='Delay between two scans of the spool directory (default: %(default)s).')
+    parser.add_argument(
+        '--duplicates',
+        choices=DUPLICATE_POLICIES,
+        default='all',
+        help='Results to keep when a Test Case ID is found several times in jobs published together '
+        '(default: all, see robotframework2testrail.py).')
+    parser.add_argument(
+        '--tr-max-workers',
+        dest='max_workers',
+        metavar='N',
+        type=int,
+        default=4,
+        help='Maximum number of Test Runs of a Test Plan published concurrently (default: %(default)s).')
+    parser.add_argument(
+        '--tr-batch-size',
+        dest='batch_size',
+        metavar='N',
+        type=int,
+        default=BATCH_SIZE,
+        help='Maximum number of results sent in one request, 0 for no limit (default: %(default)s).')
+    parser.add_argument(
+        '--tr-batch-workers',
+        dest='batch_workers',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Number of batches of results sent concurrently to a Test Run (default: %(default)s).')
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help='Directory where TestRail metadata is also cached between restarts of the service.')
+    parser.add_argument(
+        '--cache-ttl',
+        metavar='SECONDS',
+        type=float,
+        default=300,
+        help='Time to live of cached TestRail metadata (default: %(default)s).')
+    parser.add_argument(
+        '--log-file',
+        metavar='PATH',
+        default=LOG_FILENAME,
+        help='Log file, empty to disable it (default: %(default)s).')
+    parser.add_argument(
+        '--log-level',
+        choices=LOG_LEVELS,
+        default='INFO',
+        help='Level of messages written in the log file (default: %(default)s).')
+
+    opt = parser.parse_args()
+    if opt.submit and not (opt.xml_robotfwk_output and (opt.run_id or opt.plan_id)):
+        parser.error('--submit requires XML outputs, and --tr-run-id or --tr-plan-id')
+    if not opt.submit and (opt.xml_robotfwk_output or not opt.config):
+        parser.error('the service requires --tr-config, and no XML output (see --submit)')
+    return opt
+
+
+if __name__ == '__main__':
+    ARGUMENTS = options()
+
+    if ARGUMENTS.submit:
+        print(submit_job(ARGUMENTS.spool, ARGUMENTS.xml_robotfwk_output, ARGUMENTS.run_id, ARGUMENTS.plan_id,
+                         ARGUMENTS.version))
+        sys.exit()
+
+    configure_logging(ARGUMENTS.log_file, ARGUMENTS.log_level)
+    POOL_SIZE = max(4, ARGUMENTS.max_workers * ARGUMENTS.batch_workers)
+    API = get_api(ARGUMENTS.config, ARGUMENTS.password, pool_size=POOL_SIZE)
+    API.batch_size = ARGUMENTS.batch_size
+    API.batch_workers = ARGUMENTS.batch_workers
+    API.cache = MetadataCache(ARGUMENTS.cache_dir, ARGUMENTS.cache_ttl)
+    SERVICE = PublishService(
+        API,
+        ARGUMENTS.spool,
+        parser=ARGUMENTS.parser,
+        parse_workers=ARGUMENTS.parse_workers,
+        flush_interval=ARGUMENTS.flush_interval,
+        duplicates=ARGUMENTS.duplicates,
+        publish_blocked=not ARGUMENTS.tr_dont_publish_blocked,
+        max_workers=ARGUMENTS.max_workers)
+
+    # Stop on SIGTERM or Ctrl+C, after publishing claimed jobs
+    STOP = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: STOP.set())
+    signal.signal(signal.SIGINT, lambda *_: STOP.set())
+    logging.info('Watching spool directory "%s"', ARGUMENTS.spool)
+    try:
+        SERVICE.serve(STOP, ARGUMENTS.poll_interval)
+    finally:
+        SERVICE.close()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Compact record of the result of a test """
+import collections.abc
+
+from testrail_utils import TestRailApiUtils
+
+
+class ResultRecord(collections.abc.MutableMapping):
+    """ Result of a test, as returned by `get_testcases`
+
+        A record behaves as a dict with keys `id`, `status`, `name`, `comment` and `duration` (and `suite` for
+        results without Test Case ID, see `case_resolver`), but is stored in slots: for large outputs, it takes
+        less than half the memory of a dict. The Test Case ID is parsed once, as an int in `case_id`
+        (`None` if bad formatted). Paths of files to attach to the result in TestRail (e.g. screenshots of a failed
+        test) are in `attachments`, which is not a key.
+    """
+    # One slot per field of a result: grouping them would cost the memory slots save
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ('_id', 'case_id', 'status', 'name', 'comment', 'duration', 'suite', 'attachments')
+    KEYS = ('id', 'status', 'name', 'comment', 'duration')
+
+    def __init__(self, testcase_id, status, name, comment=None, duration=0, suite=None):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param testcase_id: Test Case ID, as found in output (e.g. 'C1234'). `None` if not found.
+        :param status: Status of the test in Robot Framework
+        :param name: Name of the test (or of its suite)
+        :param comment: Comment of the result
+        :param duration: Duration of the test, in seconds
+        :param suite: Name of the suite of a test without Test Case ID
+        """
+        self.id = testcase_id
+        self.status = status
+        self.name = name
+        self.comment = comment
+        self.duration = duration
+        self.suite = suite
+        self.attachments = ()
+
+    @property
+    def id(self):    # pylint: disable=invalid-name
+        """ Test Case ID, as found in output """
+        return self._id
+
+    @id.setter
+    def id(self, testcase_id):    # pylint: disable=invalid-name
+        self._id = testcase_id
+        self.case_id = TestRailApiUtils.extract_testcase_id(str(testcase_id)) if testcase_id else None
+
+    def __getitem__(self, key):
+        if key in self.KEYS or (key == 'suite' and self.suite is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS and key != 'suite':
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key != 'suite' or self.suite is None:
+            raise KeyError(key)
+        self.suite = None
+
+    def __iter__(self):
+        yield from self.KEYS
+        if self.suite is not None:
+            yield 'suite'
+
+    def __len__(self):
+        return len(self.KEYS) + (self.suite is not None)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self))
+
+    def __getstate__(self):
+        return (self._id, self.case_id, self.status, self.name, self.comment, self.duration, self.suite,
+                self.attachments)
+
+    def __setstate__(self, state):
+        (self._id, self.case_id, self.status, self.name, self.comment, self.duration, self.suite,
+         self.attachments) = state
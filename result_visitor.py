@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Extraction of TestRail results from Robot Framework suites
+
+    `TestRailResultVisitor` is created on first access (PEP 562): importing this module doesn't import Robot Framework,
+    only visiting a result model does.
+"""
+import datetime
+import html
+import logging
+import os
+import re
+import urllib.parse
+
+from result_record import ResultRecord
+
+COMMENT_SIZE_LIMIT = 1000
+
+ROBOT_TIMESTAMP_FORMAT = '%Y%m%d %H:%M:%S.%f'
+
+# Files referenced by HTML messages (e.g. `<img src="selenium-screenshot-1.png">` logged by SeleniumLibrary)
+ATTACHMENT_PATTERN = re.compile(r'<(?:img|a)\s[^>]*?(?:src|href)="([^"]+)"', re.IGNORECASE)
+
+# Log of Robot Framework, attached to failed tests when it is next to the output
+LOG_HTML = 'log.html'
+
+# Limits of the trace of failed keywords added to comments (see `format_trace`)
+TRACE_MAX_KEYWORDS = 10
+TRACE_LINE_LIMIT = 200
+
+
+def get_test_case_id_from_metadata(metadata):
+    """ Retrieve test_case_id from metadata of a suite. 0 if not found. """
+    for key in metadata:
+        if key == 'TEST_CASE_ID':
+            return metadata['TEST_CASE_ID']    # We only take the first ID found
+    return 0
+
+
+def get_test_case_ids_from_tags(tags):
+    """ Retrieve all test case tags found in the list """
+    test_case_list = []
+    for tag in tags:
+        if re.findall("(test_case_id=[C]?[0-9]+)", tag):
+            test_case_list.append(tag[len('test_case_id='):])
+    return test_case_list
+
+
+def get_test_case_ids_from_test(suite_name, suite_testcase_id, test, keep_unidentified=False):
+    """ Retrieve list of Test Case ID of a test: from its tags, or else from metadata of its suite
+
+        :param suite_name: Name of the suite of the test
+        :param suite_testcase_id: Test Case ID found in metadata of the suite (0 if none)
+        :param test: Test from Robot Framework result
+        :param keep_unidentified: If True, a test without Test Case ID is returned with `None` as ID
+        :return: List of tuples (name, test, test_case_id)
+    """
+    result = []
+    test_case_ids_from_tags = get_test_case_ids_from_tags(test.tags)
+    if test_case_ids_from_tags:
+        for tcid in test_case_ids_from_tags:
+            result.append((test.name, test, tcid))
+            logging.debug("Use TestRail ID from tag: ID = %s", tcid)
+    else:
+        if suite_testcase_id:
+            result.append((suite_name, test, suite_testcase_id))
+            logging.debug("Use TestRail ID from metadata: ID = %s", suite_testcase_id)
+        elif keep_unidentified:
+            result.append((test.name, test, None))
+    return result
+
+
+def get_test_case_ids_from_suite(suite, keep_unidentified=False):
+    """ Retrieve list of Test Case ID from a suite
+        Manage both case: ID in metadata or in tags.
+
+        :return: List of tuples (name, test, test_case_id), see `get_test_case_ids_from_test`
+    """
+    testcase_id = get_test_case_id_from_metadata(suite.metadata)
+    result = []
+    for test in suite.tests:
+        result.extend(get_test_case_ids_from_test(suite.name, testcase_id, test, keep_unidentified))
+    return result
+
+
+def get_testrail_result(name, test, testcase_id):
+    """ Return a result in TestRail format """
+    comment = None
+    if test.message:
+        comment = test.message
+        # Indent text to avoid string formatting by TestRail. Limit size of comment.
+        comment = "# Robot Framework result: #\n    " + comment[:COMMENT_SIZE_LIMIT].replace('\n', '\n    ')
+        comment += '\n...\nLog truncated' if len(str(comment)) > COMMENT_SIZE_LIMIT else ''
+    duration = 0
+    if test.starttime and test.endtime:
+        td_duration = datetime.datetime.strptime(test.endtime + '000', ROBOT_TIMESTAMP_FORMAT)\
+                    - datetime.datetime.strptime(test.starttime + '000', ROBOT_TIMESTAMP_FORMAT)
+        duration = round(td_duration.total_seconds())
+        duration = 1 if (duration < 1) else duration    # TestRail API doesn't manage msec (min value=1s)
+    trace = getattr(test, 'trace', None)    # Only set by `iter_testcases` with `failure_trace`
+    if trace:
+        comment = (comment + '\n' if comment else '') + '# Failed keywords: #\n    ' + trace.replace('\n', '\n    ')
+    return ResultRecord(testcase_id, test.status, name, comment, duration)
+
+
+def format_trace(keywords):
+    """ Return the trace of failed keywords of a test, one keyword per line, indented by depth.
+        Only the first `TRACE_MAX_KEYWORDS` - 1 and the innermost keywords are kept.
+
+    :param keywords: List of tuples (name, arguments) of failed keywords, from the outermost one
+    """
+    if len(keywords) > TRACE_MAX_KEYWORDS:
+        keywords = keywords[:TRACE_MAX_KEYWORDS - 2] + [('...', [])] + keywords[-1:]
+    lines = []
+    for depth, (name, arguments) in enumerate(keywords):
+        line = '  ' * depth + '    '.join([name] + arguments)
+        lines.append(line[:TRACE_LINE_LIMIT - 3] + '...' if len(line) > TRACE_LINE_LIMIT else line)
+    return '\n'.join(lines)
+
+
+def get_attachments(html_messages, directory):
+    """ Return paths of the files to attach to the result of a failed test: local files referenced by its
+        HTML messages (e.g. screenshots), then the log of Robot Framework if it is in `directory`
+
+    :param html_messages: HTML messages logged by the test
+    :param directory: Directory of the output, relative paths being relative to it
+    """
+    paths = []
+    for message in html_messages:
+        for reference in ATTACHMENT_PATTERN.findall(message):
+            reference = urllib.parse.unquote(html.unescape(reference))
+            if reference.startswith('#') or len(urllib.parse.urlsplit(reference).scheme) > 1:
+                continue    # Anchor, embedded data or URL
+            path = os.path.normpath(os.path.join(directory, reference))
+            if path not in paths:
+                paths.append(path)
+    log_path = os.path.join(directory, LOG_HTML)
+    if os.path.isfile(log_path):
+        paths.append(log_path)
+    return paths
+
+
+class TestRailResultCollector:
+    """ Retrieve TestRail ID and result of tests of Robot Framework suites
+
+        Suites are given to `end_suite`, by `TestRailResultVisitor` visiting a Robot Framework result, or by
+        `robotframework2testrail.iter_testcases` reading an output incrementally. Only attributes of suites
+        and tests are used: Robot Framework is not imported.
+    """
+
+    def __init__(self, keep_unidentified=False, attachments_dir=None):
+        """ Init
+
+        :param keep_unidentified: If True, results of tests without Test Case ID are kept, with `None` as ID
+                                  and the name of their suite as `suite` (see `case_resolver.CaseResolver`)
+        :param attachments_dir: If set, files referenced by HTML messages of failed tests are attached to their
+                                results (see `get_attachments`), relative paths being relative to this directory
+                                (the directory of the output)
+        """
+        self.result_testcase_list = []
+        self.keep_unidentified = keep_unidentified
+        self.attachments_dir = attachments_dir
+        # Attachments of failed tests by test ID, set by `TestRailResultVisitor`
+        self.attachments = {}
+
+    def end_suite(self, suite):
+        """ Called when suite end """
+        for _suite, test, test_case_id in get_test_case_ids_from_suite(suite, self.keep_unidentified):
+            self._append_testrail_result(_suite, test, test_case_id)
+            if test_case_id is None:
+                self.result_testcase_list[-1]['suite'] = suite.name
+            self.result_testcase_list[-1].attachments = self.attachments.get(test.id, ())
+
+    def _append_testrail_result(self, name, test, testcase_id):
+        """ Append a result in TestRail format """
+        self.result_testcase_list.append(get_testrail_result(name, test, testcase_id))
+
+
+def __getattr__(name):
+    """ Create `TestRailResultVisitor` on first access, importing Robot Framework """
+    if name != 'TestRailResultVisitor':
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    from robot.api import ResultVisitor    # pylint: disable=import-outside-toplevel
+
+    class TestRailResultVisitor(TestRailResultCollector, ResultVisitor):
+        """ Implement a `Visitor` that retrieves TestRail ID from Robot Framework Result
+
+            To find attachments, the result must be read with keywords (`include_keywords=True`).
+        """
+        _html_messages = None
+
+        def start_test(self, test):
+            """ Called when test starts """
+            if self.attachments_dir is not None:
+                self._html_messages = []
+
+        def start_message(self, msg):
+            """ Called for each message logged by keywords """
+            if self._html_messages is not None and msg.html:
+                self._html_messages.append(msg.message)
+
+        def end_test(self, test):
+            """ Called when test ends """
+            if self._html_messages is not None and test.status == 'FAIL':
+                self.attachments[test.id] = get_attachments(self._html_messages, self.attachments_dir)
+            self._html_messages = None
+
+    TestRailResultVisitor.__qualname__ = name
+    globals()[name] = TestRailResultVisitor
+    return TestRailResultVisitor
@@ -2,113 +2,338 @@
 # -*- coding: UTF-8 -*-
 """ Tool to publish Robot Framework results in TestRail """
 import argparse
+import atexit
+import collections
+import concurrent.futures
 import configparser
 import datetime
+import functools
+import glob
+import itertools
 import logging
 import os
-import re
 import sys
 import time
+from xml.etree import ElementTree
 
+import result_visitor
 import testrail
-from colorama import Fore, Style, init
-from robot.api import ExecutionResult, ResultVisitor
-from testrail_utils import TestRailApiUtils
+import testrail_http
+from case_resolver import INDEX_FILENAME, INDEX_TTL, CaseResolver
+from publish_journal import JOURNAL_FILENAME, PublishJournal
+from parse_cache import ParseCache
+from publish_metrics import PublishMetrics
+from result_visitor import (LOG_HTML, ROBOT_TIMESTAMP_FORMAT, TRACE_LINE_LIMIT, format_trace, get_attachments,
+                            get_test_case_ids_from_suite, get_testrail_result)
+from testrail_cache import MetadataCache
+from testrail_utils import (ATTACHMENT_MAX_BYTES, BATCH_MAX_BYTES, BATCH_SIZE, RunIndex, TestRailApiUtils,
+                            get_case_id, log_targets_summary)
 
 # pylint: disable=logging-format-interpolation
 
 PATH = os.getcwd()
 
-COMMENT_SIZE_LIMIT = 1000
+PARSERS = ('visitor', 'stream')
+
+# Policies to merge results of a same Test Case found in several outputs (see `merge_testcases`)
+DUPLICATE_POLICIES = ('all', 'first', 'last', 'worst')
 
-# Configure the logging
 LOG_FORMAT = '%(asctime)-15s %(levelname)-10s %(message)s'
-logging.basicConfig(filename=os.path.join(PATH, 'robotframework2testrail.log'), format=LOG_FORMAT, level=logging.DEBUG)
-CONSOLE_HANDLER = logging.StreamHandler()
-CONSOLE_HANDLER.setLevel(logging.INFO)
-CONSOLE_HANDLER.setFormatter(logging.Formatter('%(message)s'))
-logging.getLogger().addHandler(CONSOLE_HANDLER)
-
-
-class TestRailResultVisitor(ResultVisitor):
-    """ Implement a `Visitor` that retrieves TestRail ID from Robot Framework Result """
-
-    def __init__(self):
-        """ Init """
-        self.result_testcase_list = []
-
-    def end_suite(self, suite):
-        """ Called when suite end """
-        for _suite, test, test_case_id in self._get_test_case_id_from_suite(suite):
-            self._append_testrail_result(_suite, test, test_case_id)
-
-    @staticmethod
-    def _get_test_case_id_from_suite(suite):
-        """ Retrieve list of Test Case ID from a suite
-            Manage both case: ID in metadata or in tags.
-        """
-        testcase_id = 0
-        result = []
-        # Retrieve test_case_id from metadata
-        for metadata in suite.metadata:
-            if metadata == 'TEST_CASE_ID':
-                testcase_id = suite.metadata['TEST_CASE_ID']
-                break    # We only take the first ID found
-        # Retrieve test_case_ids from tags
-        for test in suite.tests:
-            test_case_ids_from_tags = TestRailResultVisitor._get_test_case_ids_from_tags(test.tags)
-            if test_case_ids_from_tags:
-                for tcid in test_case_ids_from_tags:
-                    result.append((test.name, test, tcid))
-                    logging.debug("Use TestRail ID from tag: ID = %s", tcid)
-            else:
-                if testcase_id:
-                    result.append((suite.name, test, testcase_id))
-                    logging.debug("Use TestRail ID from metadata: ID = %s", testcase_id)
-        return result
-
-    @staticmethod
-    def _get_test_case_ids_from_tags(tags):
-        """ Retrieve all test case tags found in the list """
-        test_case_list = []
-        for tag in tags:
-            if re.findall("(test_case_id=[C]?[0-9]+)", tag):
-                test_case_list.append(tag[len('test_case_id='):])
-        return test_case_list
-
-    def _append_testrail_result(self, name, test, testcase_id):
-        """ Append a result in TestRail format """
-        comment = None
-        if test.message:
-            comment = test.message
-            # Indent text to avoid string formatting by TestRail. Limit size of comment.
-            comment = "# Robot Framework result: #\n    " + comment[:COMMENT_SIZE_LIMIT].replace('\n', '\n    ')
-            comment += '\n...\nLog truncated' if len(str(comment)) > COMMENT_SIZE_LIMIT else ''
-        duration = 0
-        if test.starttime and test.endtime:
-            td_duration = datetime.datetime.strptime(test.endtime + '000', '%Y%m%d %H:%M:%S.%f')\
-                        - datetime.datetime.strptime(test.starttime + '000', '%Y%m%d %H:%M:%S.%f')
-            duration = round(td_duration.total_seconds())
-            duration = 1 if (duration < 1) else duration    # TestRail API doesn't manage msec (min value=1s)
-        self.result_testcase_list.append({
-            'id': testcase_id,
-            'status': test.status,
-            'name': name,
-            'comment': comment,
-            'duration': duration
-        })
-
-
-def get_testcases(xml_robotfwk_output):
-    """ Return the list of Testcase ID with status """
-    result = ExecutionResult(xml_robotfwk_output, include_keywords=False)
-    visitor = TestRailResultVisitor()
+LOG_FILENAME = 'robotframework2testrail.log'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+
+def __getattr__(name):
+    """ Give access to `TestRailResultVisitor`, created on first access to avoid importing Robot Framework """
+    if name == 'TestRailResultVisitor':
+        return result_visitor.TestRailResultVisitor
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def configure_logging(log_file=LOG_FILENAME, log_level='DEBUG'):
+    """ Configure the logging of the command line: messages in a file, and info messages in the console.
+        Not done at import, so that importing this module as a library doesn't write any file.
+
+        :param log_file: Path of the log file. No log file if empty.
+        :param log_level: Level of messages written in the log file
+    """
+    root_logger = logging.getLogger()
+    root_logger.setLevel(min(logging.INFO, getattr(logging, log_level)))
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(log_level)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root_logger.addHandler(file_handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+    root_logger.addHandler(console_handler)
+
+
+class _StreamedSuite:
+    """ Minimal suite built by `iter_testcases`, exposing what `TestRailResultVisitor` needs """
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('name', 'metadata', 'tests')
+
+    def __init__(self, name):
+        self.name = name
+        self.metadata = {}
+        self.tests = []
+
+
+_StreamedTest = collections.namedtuple('_StreamedTest', 'name tags status message starttime endtime attachments trace')
+
+
+def _normalize_tag(tag):
+    """ Normalize a tag like Robot Framework does (case, spaces and underscores are ignored) """
+    return ''.join(tag.split()).casefold().replace('_', '')
+
+
+def _sort_tags(tags):
+    """ Remove duplicated tags and sort them like Robot Framework `Tags` """
+    normalized_tags = {}
+    for tag in tags:
+        normalized_tags.setdefault(_normalize_tag(tag), tag)
+    normalized_tags.pop('', None)
+    normalized_tags.pop('none', None)
+    return [normalized_tags[key] for key in sorted(normalized_tags)]
+
+
+def _get_test_times(status):
+    """ Return start and end times of a test from its `status` element, in Robot Framework 3 format.
+        Manage both formats: `starttime`/`endtime` (RF < 7) and `start`/`elapsed` (RF >= 7).
+    """
+    if 'start' in status.attrib:
+        start = datetime.datetime.fromisoformat(status.get('start'))
+        end = start + datetime.timedelta(seconds=float(status.get('elapsed', 0)))
+        return start.strftime(ROBOT_TIMESTAMP_FORMAT)[:-3], end.strftime(ROBOT_TIMESTAMP_FORMAT)[:-3]
+    starttime = status.get('starttime')
+    endtime = status.get('endtime')
+    return (None if starttime in (None, 'N/A') else starttime), (None if endtime in (None, 'N/A') else endtime)
+
+
+def _new_streamed_keyword(elem):
+    """ Return the record of a keyword being executed, built from its `kw` element, for `failure_trace` """
+    library = elem.get('owner', elem.get('library'))
+    return {
+        'name': library + '.' + elem.get('name') if library else elem.get('name'),
+        'args': [],
+        'status': None,
+        'failed_keywords': None
+    }
+
+
+def _end_streamed_keyword(keywords, test):
+    """ Pop the keyword that ends from `keywords`. If it failed, it is recorded as the failed keyword of its
+        parent keyword, or else of `test`, with its own failed keywords.
+    """
+    keyword = keywords.pop()
+    if keyword['status'] == 'FAIL':
+        # The first failed keyword is the one that made its parent fail
+        owner = keywords[-1] if keywords else test
+        if owner['failed_keywords'] is None:
+            owner['failed_keywords'] = [(keyword['name'], keyword['args'])] + (keyword['failed_keywords'] or [])
+
+
+def _get_streamed_test(test, attachments, directory):
+    """ Return the `_StreamedTest` of a test record of `iter_testcases` once its element is parsed
+
+        :param test: Record of the test: name, tags, status, message, times, HTML messages and failed keywords
+        :param attachments: If True, files to attach to the result of a failed test are set
+        :param directory: Directory of the output
+    """
+    test_attachments = ()
+    if attachments and test['status'] == 'FAIL':
+        test_attachments = get_attachments(test['html'], directory)
+    trace = None
+    if test['status'] == 'FAIL' and test['failed_keywords']:
+        trace = format_trace(test['failed_keywords'])
+    return _StreamedTest(test['name'], _sort_tags(test['tags']), test['status'], test['message'], *test['times'],
+                         test_attachments, trace)
+
+
+def _iter_suite_testcases(suite, keep_unidentified):
+    """ Yield results of tests of a `_StreamedSuite`, like `TestRailResultCollector.end_suite` """
+    for name, test, testcase_id in get_test_case_ids_from_suite(suite, keep_unidentified):
+        testcase = get_testrail_result(name, test, testcase_id)
+        if testcase_id is None:
+            testcase['suite'] = suite.name
+        testcase.attachments = test.attachments
+        yield testcase
+
+
+def iter_testcases(xml_robotfwk_output, keep_unidentified=False, attachments=False, failure_trace=False):
+    """ Yield Testcase ID with status, parsing Robot Framework output incrementally
+
+        Unlike `get_testcases`, the Robot Framework result model is never built: each XML element is
+        dropped as soon as it is parsed, so memory depends on the depth of suites, not on the size of the file.
+        Results are the same as the ones returned by `get_testcases`, in the same order.
+
+        :param xml_robotfwk_output: Path to Robot Framework output
+        :param keep_unidentified: If True, results of tests without Test Case ID are also yielded
+                                  (see `TestRailResultVisitor`)
+        :param attachments: If True, files to attach to results of failed tests are set in their `attachments`
+        :param failure_trace: If True, the chain of failed keywords of failed tests is added to their comment.
+                              Only names and arguments of keywords being executed are kept while parsing, and
+                              only failed ones are kept once executed: memory stays the one of parsing without it.
+    """
+    # pylint: disable=too-many-branches, too-many-statements
+    directory = os.path.dirname(os.path.abspath(xml_robotfwk_output))
+    elements = []
+    suites = []
+    keywords = []    # Keywords of the current test being executed, with `failure_trace`
+    test = None
+    for event, elem in ElementTree.iterparse(xml_robotfwk_output, events=('start', 'end')):
+        if event == 'start':
+            elements.append(elem)
+            if elem.tag == 'suite':
+                suites.append(_StreamedSuite(elem.get('name')))
+            elif elem.tag == 'test':
+                test = {
+                    'name': elem.get('name'),
+                    'tags': [],
+                    'status': None,
+                    'message': '',
+                    'times': (None, None),
+                    'html': [],
+                    'failed_keywords': None
+                }
+            elif elem.tag == 'kw' and failure_trace and test is not None:
+                keywords.append(_new_streamed_keyword(elem))
+            continue
+
+        elements.pop()
+        parent = elements[-1].tag if elements else None
+        grandparent = elements[-2].tag if len(elements) > 1 else None
+        if elem.tag == 'suite':
+            yield from _iter_suite_testcases(suites.pop(), keep_unidentified)
+        elif elem.tag == 'test':
+            suites[-1].tests.append(_get_streamed_test(test, attachments, directory))
+            test = None
+        elif elem.tag == 'kw' and keywords:
+            _end_streamed_keyword(keywords, test)
+        elif elem.tag == 'status' and parent == 'kw' and keywords:
+            keywords[-1]['status'] = elem.get('status')
+        elif elem.tag == 'arg' and keywords and (parent == 'kw' or (parent == 'arguments' and grandparent == 'kw')):
+            keywords[-1]['args'].append((elem.text or '')[:TRACE_LINE_LIMIT])
+        elif elem.tag == 'status' and parent == 'test':
+            test['status'] = elem.get('status')
+            test['message'] = elem.text or ''
+            test['times'] = _get_test_times(elem)
+        elif elem.tag == 'msg' and attachments and test is not None and elem.get('html') in ('true', 'yes'):
+            test['html'].append(elem.text or '')
+        elif elem.tag == 'tag' and (parent == 'test' or (parent == 'tags' and grandparent == 'test')):
+            test['tags'].append(elem.text or '')
+        elif (elem.tag == 'item' and parent == 'metadata' and grandparent == 'suite') or \
+                (elem.tag == 'meta' and parent == 'suite'):
+            suites[-1].metadata[elem.get('name')] = elem.text or ''
+
+        # Element is fully processed: release it
+        if elements:
+            elements[-1].remove(elem)
+
+
+def get_testcases(xml_robotfwk_output, parser='visitor', keep_unidentified=False, attachments=False,
+                  failure_trace=False):
+    """ Return the list of Testcase ID with status
+
+        :param xml_robotfwk_output: Path to Robot Framework output
+        :param parser: 'visitor' to visit Robot Framework result model, 'stream' to use `iter_testcases`
+        :param keep_unidentified: If True, results of tests without Test Case ID are also returned
+                                  (see `TestRailResultVisitor`)
+        :param attachments: If True, files to attach to results of failed tests (screenshots, log.html) are set
+                            in their `attachments`. Keywords are then read by the 'visitor' parser.
+        :param failure_trace: If True, failed keywords of failed tests are added to their comment. Output is then
+                              always read by `iter_testcases`, to avoid loading keywords of all tests.
+    """
+    if parser == 'stream' or failure_trace:
+        return list(iter_testcases(xml_robotfwk_output, keep_unidentified, attachments, failure_trace))
+    from robot.api import ExecutionResult    # pylint: disable=import-outside-toplevel
+    result = ExecutionResult(xml_robotfwk_output, include_keywords=attachments)
+    visitor = result_visitor.TestRailResultVisitor(
+        keep_unidentified, os.path.dirname(os.path.abspath(xml_robotfwk_output)) if attachments else None)
     result.visit(visitor)
     return visitor.result_testcase_list
 
 
-def publish_results(api, testcases, run_id=0, plan_id=0, version='', publish_blocked=True):
-    # pylint: disable=too-many-arguments, too-many-branches
+def expand_outputs(patterns):
+    """ Return the list of Robot Framework outputs matching paths or glob patterns
+
+        :param patterns: List of paths or glob patterns (e.g. 'results/**/output*.xml')
+        :raise ValueError: if a pattern doesn't match any file
+    """
+    outputs = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            raise ValueError('No XML output found for "{}"'.format(pattern))
+        outputs.extend(match for match in matches if match not in outputs)
+    return outputs
+
+
+def get_testcases_from_files(xml_robotfwk_outputs, parser='visitor', max_workers=1, keep_unidentified=False,
+                             cache=None, **options):
+    # pylint: disable=too-many-arguments
+    """ Return the list of Testcase ID with status of each Robot Framework output
+
+        :param xml_robotfwk_outputs: List of paths to Robot Framework outputs
+        :param parser: Engine used to read outputs (see `get_testcases`)
+        :param max_workers: Number of processes parsing outputs in parallel
+        :param keep_unidentified: If True, results of tests without Test Case ID are also returned
+        :param cache: `parse_cache.ParseCache` of testcases of outputs. Only outputs not cached are parsed.
+        :param options: Other options of `get_testcases` (`attachments`, `failure_trace`)
+        :return: List of list of testcases, in the order of `xml_robotfwk_outputs`
+    """
+    testcases_lists = [
+        cache.get(output, parser, keep_unidentified, **options) if cache else None for output in xml_robotfwk_outputs
+    ]
+    outputs = [output for output, testcases in zip(xml_robotfwk_outputs, testcases_lists) if testcases is None]
+    parse = functools.partial(get_testcases, parser=parser, keep_unidentified=keep_unidentified, **options)
+    if max_workers > 1 and len(outputs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(parse, outputs))
+    else:
+        parsed = [parse(output) for output in outputs]
+    parsed = iter(parsed)
+    for index, output in enumerate(xml_robotfwk_outputs):
+        if testcases_lists[index] is None:
+            testcases_lists[index] = next(parsed)
+            if cache:
+                cache.set(output, parser, keep_unidentified, testcases_lists[index], **options)
+    return testcases_lists
+
+
+def merge_testcases(testcases_lists, policy='all'):
+    """ Merge lists of testcases, managing results of the same Test Case ID found several times
+
+        :param testcases_lists: List of list of testcases, returned by `get_testcases`
+        :param policy: 'all' to keep all results, 'first' or 'last' to keep first or last result found,
+                       'worst' to keep the first failed result if any, else the first result
+        :return: List of testcases
+    """
+    testcases = itertools.chain.from_iterable(testcases_lists)
+    if policy == 'all':
+        return list(testcases)
+
+    merged = {}
+    for testcase in testcases:
+        key = get_case_id(testcase)
+        if key is None:
+            key = testcase['id']
+        if key not in merged:
+            merged[key] = testcase
+        elif policy == 'last' or (policy == 'worst' and merged[key]['status'] != 'FAIL' and
+                                  testcase['status'] == 'FAIL'):
+            merged[key] = testcase
+    return list(merged.values())
+
+
+def publish_results(api, testcases, run_id=0, plan_id=0, version='', publish_blocked=True, max_workers=1,
+                    journal=None, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
     """ Update testcases with provided Test Run or Test Plan
 
         :param api: Client to TestRail API
@@ -117,59 +342,289 @@ def publish_results(api, testcases, run_id=0, plan_id=0, version='', publish_blo
         :param plan_id: TestRail ID of Test Plan to update
         :param version: Version to indicate in Test Case result
         :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param max_workers: Maximum number of Test Runs of a Test Plan published concurrently
+        :param journal: `publish_journal.PublishJournal` of the session. Completed Test Runs are skipped.
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
         :return: True if publishing was done. False in case of error.
     """
     if run_id:
         if api.is_testrun_available(run_id):
-            count = 0
             logging.info('Publish in Test Run #%d', run_id)
-            testcases_in_testrun_list = api.get_tests(run_id)
-
-            # Filter tests present in Test Run
-            case_id_in_testrun_list = [str(tc['case_id']) for tc in testcases_in_testrun_list]
-            testcases = [
-                testcase for testcase in testcases if testcase['id'].replace('C', '') in case_id_in_testrun_list
-            ]
-
-            # Filter "blocked" tests
-            if publish_blocked is False:
-                logging.info('Option "Don\'t publish blocked testcases" activated')
-                blocked_tests_list = [
-                    test.get('case_id') for test in testcases_in_testrun_list if test.get('status_id') == 2
-                ]
-                logging.info('Blocked testcases excluded: %s', ', '.join(str(elt) for elt in blocked_tests_list))
-                testcases = [
-                    testcase for testcase in testcases
-                    if api.extract_testcase_id(testcase.get('id')) not in blocked_tests_list
-                ]
             try:
-                result = api.add_results(run_id, version, testcases)
-                logging.info('%d result(s) published in Test Run #%d.', len(result), run_id)
+                _publish_testrun(api, testcases, run_id, version, publish_blocked, journal, skip_unchanged)
             except testrail.APIError:
                 logging.exception('Error while publishing results')
         else:
-            logging.error('Test Run #%d is is not available', run_id)
+            logging.error('Test Run #%d is not available', run_id)
             return False
 
     elif plan_id:
         if api.is_testplan_available(plan_id):
             logging.info('Publish in Test Plan #%d', plan_id)
-            for _run_id in api.get_available_testruns(plan_id):
-                publish_results(api, testcases, run_id=_run_id, version=version, publish_blocked=publish_blocked)
+            publish_testplan(api, testcases, plan_id, version, publish_blocked, max_workers, journal, skip_unchanged)
         else:
-            logging.error('Test Plan #%d is is not available', plan_id)
+            logging.error('Test Plan #%d is not available', plan_id)
             return False
 
     else:
         logging.error("You have to indicate a Test Run or a Test Plan ID")
+        from colorama import Fore    # pylint: disable=import-outside-toplevel
         print(Fore.LIGHTRED_EX + 'ERROR')
         return False
 
     return True
 
 
+def publish_testplan(api, testcases, plan_id, version='', publish_blocked=True, max_workers=1, journal=None,
+                     skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in all available Test Runs of a Test Plan, several Test Runs being published concurrently
+
+        :param api: Client to TestRail API
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param plan_id: TestRail ID of Test Plan to update
+        :param version: Version to indicate in Test Case result
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param max_workers: Maximum number of Test Runs published concurrently
+        :param journal: `publish_journal.PublishJournal` of the session. Completed Test Runs are skipped.
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
+        :return: Dict giving for each Test Run ID the number of published results,
+                 `None` if Test Run is not available, or the error raised while publishing.
+    """
+    run_ids = api.get_available_testruns(plan_id)
+    outcomes = publish_testruns(api, testcases, run_ids, version, publish_blocked, max_workers, journal,
+                                skip_unchanged)
+    log_targets_summary({'Test Plan #%d' % plan_id: run_ids}, outcomes)
+    return outcomes
+
+
+def publish_targets(api, testcases, run_ids=(), plan_ids=(), version='', publish_blocked=True, max_workers=1,
+                    journal=None, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in several Test Runs and Test Plans, with the same client and its cached metadata
+
+        Test Runs of all targets are published concurrently. A Test Run reached through several targets (e.g. given
+        with `run_ids` and part of a Test Plan of `plan_ids`) is published once.
+
+        :param api: Client to TestRail API
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param run_ids: TestRail IDs of Test Runs to update
+        :param plan_ids: TestRail IDs of Test Plans to update
+        :param version: Version to indicate in Test Case result
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param max_workers: Maximum number of Test Runs published concurrently
+        :param journal: `publish_journal.PublishJournal` of the session. Completed Test Runs are skipped.
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
+        :return: True if all targets are available. False otherwise.
+    """
+    target_runs = get_target_runs(api, run_ids, plan_ids)
+    unique_run_ids = list(dict.fromkeys(run_id for ids in target_runs.values() if ids for run_id in ids))
+    logging.info('Publish in %d Test Run(s) of %d target(s)', len(unique_run_ids), len(target_runs))
+    outcomes = publish_testruns(api, testcases, unique_run_ids, version, publish_blocked, max_workers, journal,
+                                skip_unchanged)
+    return log_targets_summary(target_runs, outcomes)
+
+
+def get_target_runs(api, run_ids=(), plan_ids=()):
+    """ Return the available Test Runs of targets to publish in
+
+        :param api: Client to TestRail API
+        :param run_ids: TestRail IDs of Test Runs
+        :param plan_ids: TestRail IDs of Test Plans
+        :return: Dict giving for each target (e.g. 'Test Plan #200') the IDs of its available Test Runs,
+                 `None` if target is not available
+    """
+    target_runs = {}
+    for run_id in dict.fromkeys(run_ids):
+        target_runs['Test Run #%d' % run_id] = [run_id] if api.is_testrun_available(run_id) else None
+    for plan_id in dict.fromkeys(plan_ids):
+        target_runs['Test Plan #%d' % plan_id] = None
+        if api.is_testplan_available(plan_id):
+            try:
+                target_runs['Test Plan #%d' % plan_id] = api.get_available_testruns(plan_id)
+            except testrail.APIError:
+                logging.exception('Error while reading Test Plan #%d', plan_id)
+    return target_runs
+
+
+def publish_testruns(api, testcases, run_ids, version='', publish_blocked=True, max_workers=1, journal=None,
+                     skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in Test Runs, several Test Runs being published concurrently
+
+        :param api: Client to TestRail API
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param run_ids: TestRail IDs of Test Runs to update
+        :param version: Version to indicate in Test Case result
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param max_workers: Maximum number of Test Runs published concurrently
+        :param journal: `publish_journal.PublishJournal` of the session. Completed Test Runs are skipped.
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
+        :return: Dict giving for each Test Run ID, in the order of `run_ids`, the number of published results,
+                 `None` if Test Run is not available, or the error raised while publishing.
+    """
+    outcomes = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {}
+        for run_id in run_ids:
+            future = executor.submit(_publish_testrun_of_testplan, api, testcases, run_id, version, publish_blocked,
+                                     journal, skip_unchanged)
+            futures[future] = run_id
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as error:    # pylint: disable=broad-except
+                outcomes[futures[future]] = error
+    return {run_id: outcomes[run_id] for run_id in run_ids}
+
+
+def _publish_testrun_of_testplan(api, testcases, run_id, version, publish_blocked, journal, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in a Test Run of a Test Plan
+
+        :return: Number of published results. `None` if Test Run is not available.
+    """
+    if not api.is_testrun_available(run_id):
+        return None
+    logging.info('Publish in Test Run #%d', run_id)
+    return _publish_testrun(api, testcases, run_id, version, publish_blocked, journal, skip_unchanged)
+
+
+def _publish_testrun(api, testcases, run_id, version, publish_blocked, journal=None, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in an available Test Run
+
+        :return: Number of published results
+        :raise testrail.APIError: if results can't be published
+    """
+    if journal is not None and journal.is_run_complete(run_id):
+        logging.info('Results already published in Test Run #%d: skipped', run_id)
+        return 0
+
+    # Tests of Test Run are read page by page and indexed by case ID
+    index = RunIndex(api.iter_tests(run_id, prefetch=True))
+    if publish_blocked is False:
+        logging.info('Option "Don\'t publish blocked testcases" activated')
+        logging.info('Blocked testcases excluded: %s', ', '.join(str(elt) for elt in index.get_blocked_case_ids()))
+    testcases = index.filter(testcases, publish_blocked)
+    if skip_unchanged:
+        changed = index.filter_changed(testcases)
+        logging.info('%d result(s) unchanged in Test Run #%d: skipped, %d result(s) to publish',
+                     len(testcases) - len(changed), run_id, len(changed))
+        testcases = changed
+
+    result = []
+    if testcases or not skip_unchanged:    # Nothing to send if all results are unchanged
+        result = api.add_results(run_id, version, testcases)
+    logging.info('%d result(s) published in Test Run #%d.', len(result), run_id)
+    if journal is not None:
+        journal.complete_run(run_id)
+    return len(result)
+
+
+def publish_new_testrun(api, testcases, name, project_id=0, plan_id=0, suite_id=None, version=''):
+    # pylint: disable=too-many-arguments
+    """ Create a Test Run containing only the Test Cases of results, and publish results in it
+
+        The Test Run is created in a project, or as a new entry of a Test Plan. As its tests are exactly
+        the Test Cases of results, they don't need to be read before publishing.
+
+        :param api: Client to TestRail API
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param name: Name of the Test Run
+        :param project_id: TestRail ID of the project where Test Run is created
+        :param plan_id: TestRail ID of the Test Plan where Test Run is created (instead of `project_id`)
+        :param suite_id: TestRail ID of the suite of Test Cases. If not set for a Test Plan, the suite of the
+                         first Test Case is used.
+        :param version: Version to indicate in Test Case result
+        :return: ID of the created Test Run. 0 in case of error.
+    """
+    # Like in an existing Test Run, testcases without valid Test Case ID are not published
+    identified = [testcase for testcase in testcases if get_case_id(testcase)]
+    if len(identified) < len(testcases):
+        logging.warning('%d result(s) without valid Test Case ID: not published', len(testcases) - len(identified))
+    testcases = identified
+    case_ids = list(dict.fromkeys(map(get_case_id, testcases)))
+    if not case_ids:
+        logging.error('No Test Case ID found: Test Run is not created')
+        return 0
+
+    try:
+        if plan_id:
+            if not api.is_testplan_available(plan_id):
+                logging.error('Test Plan #%d is not available', plan_id)
+                return 0
+            suite_id = suite_id or api.get_case(case_ids[0])['suite_id']
+            run = api.add_plan_entry(plan_id, suite_id, name, case_ids)
+            logging.info('Test Run #%d "%s" of %d test(s) created in Test Plan #%d', run['id'], name, len(case_ids),
+                         plan_id)
+        elif project_id:
+            run = api.add_run(project_id, name, case_ids, suite_id)
+            logging.info('Test Run #%d "%s" of %d test(s) created in project #%d', run['id'], name, len(case_ids),
+                         project_id)
+        else:
+            logging.error("You have to indicate a project or a Test Plan ID")
+            return 0
+    except testrail.APIError:
+        logging.exception('Error while creating Test Run')
+        return 0
+
+    try:
+        result = api.add_results(run['id'], version, testcases)
+        if result is None:
+            logging.error('Results not published in Test Run #%d', run['id'])
+        else:
+            logging.info('%d result(s) published in Test Run #%d.', len(result), run['id'])
+    except testrail.APIError:
+        logging.exception('Error while publishing results')
+    return run['id']
+
+
+def get_api(config_file, password=None, api_class=TestRailApiUtils, **kwargs):
+    """ Return a client to TestRail API, configured by the `[API]` section of a configuration file
+
+        Besides `url`, `email` and `password`, optional keys are `timeout` (in seconds), `max_attempts`,
+        `backoff`, `max_backoff` and `retry_sent_posts` (see `testrail_http.RetryPolicy`), `rate_limit` (maximum
+        number of requests per second), `rate_burst` (see `testrail_http.TokenBucket`) and `compress_requests`
+        (to send request bodies compressed with gzip).
+
+        :param config_file: TestRail configuration file (opened)
+        :param password: API key of TestRail account. If not set, `password` of configuration file is used.
+        :param api_class: Class of the client, `TestRailApiUtils` or `testrail_async.AsyncTestRailApiUtils`
+        :param kwargs: Other arguments of `api_class`
+    """
+    config = configparser.ConfigParser()
+    config.read_file(config_file)
+    url = config.get('API', 'url')
+    email = config.get('API', 'email')
+    if not password:
+        password = config.get('API', 'password')
+
+    logging.debug('Connection info: URL=%s, EMAIL=%s, PASSWORD=%s', url, email, len(password) * '*')
+
+    kwargs.setdefault('timeout', config.getfloat('API', 'timeout', fallback=None))
+    api = api_class(url, **kwargs)
+    api.user = email
+    api.password = password
+    api.retry_policy = testrail_http.RetryPolicy(
+        max_attempts=config.getint('API', 'max_attempts', fallback=5),
+        backoff=config.getfloat('API', 'backoff', fallback=1.0),
+        max_backoff=config.getfloat('API', 'max_backoff', fallback=60.0),
+        retry_sent_posts=config.getboolean('API', 'retry_sent_posts', fallback=False))
+    api.compress_requests = config.getboolean('API', 'compress_requests', fallback=False)
+    rate_limit = config.getfloat('API', 'rate_limit', fallback=0)
+    if rate_limit:
+        api.rate_limiter = testrail_http.TokenBucket(rate_limit, config.getint('API', 'rate_burst', fallback=1))
+    return api
+
+
 def pretty_print(testcases):
     """ Pretty print a list of testcases """
+    from colorama import Fore    # pylint: disable=import-outside-toplevel
     for testcase in testcases:
         pretty_print_testcase(testcase)
         print(Fore.RESET)
@@ -177,6 +632,7 @@ def pretty_print(testcases):
 
 def pretty_print_testcase(testcase, error=''):
     """ Pretty print a testcase """
+    from colorama import Fore, Style    # pylint: disable=import-outside-toplevel
     if error:
         msg_template = Style.BRIGHT + '{id}' + Style.RESET_ALL + '\t' + \
                        Fore.MAGENTA + '{status}' + Fore.RESET + '\t' + \
@@ -197,9 +653,9 @@ def options():
     parser = argparse.ArgumentParser(prog='robotframework2testrail.py', description=__doc__)
     parser.add_argument(
         'xml_robotfwk_output',
-        nargs=1,
-        type=argparse.FileType('r', encoding='UTF-8'),
-        help='XML output results of Robot Framework')
+        nargs='+',
+        help='XML output results of Robot Framework. Several files or glob patterns may be given '
+        '(e.g. pabot outputs).')
     parser.add_argument(
         '--tr-config',
         dest='config',
@@ -216,37 +672,279 @@ def options():
         '--tr-dont-publish-blocked',
         action='store_true',
         help='Do not publish results of "blocked" testcases in TestRail.')
+    parser.add_argument(
+        '--tr-skip-unchanged',
+        dest='skip_unchanged',
+        action='store_true',
+        help='Do not publish results whose status is already the current status of the test in TestRail '
+        '(tests without result are always published).')
+    parser.add_argument(
+        '--parser',
+        choices=PARSERS,
+        default='visitor',
+        help='Engine used to read XML output: "visitor" loads Robot Framework result model, '
+        '"stream" parses XML incrementally with bounded memory (default: visitor).')
+    parser.add_argument(
+        '--parse-workers',
+        metavar='N',
+        type=int,
+        default=None,
+        help='Number of processes parsing XML outputs in parallel (default: one per CPU).')
+    parser.add_argument(
+        '--duplicates',
+        choices=DUPLICATE_POLICIES,
+        default='all',
+        help='Results to keep when a Test Case ID is found several times: "all", "first" or "last" result, '
+        'or "worst" to keep a failed result if any (default: all).')
+    parser.add_argument(
+        '--tr-max-workers',
+        dest='max_workers',
+        metavar='N',
+        type=int,
+        default=4,
+        help='Maximum number of Test Runs of a Test Plan published concurrently (default: 4).')
+    parser.add_argument(
+        '--tr-batch-size',
+        dest='batch_size',
+        metavar='N',
+        type=int,
+        default=BATCH_SIZE,
+        help='Maximum number of results sent in one request, 0 for no limit (default: %(default)s).')
+    parser.add_argument(
+        '--tr-batch-bytes',
+        dest='batch_max_bytes',
+        metavar='BYTES',
+        type=int,
+        default=BATCH_MAX_BYTES,
+        help='Maximum size of results sent in one request, 0 for no limit (default: %(default)s).')
+    parser.add_argument(
+        '--tr-batch-workers',
+        dest='batch_workers',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Number of batches of results sent concurrently to a Test Run (default: %(default)s).')
 
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument(
+    parser.add_argument(
+        '--failure-trace',
+        action='store_true',
+        help='Add to comments of failed tests the chain of their failed keywords. Outputs are then read with '
+        '--parser=stream, keywords of passed tests being skipped.')
+    parser.add_argument(
+        '--tr-attachments',
+        dest='attachments',
+        action='store_true',
+        help='Attach to results of failed tests the files referenced by their HTML messages (e.g. screenshots) '
+        'and {} found next to the output, each file being uploaded once per Test Run.'.format(LOG_HTML))
+    parser.add_argument(
+        '--tr-attachment-max-bytes',
+        dest='attachment_max_bytes',
+        metavar='N',
+        type=int,
+        default=ATTACHMENT_MAX_BYTES,
+        help='Maximum size of an attachment, larger files are not uploaded (default: %(default)s).')
+    parser.add_argument(
+        '--tr-attachment-workers',
+        dest='attachment_workers',
+        metavar='N',
+        type=int,
+        default=4,
+        help='Number of attachments uploaded concurrently (default: %(default)s).')
+
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help='Directory where TestRail metadata (runs, plans, tests) is cached between invocations. '
+        'By default, metadata is only cached during an invocation.')
+    parser.add_argument(
+        '--cache-ttl',
+        metavar='SECONDS',
+        type=float,
+        default=300,
+        help='Time to live of cached TestRail metadata (default: %(default)s).')
+    parser.add_argument('--clear-cache', action='store_true', help='Clear cached TestRail metadata before publishing.')
+    parser.add_argument(
+        '--parse-cache',
+        metavar='DIR',
+        help='Directory where results extracted from XML outputs are cached: next invocations on the same '
+        'unchanged outputs (e.g. after --dryrun) skip parsing.')
+    parser.add_argument(
+        '--journal',
+        metavar='PATH',
+        help='Journal recording batches of results accepted by TestRail (default with --resume: {}).'.format(
+            JOURNAL_FILENAME))
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume an interrupted publishing of the same results: only results not yet accepted by TestRail '
+        'are sent.')
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='Publish with an asyncio client: all requests (Test Runs of a Test Plan, batches of results) are sent '
+        'concurrently from one thread, up to --tr-max-workers x --tr-batch-workers at once. '
+        'Not compatible with --journal and --resume.')
+
+    parser.add_argument(
+        '--log-file',
+        metavar='PATH',
+        default=os.path.join(PATH, LOG_FILENAME),
+        help='Log file, empty to disable it (default: {} in current directory).'.format(LOG_FILENAME))
+    parser.add_argument(
+        '--log-level',
+        choices=LOG_LEVELS,
+        default='DEBUG',
+        help='Level of messages written in the log file (default: %(default)s).')
+    parser.add_argument(
+        '--metrics-out',
+        metavar='PATH',
+        help='Write metrics of the publishing in a JSON file: duration of phases, and for each API method, number '
+        'of requests, errors and retries, latency histogram, bytes sent and received, time waited for rate limit.')
+    parser.add_argument(
+        '--profile',
+        metavar='PATH',
+        help='Profile the execution with cProfile, and write statistics in a file (to read with pstats).')
+
+    parser.add_argument(
+        '--tr-project-id',
+        dest='project_id',
+        metavar='ID',
+        type=int,
+        help='Identifier of the TestRail project, where --tr-new-run creates its Test Run.')
+    parser.add_argument(
+        '--tr-match-by-name',
+        dest='match_by_name',
+        action='store_true',
+        help='Give tests without Test Case ID the ID of the Test Case titled like the test (or else like its suite), '
+        'found in an index of Test Cases of the project of --tr-project-id.')
+    parser.add_argument(
+        '--tr-suite-id',
+        dest='suite_id',
+        metavar='ID',
+        type=int,
+        help='Identifier of the TestRail suite of Test Cases, for projects with several suites.')
+    parser.add_argument(
+        '--tr-case-index',
+        dest='case_index',
+        metavar='PATH',
+        help='JSON file storing the index of Test Cases between invocations (default: {} in --cache-dir, '
+        'else in current directory).'.format(INDEX_FILENAME))
+    parser.add_argument(
+        '--tr-case-index-ttl',
+        dest='case_index_ttl',
+        metavar='SECONDS',
+        type=float,
+        default=INDEX_TTL,
+        help='Minimum delay between two downloads of the index of Test Cases, when a test is not found in it '
+        '(default: %(default)s).')
+
+    parser.add_argument(
+        '--tr-new-run',
+        dest='new_run',
+        metavar='NAME',
+        help='Create a Test Run named NAME, containing only the Test Cases of results, in the project of '
+        '--tr-project-id (or in the Test Plan of --tr-new-run-plan-id), and publish results in it.')
+    parser.add_argument(
         '--tr-run-id',
-        dest='run_id',
-        action='store',
+        dest='run_ids',
+        metavar='RUN_ID',
+        action='append',
         type=int,
-        default=None,
-        help='Identifier of Test Run, that appears in TestRail.')
-    group.add_argument(
+        default=[],
+        help='Identifier of Test Run, that appears in TestRail. May be repeated, and combined with --tr-plan-id: '
+        'results are published in all Test Runs at once, a Test Run reached several times being published once.')
+    parser.add_argument(
         '--tr-plan-id',
-        dest='plan_id',
-        action='store',
+        dest='plan_ids',
+        metavar='PLAN_ID',
+        action='append',
         type=int,
-        default=None,
-        help='Identifier of Test Plan, that appears in TestRail.')
+        default=[],
+        help='Identifier of Test Plan, that appears in TestRail. May be repeated, and combined with --tr-run-id.')
+    parser.add_argument(
+        '--tr-new-run-plan-id',
+        dest='new_run_plan_id',
+        metavar='ID',
+        type=int,
+        default=0,
+        help='Identifier of the Test Plan where the Test Run of --tr-new-run is created.')
 
     opt = parser.parse_known_args()
     if opt[1]:
         logging.warning('Unknown options: %s', opt[1])
+    try:
+        opt[0].xml_robotfwk_output = expand_outputs(opt[0].xml_robotfwk_output)
+    except ValueError as error:
+        parser.error(str(error))
+    if not (opt[0].new_run or opt[0].run_ids or opt[0].plan_ids):
+        parser.error('one of the arguments --tr-new-run --tr-run-id --tr-plan-id is required')
+    if opt[0].new_run and (opt[0].run_ids or opt[0].plan_ids):
+        parser.error('--tr-new-run is not compatible with --tr-run-id and --tr-plan-id')
+    if opt[0].use_async and (opt[0].journal or opt[0].resume or opt[0].attachments):
+        parser.error('--async is not compatible with --journal, --resume and --tr-attachments')
+    if opt[0].new_run and (opt[0].use_async or opt[0].resume):
+        parser.error('--tr-new-run is not compatible with --async and --resume')
+    if opt[0].new_run and not (opt[0].project_id or opt[0].new_run_plan_id):
+        parser.error('--tr-new-run requires --tr-project-id or --tr-new-run-plan-id')
+    if opt[0].match_by_name and not opt[0].project_id:
+        parser.error('--tr-match-by-name requires --tr-project-id')
     return opt[0]
 
 
 if __name__ == '__main__':
     # Global init
-    init()    # colorama
+    from colorama import Fore, init
+    init()
 
     # Manage options
     ARGUMENTS = options()
+    configure_logging(ARGUMENTS.log_file, ARGUMENTS.log_level)
+
+    # Instrumentation, reported at exit
+    METRICS = PublishMetrics()
+    atexit.register(METRICS.log_summary)
+    if ARGUMENTS.metrics_out:
+        atexit.register(METRICS.write, ARGUMENTS.metrics_out)
+    if ARGUMENTS.profile:
+        import cProfile
+        PROFILE = cProfile.Profile()
+        atexit.register(PROFILE.dump_stats, ARGUMENTS.profile)
+        atexit.register(PROFILE.disable)
+        PROFILE.enable()
 
-    TESTCASES = get_testcases(ARGUMENTS.xml_robotfwk_output[0].name)
+    OUTPUTS = ARGUMENTS.xml_robotfwk_output
+    PARSE_WORKERS = ARGUMENTS.parse_workers or min(len(OUTPUTS), os.cpu_count() or 1)
+    PARSE_CACHE = ParseCache(ARGUMENTS.parse_cache) if ARGUMENTS.parse_cache else None
+    with METRICS.phase('parse'):
+        TESTCASES_LISTS = get_testcases_from_files(
+            OUTPUTS,
+            parser=ARGUMENTS.parser,
+            max_workers=PARSE_WORKERS,
+            keep_unidentified=ARGUMENTS.match_by_name,
+            cache=PARSE_CACHE,
+            attachments=ARGUMENTS.attachments,
+            failure_trace=ARGUMENTS.failure_trace)
+    if PARSE_CACHE:
+        PARSE_CACHE.log_statistics()
+        METRICS.set('parse_cache_hits', PARSE_CACHE.hits)
+    if ARGUMENTS.match_by_name:
+        INDEX_PATH = ARGUMENTS.case_index or os.path.join(
+            ARGUMENTS.cache_dir or PATH,
+            INDEX_FILENAME.format(project_id=ARGUMENTS.project_id, suite_id=ARGUMENTS.suite_id or 0))
+        RESOLVER_API = get_api(ARGUMENTS.config, ARGUMENTS.password)
+        RESOLVER_API.timing_callback = METRICS.record_request
+        ARGUMENTS.config.seek(0)    # Read again by get_api to publish
+        with METRICS.phase('resolve'):
+            RESOLVER = CaseResolver(RESOLVER_API, ARGUMENTS.project_id, ARGUMENTS.suite_id, INDEX_PATH,
+                                    ARGUMENTS.case_index_ttl)
+            TESTCASES_LISTS = [RESOLVER.resolve_testcases(testcases) for testcases in TESTCASES_LISTS]
+        RESOLVER_API.close()
+    with METRICS.phase('merge'):
+        TESTCASES = merge_testcases(TESTCASES_LISTS, policy=ARGUMENTS.duplicates)
+    METRICS.set('outputs', len(OUTPUTS))
+    METRICS.set('results', len(TESTCASES))
+    logging.info('%d result(s) found in %d XML output(s)', len(TESTCASES), len(OUTPUTS))
 
     if ARGUMENTS.dryrun:
         pretty_print(TESTCASES)
@@ -254,32 +952,88 @@ if __name__ == '__main__':
         sys.exit()
 
     # Init global variables
-    CONFIG = configparser.ConfigParser()
-    CONFIG.read_file(ARGUMENTS.config)
-    URL = CONFIG.get('API', 'url')
-    EMAIL = CONFIG.get('API', 'email')
     VERSION = ARGUMENTS.version
     PUBLISH_BLOCKED = not ARGUMENTS.tr_dont_publish_blocked
-    if ARGUMENTS.password:
-        PASSWORD = ARGUMENTS.password
-    else:
-        PASSWORD = CONFIG.get('API', 'password')
-
-    logging.debug('Connection info: URL=%s, EMAIL=%s, PASSWORD=%s', URL, EMAIL, len(PASSWORD) * '*')
 
     # Init API
-    API = TestRailApiUtils(URL)
-    API.user = EMAIL
-    API.password = PASSWORD
-
-    # Main
-    if publish_results(
-            API,
-            TESTCASES,
-            run_id=ARGUMENTS.run_id,
-            plan_id=ARGUMENTS.plan_id,
-            version=VERSION,
-            publish_blocked=PUBLISH_BLOCKED):
+    POOL_SIZE = max(4, ARGUMENTS.max_workers * ARGUMENTS.batch_workers)
+    if ARGUMENTS.use_async:
+        import asyncio
+        from testrail_async import AsyncTestRailApiUtils, publish_targets_async
+        API = get_api(ARGUMENTS.config, ARGUMENTS.password, api_class=AsyncTestRailApiUtils, pool_size=POOL_SIZE)
+        API.batch_size = ARGUMENTS.batch_size
+        API.batch_max_bytes = ARGUMENTS.batch_max_bytes
+        API.timing_callback = METRICS.record_request
+        API.cache = MetadataCache(ARGUMENTS.cache_dir, ARGUMENTS.cache_ttl)
+        if ARGUMENTS.clear_cache:
+            API.cache.invalidate()
+
+        async def _publish_async():
+            try:
+                return await publish_targets_async(
+                    API,
+                    TESTCASES,
+                    run_ids=ARGUMENTS.run_ids,
+                    plan_ids=ARGUMENTS.plan_ids,
+                    version=VERSION,
+                    publish_blocked=PUBLISH_BLOCKED,
+                    skip_unchanged=ARGUMENTS.skip_unchanged)
+            finally:
+                await API.close()
+
+        # Main
+        with METRICS.phase('publish'):
+            PUBLISHED = asyncio.run(_publish_async())
+        API.cache.log_statistics()
+        API.cache.close()
+    else:
+        API = get_api(ARGUMENTS.config, ARGUMENTS.password, pool_size=POOL_SIZE)
+        API.batch_size = ARGUMENTS.batch_size
+        API.batch_max_bytes = ARGUMENTS.batch_max_bytes
+        API.batch_workers = ARGUMENTS.batch_workers
+        API.attachments = ARGUMENTS.attachments
+        API.attachment_max_bytes = ARGUMENTS.attachment_max_bytes
+        API.attachment_workers = ARGUMENTS.attachment_workers
+        API.timing_callback = METRICS.record_request
+        API.cache = MetadataCache(ARGUMENTS.cache_dir, ARGUMENTS.cache_ttl)
+        if ARGUMENTS.clear_cache:
+            API.cache.invalidate()
+        JOURNAL = None
+        if ARGUMENTS.journal or ARGUMENTS.resume:
+            JOURNAL = PublishJournal(
+                ARGUMENTS.journal or os.path.join(PATH, JOURNAL_FILENAME),
+                PublishJournal.get_session_digest(TESTCASES, VERSION),
+                resume=ARGUMENTS.resume)
+            API.journal = JOURNAL
+
+        # Main
+        with METRICS.phase('publish'):
+            if ARGUMENTS.new_run:
+                PUBLISHED = publish_new_testrun(
+                    API,
+                    TESTCASES,
+                    ARGUMENTS.new_run,
+                    project_id=ARGUMENTS.project_id,
+                    plan_id=ARGUMENTS.new_run_plan_id,
+                    suite_id=ARGUMENTS.suite_id,
+                    version=VERSION)
+            else:
+                PUBLISHED = publish_targets(
+                    API,
+                    TESTCASES,
+                    run_ids=ARGUMENTS.run_ids,
+                    plan_ids=ARGUMENTS.plan_ids,
+                    version=VERSION,
+                    publish_blocked=PUBLISH_BLOCKED,
+                    max_workers=ARGUMENTS.max_workers,
+                    journal=JOURNAL,
+                    skip_unchanged=ARGUMENTS.skip_unchanged)
+        API.cache.log_statistics()
+        API.cache.close()
+        if JOURNAL:
+            JOURNAL.log_statistics()
+            JOURNAL.close()
+    if PUBLISHED:
         print(Fore.GREEN + 'OK' + Fore.RESET)
         sys.exit()
     else:
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of benchmark harness (mod:`benchmark`) """
+import pytest
+
+from benchmark.generate_output import generate_output
+from benchmark.run_benchmarks import (PUBLISH_MODES, benchmark_decode, benchmark_import, benchmark_index,
+                                      benchmark_parse, benchmark_publish, benchmark_records)
+from robotframework2testrail import get_testcases
+
+
+@pytest.mark.parametrize('id_source', ['tags', 'metadata', 'mixed'])
+def test_generate_output(tmpdir, id_source):
+    """ Generated output is parsed the same way by both parsers, with expected Test Case IDs """
+    output = str(tmpdir.join('output.xml'))
+    case_ids = generate_output(output, suites=4, tests=3, fail_ratio=0.5, id_source=id_source)
+    testcases = get_testcases(output)
+    assert get_testcases(output, parser='stream') == testcases
+    assert sorted({int(testcase['id'][1:]) for testcase in testcases}) == case_ids
+    assert {testcase['status'] for testcase in testcases} == {'PASS', 'FAIL'}
+    assert len(testcases) == 12
+
+
+def test_generate_output_reproducible(tmpdir):
+    """ A seed gives the same output """
+    outputs = [str(tmpdir.join('output%d.xml' % index)) for index in range(2)]
+    for output in outputs:
+        generate_output(output, suites=2, tests=5, seed=42)
+    assert open(outputs[0], encoding='UTF-8').read() == open(outputs[1], encoding='UTF-8').read()
+
+
+def test_benchmark_import():
+    """ Import measures are returned """
+    measures = benchmark_import(repeat=1)
+    assert measures['seconds'] > 0
+    assert measures['modules'] > 0
+
+
+def test_benchmark_parse(tmpdir):
+    """ Parse measures are returned """
+    output = str(tmpdir.join('output.xml'))
+    generate_output(output, suites=2, tests=5)
+    measures = benchmark_parse(output, 'stream', repeat=1)
+    assert measures['results'] == 10
+    assert measures['seconds'] > 0
+    assert measures['peak_bytes'] > 0
+    assert benchmark_parse(output, 'stream', repeat=1, failure_trace=True)['results'] == 10
+
+
+def test_benchmark_records(tmpdir):
+    """ Results stored as `ResultRecord` hold less memory than as dicts """
+    output = str(tmpdir.join('output.xml'))
+    generate_output(output, suites=2, tests=50)
+    measures = benchmark_records(get_testcases(output), batch_size=20)
+    assert 0 < measures['record']['bytes'] < measures['dict']['bytes']
+
+
+def test_benchmark_index():
+    """ Index measures are returned for each size """
+    measures = benchmark_index(sizes=(10, 20), repeat=1)
+    assert sorted(measures) == [10, 20]
+    assert all(size_measures['seconds'] > 0 for size_measures in measures.values())
+
+
+def test_benchmark_decode(tmpdir):
+    """ Projected responses hold less memory, compressed bodies are smaller """
+    output = str(tmpdir.join('output.xml'))
+    case_ids = generate_output(output, suites=2, tests=50)
+    measures = benchmark_decode(get_testcases(output), case_ids, repeat=1)
+    assert 0 < measures['projected']['held_bytes'] < measures['all_fields']['held_bytes']
+    assert 0 < measures['results']['gzip_bytes'] < measures['results']['bytes']
+
+
+@pytest.mark.parametrize('mode', list(PUBLISH_MODES))
+def test_benchmark_publish(tmpdir, mode):
+    """ All results are published in all Test Runs of the stand-in Test Plan, in every mode """
+    output = str(tmpdir.join('output.xml'))
+    case_ids = generate_output(output, suites=2, tests=5)
+    measures = benchmark_publish(get_testcases(output), case_ids, mode, runs=3, batch_size=4)
+    assert measures['published'] is True
+    assert measures['results'] == 30
+    # get_plan (availability, then Test Runs), then per Test Run: get_run, get_tests and 3 batches
+    assert measures['requests'] == 2 + 3 * 5
+    assert measures['throttled'] == 0
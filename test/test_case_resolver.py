@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`case_resolver` """
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from case_resolver import CaseResolver, normalize_title
+from robotframework2testrail import get_testcases
+
+CASES = [{'id': 1, 'title': 'Login With Valid User'}, {'id': 2, 'title': 'Logout'},
+         {'id': 3, 'title': 'logout'}, {'id': 4, 'title': 'Test Suite With Metadata'}]
+
+
+@pytest.fixture
+def api():
+    """ Return a mocked API returning `CASES` """
+    inst = Mock()
+    inst.iter_cases.side_effect = lambda project_id, suite_id, prefetch: iter(CASES)
+    return inst
+
+
+def test_normalize_title():
+    """ Case, underscores and whitespaces are ignored """
+    assert normalize_title('  Login_with   VALID\tuser ') == 'login with valid user'
+
+
+def test_resolve(api, tmpdir):    # pylint: disable=redefined-outer-name
+    """ Index is built on first miss, and stored """
+    path = str(tmpdir.join('index', 'cases.json'))
+    resolver = CaseResolver(api, 10, 20, path)
+    assert resolver.resolve('login_with_valid_user') == 1
+    assert resolver.resolve('LOGOUT') == 2    # First Test Case of duplicated titles
+    assert resolver.resolve('Unknown') is None
+    api.iter_cases.assert_called_once_with(10, 20, prefetch=True)
+    with open(path, encoding='UTF-8') as index_file:
+        assert json.load(index_file)['cases']['logout'] == 2
+
+
+def test_resolve_from_stored_index(api, tmpdir):    # pylint: disable=redefined-outer-name
+    """ Stored index is reused, and refreshed once on miss if older than `ttl` """
+    path = str(tmpdir.join('cases.json'))
+    CaseResolver(api, 10, index_path=path).refresh()
+    api.iter_cases.reset_mock()
+
+    resolver = CaseResolver(api, 10, index_path=path)
+    assert resolver.resolve('New Test') is None
+    api.iter_cases.assert_not_called()    # Refreshed less than `ttl` ago
+
+    resolver = CaseResolver(api, 10, index_path=path, ttl=0)
+    assert len(resolver) == 3
+    assert resolver.resolve('Logout') == 2
+    api.iter_cases.assert_not_called()
+    assert resolver.resolve('New Test') is None
+    assert resolver.resolve('Other New Test') is None
+    api.iter_cases.assert_called_once_with(10, None, prefetch=True)
+
+
+def test_stored_index_of_other_project(api, tmpdir):    # pylint: disable=redefined-outer-name
+    """ An index stored for another project or suite is not used """
+    path = str(tmpdir.join('cases.json'))
+    CaseResolver(api, 10, 20, index_path=path).refresh()
+    assert len(CaseResolver(api, 10, 20, index_path=path)) == 3
+    assert len(CaseResolver(api, 10, 21, index_path=path)) == 0
+    assert len(CaseResolver(api, 11, 20, index_path=path)) == 0
+
+
+@pytest.mark.parametrize('parser', ['visitor', 'stream'])
+def test_resolve_testcases(api, tmpdir, parser):    # pylint: disable=redefined-outer-name
+    """ Tests without Test Case ID are resolved by their name, else by the name of their suite """
+    output = tmpdir.join('output.xml')
+    output.write('''<?xml version="1.0" encoding="UTF-8"?>
+<robot generator="Robot 7.0" generated="2024-01-01T00:00:00" rpa="false" schemaversion="5">
+<suite id="s1" name="Test Suite With Metadata" source="/tests">
+<test id="s1-t1" name="Login With Valid User">
+<status status="PASS" start="2024-01-01T00:00:00" elapsed="1.0"/>
+</test>
+<test id="s1-t2" name="Tagged">
+<tag>test_case_id=C7</tag>
+<status status="FAIL" start="2024-01-01T00:00:00" elapsed="1.0">Error</status>
+</test>
+<test id="s1-t3" name="Unknown">
+<status status="PASS" start="2024-01-01T00:00:00" elapsed="1.0"/>
+</test>
+<status status="FAIL" start="2024-01-01T00:00:00" elapsed="3.0"/>
+</suite>
+<statistics><total></total><tag></tag><suite></suite></statistics>
+<errors></errors>
+</robot>
+''')
+    assert [testcase['id'] for testcase in get_testcases(str(output), parser)] == ['C7']
+    testcases = get_testcases(str(output), parser, keep_unidentified=True)
+    assert [(testcase['id'], testcase.get('suite')) for testcase in testcases] == [
+        (None, 'Test Suite With Metadata'), ('C7', None), (None, 'Test Suite With Metadata')
+    ]
+
+    resolver = CaseResolver(api, 10, index_path=str(tmpdir.join('cases.json')))
+    testcases = resolver.resolve_testcases(testcases)
+    assert [(testcase['id'], testcase['name']) for testcase in testcases] == [
+        ('C1', 'Login With Valid User'), ('C7', 'Tagged'), ('C4', 'Unknown')
+    ]
+    assert all('suite' not in testcase for testcase in testcases)
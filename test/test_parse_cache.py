@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`parse_cache` """
+import os
+import shutil
+
+import parse_cache
+from parse_cache import ParseCache
+from robotframework2testrail import PATH, get_testcases
+
+
+def _copy_output(tmp_path):
+    """ Return the path of a copy of the test output """
+    output = str(tmp_path / 'output.xml')
+    shutil.copy(os.path.join(PATH, 'test', 'output.xml'), output)
+    return output
+
+
+def test_cached_results(tmp_path):
+    """ Results are shared between instances using the same directory, per parsing options """
+    output = _copy_output(tmp_path)
+    testcases = get_testcases(output, parser='stream')
+    cache = ParseCache(str(tmp_path / 'cache'))
+    assert cache.get(output, 'stream') is None
+    cache.set(output, 'stream', False, testcases)
+
+    cache = ParseCache(str(tmp_path / 'cache'))
+    cached = cache.get(output, 'stream')
+    assert cached == testcases
+    assert [testcase.case_id for testcase in cached] == [testcase.case_id for testcase in testcases]
+    assert cache.get(output, 'visitor') is None
+    assert cache.get(output, 'stream', keep_unidentified=True) is None
+    assert cache.get(output, 'stream', failure_trace=True) is None
+    assert cache.get(output, 'stream', attachments=False, failure_trace=False) == testcases
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_changed_output(tmp_path):
+    """ Cached results are ignored when the output changes, even with same size and modification time """
+    output = _copy_output(tmp_path)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    cache.set(output, 'stream', False, get_testcases(output, parser='stream'))
+    stat = os.stat(output)
+    with open(output, 'r+b') as output_file:
+        output_file.seek(-20, os.SEEK_END)
+        output_file.write(b' ' * 10)
+    os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.get(output, 'stream') is None
+
+
+def test_content_hash_sampled(tmp_path, monkeypatch):
+    """ Only first, middle and last chunks of large outputs are hashed """
+    monkeypatch.setattr(parse_cache, 'SAMPLE_SIZE', 4)
+    path = tmp_path / 'output.xml'
+    path.write_bytes(b'0123456789abcdef')
+    digest = parse_cache.get_content_hash(str(path), 16)
+    path.write_bytes(b'0123X56789abcdef')
+    assert parse_cache.get_content_hash(str(path), 16) == digest
+    path.write_bytes(b'0123456X89abcdef')
+    assert parse_cache.get_content_hash(str(path), 16) != digest
+
+
+def test_corrupted_entry(tmp_path):
+    """ A corrupted entry is a miss """
+    output = _copy_output(tmp_path)
+    cache = ParseCache(str(tmp_path / 'cache'))
+    cache.set(output, 'stream', False, [])
+    for entry in (tmp_path / 'cache').iterdir():
+        entry.write_bytes(b'corrupted')
+    assert cache.get(output, 'stream') is None
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`publish_journal` """
+import json
+from unittest.mock import Mock
+
+import pytest
+
+import robotframework2testrail
+import testrail_utils as tr
+from publish_journal import PublishJournal
+from testrail import APIError
+
+TESTRAIL_URL = 'https://example.testrail.net'
+
+TESTCASES = [{'id': 'C{}'.format(i), 'status': 'PASS', 'name': 'Test {}'.format(i)} for i in range(1, 7)]
+
+
+def _add_results(uri, data):    # pylint: disable=unused-argument
+    """ Return response of `add_results_for_cases` to a request """
+    return [{'test_id': result['case_id']} for result in json.loads(data)['results']]
+
+
+@pytest.fixture
+def api():
+    """ Return access to TestRail API, with a Test Run containing all testcases """
+    inst = tr.TestRailApiUtils(TESTRAIL_URL)
+    inst.batch_size = 2
+    inst.send_get = Mock(side_effect=lambda uri, fields=None: {'is_completed': False}
+                         if uri.startswith('get_run') else [{'case_id': i} for i in range(1, 7)])
+    inst.send_post = Mock(side_effect=_add_results)
+    return inst
+
+
+def test_session_digest():
+    """ Digest identifies results and version """
+    digest = PublishJournal.get_session_digest(TESTCASES, '1.0')
+    assert digest == PublishJournal.get_session_digest([dict(testcase) for testcase in TESTCASES], '1.0')
+    assert digest != PublishJournal.get_session_digest(TESTCASES, '1.1')
+    assert digest != PublishJournal.get_session_digest(TESTCASES[1:], '1.0')
+
+
+def test_resume_interrupted_publishing(api, tmp_path):    # pylint: disable=redefined-outer-name
+    """ Only batches not acknowledged are sent when resuming """
+    path = str(tmp_path / 'journal.sqlite')
+    session = PublishJournal.get_session_digest(TESTCASES)
+    api.journal = PublishJournal(path, session)
+    api.send_post.side_effect = [[{'test_id': 1}, {'test_id': 2}],
+                                 APIError('HTTP 504'), [{'test_id': 5}, {'test_id': 6}]]
+    journal = api.journal
+    assert robotframework2testrail.publish_results(api, TESTCASES, run_id=10, journal=journal)
+    assert not journal.is_run_complete(10)
+    assert journal.get_pending_batches() == [(10, 1, 2)]
+    journal.close()
+
+    api.send_post.reset_mock(side_effect=True)
+    api.send_post.side_effect = _add_results
+    # pylint: disable=protected-access
+    journal = api.journal = PublishJournal(path, session, resume=True)
+    assert robotframework2testrail._publish_testrun(api, TESTCASES, 10, '', True, journal) == 6
+    assert api.send_post.call_count == 1
+    assert [result['case_id'] for result in json.loads(api.send_post.call_args[0][1])['results']] == [3, 4]
+    assert journal.is_run_complete(10)
+    assert journal.get_pending_batches() == []
+
+    # Same publishing again: no request at all
+    api.send_get.reset_mock()
+    api.send_post.reset_mock()
+    assert robotframework2testrail._publish_testrun(api, TESTCASES, 10, '', True, journal) == 0
+    assert api.send_get.call_count == 0
+    assert api.send_post.call_count == 0
+    journal.close()
+
+
+def test_publishing_without_resume(api, tmp_path):    # pylint: disable=redefined-outer-name
+    """ Without resume, journal of the same results is cleared and all results are sent """
+    path = str(tmp_path / 'journal.sqlite')
+    session = PublishJournal.get_session_digest(TESTCASES)
+    for resume in (False, False, True):
+        journal = api.journal = PublishJournal(path, session, resume=resume)
+        robotframework2testrail.publish_results(api, TESTCASES, run_id=10, journal=journal)
+        journal.close()
+    assert api.send_post.call_count == 6
+
+    # Other results are a different session
+    journal = api.journal = PublishJournal(path, PublishJournal.get_session_digest(TESTCASES[:2]), resume=True)
+    robotframework2testrail.publish_results(api, TESTCASES[:2], run_id=10, journal=journal)
+    assert api.send_post.call_count == 7
+    journal.close()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`publish_metrics` """
+import json
+
+from publish_metrics import PublishMetrics
+from testrail import RequestTiming
+
+
+def test_phases():
+    """ Durations of a phase are summed """
+    metrics = PublishMetrics()
+    with metrics.phase('parse'):
+        pass
+    with metrics.phase('publish'):
+        pass
+    first = metrics.phases['publish']
+    with metrics.phase('publish'):
+        pass
+    assert list(metrics.phases) == ['parse', 'publish']
+    assert metrics.phases['publish'] > first
+
+
+def test_requests_by_endpoint():
+    """ Requests are aggregated by API method """
+    metrics = PublishMetrics()
+    metrics.record_request(RequestTiming('GET', 'get_tests/1', 200, 0.02, False, 0, 100))
+    metrics.record_request(RequestTiming('GET', 'get_tests/1&limit=250&offset=250', 200, 0.3, True, 0, 50))
+    metrics.record_request(RequestTiming('POST', 'add_results_for_cases/1', 429, 0.01, True, 10, 5, 1, 0.5))
+    metrics.record_request(RequestTiming('POST', 'add_results_for_cases/1', 200, 20, True, 10, 5, 2, 0.0, 1.5))
+    summary = metrics.get_summary()
+
+    assert sorted(summary['endpoints']) == ['add_results_for_cases', 'get_tests']
+    get_tests = summary['endpoints']['get_tests']
+    assert get_tests['requests'] == 2
+    assert get_tests['reused_connections'] == 1
+    assert get_tests['bytes_received'] == 150
+    assert get_tests['latency_max'] == 0.3
+    assert get_tests['latency_mean'] == 0.16
+    assert get_tests['latency_histogram']['<=0.05'] == 1
+    assert get_tests['latency_histogram']['<=0.5'] == 1
+    add_results = summary['endpoints']['add_results_for_cases']
+    assert add_results['latency_histogram']['>10'] == 1
+    assert summary['requests'] == {
+        'requests': 4,
+        'errors': 1,
+        'retries': 1,
+        'bytes_sent': 20,
+        'bytes_received': 160,
+        'rate_limit_sleep': 0.5,
+        'retry_sleep': 1.5
+    }
+
+
+def test_write(tmpdir):
+    """ Metrics are written in JSON """
+    metrics = PublishMetrics()
+    metrics.set('results', 3)
+    with metrics.phase('parse'):
+        pass
+    path = str(tmpdir.join('metrics.json'))
+    metrics.write(path)
+    with open(path, encoding='UTF-8') as metrics_file:
+        summary = json.load(metrics_file)
+    assert summary['values'] == {'results': 3}
+    assert list(summary['phases']) == ['parse']
+    assert summary['requests']['requests'] == 0
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`publish_service` """
+import os
+import shutil
+import threading
+
+import pytest
+
+import robotframework2testrail
+import testrail_http
+from benchmark.fake_testrail import FakeTestRail
+from publish_service import DONE_DIR, FAILED_DIR, PROCESSING_DIR, PublishService, submit_job
+from testrail_cache import MetadataCache
+from testrail_utils import TestRailApiUtils
+
+OUTPUT = os.path.join(robotframework2testrail.PATH, 'test', 'output.xml')
+CASE_IDS = [344, 345, 366, 347, 348]
+
+
+@pytest.fixture(name='server')
+def fixture_server():
+    """ Return a stand-in of TestRail with Test Runs #1 and #2 """
+    with FakeTestRail() as server:
+        server.add_run(1, CASE_IDS)
+        server.add_run(2, CASE_IDS)
+        yield server
+
+
+def _get_service(server, spool_dir, **kwargs):
+    """ Return a service publishing in `server` """
+    api = TestRailApiUtils(server.url)
+    api.cache = MetadataCache()
+    return PublishService(api, str(spool_dir), flush_interval=0, **kwargs)
+
+
+def _process(service):
+    """ Process submitted jobs at once """
+    service.scan()
+    service.collect(wait=True)
+    service.flush(force=True)
+
+
+def _count(server, uri):
+    """ Return the number of requests of an API method """
+    return sum(1 for request in server.requests if request.uri.split('&')[0] == uri)
+
+
+def test_jobs_coalesced(tmp_path, server):
+    """ Jobs for the same Test Run are published in one request, metadata is kept between publishings """
+    service = _get_service(server, tmp_path)
+    jobs = [submit_job(str(tmp_path), [OUTPUT], run_id=1, version='1.0') for _ in range(2)]
+    jobs.append(submit_job(str(tmp_path), [OUTPUT], run_id=2))
+    assert service.scan() == 3
+    service.collect(wait=True)
+    service.flush(force=True)
+    assert _count(server, 'add_results_for_cases/1') == 1
+    assert _count(server, 'add_results_for_cases/2') == 1
+    assert server.added_results == 3 * 6
+    assert sorted(os.listdir(str(tmp_path / DONE_DIR))) == sorted(os.path.basename(job) for job in jobs)
+    assert service.published_jobs == 3
+
+    submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    _process(service)
+    assert _count(server, 'add_results_for_cases/1') == 2
+    assert _count(server, 'get_run/1') == 1
+    service.close()
+
+
+def test_flush_interval(tmp_path, server):
+    """ Parsed jobs are published once their delay is over """
+    service = _get_service(server, tmp_path)
+    service.flush_interval = 60
+    submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    service.scan()
+    service.collect(wait=True)
+    service.flush()
+    assert _count(server, 'add_results_for_cases/1') == 0
+    service.flush(force=True)
+    assert _count(server, 'add_results_for_cases/1') == 1
+    service.close()
+
+
+def test_failed_jobs(tmp_path, server):
+    """ Invalid jobs, jobs whose outputs can't be parsed and jobs not published are moved to failed/ """
+    service = _get_service(server, tmp_path)
+    (tmp_path / 'invalid.json').write_text('{"outputs": []}')
+    (tmp_path / 'broken.xml').write_text('<robot>')
+    submit_job(str(tmp_path), [str(tmp_path / 'missing.xml')], run_id=1)
+    submit_job(str(tmp_path), [str(tmp_path / 'broken.xml')], run_id=1)
+    submit_job(str(tmp_path), [OUTPUT], run_id=3)    # Unknown Test Run
+    submit_job(str(tmp_path), [OUTPUT], plan_id=1)    # Unknown Test Plan
+    _process(service)
+    assert len(os.listdir(str(tmp_path / FAILED_DIR))) == 5
+    assert not os.listdir(str(tmp_path / DONE_DIR))
+    assert service.failed_jobs == 5
+    service.close()
+
+
+def test_jobs_not_published(tmp_path, server):
+    """ Jobs whose results are refused by TestRail, or published while TestRail is unreachable, are moved to
+        failed/ without stopping the service
+    """
+    server.responses['add_results_for_cases/2'] = (500, {'error': 'Internal error'})
+    service = _get_service(server, tmp_path)
+    service.api.retry_policy = testrail_http.RetryPolicy(max_attempts=1)
+    submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    submit_job(str(tmp_path), [OUTPUT], run_id=2)
+    _process(service)
+    assert service.published_jobs == 1
+    assert service.failed_jobs == 1
+
+    server.stop()
+    service.api.close()    # Kept-alive connections are still served
+    service.api.cache.invalidate()    # Test Run is read again
+    submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    _process(service)
+    assert service.failed_jobs == 2
+    assert len(os.listdir(str(tmp_path / FAILED_DIR))) == 2
+    assert not os.listdir(str(tmp_path / PROCESSING_DIR))
+    service.close()
+
+
+def test_interrupted_jobs(tmp_path, server):
+    """ Jobs claimed but not processed when service was stopped are processed by the next service """
+    job = submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    os.makedirs(str(tmp_path / PROCESSING_DIR))
+    shutil.move(job, str(tmp_path / PROCESSING_DIR))
+    service = _get_service(server, tmp_path)
+    _process(service)
+    assert os.listdir(str(tmp_path / DONE_DIR)) == [os.path.basename(job)]
+    service.close()
+
+
+def test_serve(tmp_path, server):
+    """ Service publishes jobs until it is stopped, and publishes claimed jobs before stopping """
+    service = _get_service(server, tmp_path, parse_workers=2)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=service.serve, args=(stop_event, 0.05))
+    thread.start()
+    submit_job(str(tmp_path), [OUTPUT], run_id=1)
+    for _ in range(200):
+        if service.published_jobs:
+            break
+        stop_event.wait(0.05)
+    stop_event.set()
+    thread.join()
+    service.close()
+    assert service.published_jobs == 1
+    assert server.added_results == 6
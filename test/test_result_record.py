@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`result_record` """
+import pickle
+import sys
+
+import pytest
+
+from result_record import ResultRecord
+
+RESULT = {'id': 'C1234', 'status': 'FAIL', 'name': 'Test', 'comment': 'ERROR!', 'duration': 2}
+
+
+def test_mapping():
+    """ A record behaves as the dict of a result """
+    record = ResultRecord('C1234', 'FAIL', 'Test', 'ERROR!', 2)
+    assert record == RESULT
+    assert dict(record) == RESULT
+    assert record.get('comment') == 'ERROR!'
+    assert 'suite' not in record
+
+    record['suite'] = 'Suite'
+    assert record == dict(RESULT, suite='Suite')
+    assert record.pop('suite') == 'Suite'
+    assert record == RESULT
+
+    with pytest.raises(KeyError):
+        record['version'] = '1.0'
+    with pytest.raises(KeyError):
+        del record['id']
+
+
+@pytest.mark.parametrize('testcase_id, case_id', [('C1234', 1234), ('1234', 1234), ('test', None), (None, None)])
+def test_case_id(testcase_id, case_id):
+    """ Test Case ID is parsed once, and again when changed """
+    record = ResultRecord(testcase_id, 'PASS', 'Test')
+    assert record.case_id == case_id
+    record['id'] = 'C42'
+    assert record.case_id == 42
+
+
+def test_pickle():
+    """ A record is pickled with its parsed ID, suite and attachments """
+    record = ResultRecord(None, 'PASS', 'Test', suite='Suite')
+    record['id'] = 'C3'
+    record.attachments = ['screenshot.png']
+    copy = pickle.loads(pickle.dumps(record))
+    assert copy == record
+    assert copy.case_id == 3
+    assert copy['suite'] == 'Suite'
+    assert copy.attachments == ['screenshot.png']
+
+
+def test_smaller_than_dict():
+    """ A record takes less memory than the dict of a result """
+    record = ResultRecord('C1234', 'FAIL', 'Test', 'ERROR!', 2)
+    assert sys.getsizeof(record) < sys.getsizeof(dict(RESULT))
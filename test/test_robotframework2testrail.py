@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 """ Test of mod:`robotframework2testrail` """
+import io
+import logging
 import os
+import subprocess
+import sys
 from unittest.mock import Mock, call
 
+import pytest
+import robot
+from robot.api import ResultVisitor
+
 import robotframework2testrail
+from parse_cache import ParseCache
+from result_visitor import TRACE_LINE_LIMIT, TRACE_MAX_KEYWORDS, format_trace
+from testrail import APIError
 from testrail_utils import TestRailApiUtils
 
 TESTRAIL_URL = 'https://example.testrail.net'
@@ -54,23 +65,194 @@ def test_get_testcases():
     assert results == RESULTS
 
 
+def test_iter_testcases():
+    """ Test of function `iter_testcases` """
+    results = robotframework2testrail.iter_testcases(os.path.join(robotframework2testrail.PATH, 'test', 'output.xml'))
+    assert not isinstance(results, list)
+    assert list(results) == RESULTS
+
+
+@pytest.fixture(scope='module')
+def examples_output(tmp_path_factory):
+    """ Return path of the output of `test/examples` executed with installed Robot Framework """
+    outputdir = tmp_path_factory.mktemp('examples')
+    robot.run(
+        os.path.join(robotframework2testrail.PATH, 'test', 'examples'),
+        outputdir=str(outputdir),
+        log=None,
+        report=None,
+        stdout=io.StringIO(),
+        stderr=io.StringIO())
+    return str(outputdir / 'output.xml')
+
+
+@pytest.mark.parametrize('parser', robotframework2testrail.PARSERS)
+def test_get_testcases_attachments(tmp_path, parser):
+    """ Files referenced by HTML messages of failed tests, and log.html, are attachments of their results """
+    (tmp_path / 'screenshots').mkdir()
+    (tmp_path / 'screenshots' / 'shot 1.png').write_bytes(b'PNG')
+    (tmp_path / 'suite.robot').write_text('\n'.join([
+        '*** Test Cases ***',
+        'Failed',
+        '    [Tags]    test_case_id=C1',
+        '    Log    <a href="screenshots/shot%201.png"><img src="screenshots/shot%201.png"></a>    html=True',
+        '    Log    <img src="data:image/png;base64,AAAA"> <a href="https://example.com">link</a>    html=True',
+        '    Fail    Error',
+        'Passed',
+        '    [Tags]    test_case_id=C2',
+        '    Log    <img src="screenshots/shot%201.png">    html=True',
+    ]), encoding='UTF-8')
+    robot.run(str(tmp_path / 'suite.robot'), outputdir=str(tmp_path), report=None, stdout=io.StringIO())
+    results = robotframework2testrail.get_testcases(str(tmp_path / 'output.xml'), parser=parser, attachments=True)
+    assert [result.attachments for result in results] == [
+        [str(tmp_path / 'screenshots' / 'shot 1.png'), str(tmp_path / 'log.html')], ()
+    ]
+    results = robotframework2testrail.get_testcases(str(tmp_path / 'output.xml'), parser=parser)
+    assert [result.attachments for result in results] == [(), ()]
+
+
+@pytest.mark.parametrize('parser', robotframework2testrail.PARSERS)
+def test_get_testcases_failure_trace(tmp_path, parser):
+    """ Chain of failed keywords of failed tests is added to their comment, whatever the parser """
+    (tmp_path / 'suite.robot').write_text('\n'.join([
+        '*** Test Cases ***',
+        'Failed',
+        '    [Tags]    test_case_id=C1',
+        '    Log    Passed keyword',
+        '    Check Value    42',
+        'Passed',
+        '    [Tags]    test_case_id=C2',
+        '    Check Value    0',
+        '*** Keywords ***',
+        'Check Value',
+        '    [Arguments]    ${value}',
+        '    Should Be Equal As Integers    ${value}    0',
+    ]), encoding='UTF-8')
+    robot.run(str(tmp_path / 'suite.robot'), outputdir=str(tmp_path), report=None, log=None, stdout=io.StringIO())
+    output = str(tmp_path / 'output.xml')
+    results = robotframework2testrail.get_testcases(output, parser=parser, failure_trace=True)
+    assert results[0]['comment'].split('\n')[-3:] == [
+        '# Failed keywords: #', '    Check Value    42', '      BuiltIn.Should Be Equal As Integers    ${value}    0'
+    ]
+    assert results[1]['comment'] is None
+    assert '# Failed keywords: #' not in robotframework2testrail.get_testcases(output, parser=parser)[0]['comment']
+
+
+def test_format_trace():
+    """ Long traces are truncated: number of keywords and length of lines """
+    keywords = [('Keyword %d' % index, ['argument']) for index in range(15)]
+    keywords[-1] = ('Innermost', ['x' * 300])
+    lines = format_trace(keywords).split('\n')
+    assert len(lines) == TRACE_MAX_KEYWORDS
+    assert lines[:2] == ['Keyword 0    argument', '  Keyword 1    argument']
+    assert lines[-2] == '  ' * (TRACE_MAX_KEYWORDS - 2) + '...'
+    assert lines[-1].startswith('  ' * (TRACE_MAX_KEYWORDS - 1) + 'Innermost    xxx')
+    assert len(lines[-1]) == TRACE_LINE_LIMIT and lines[-1].endswith('...')
+
+
+@pytest.mark.parametrize('output', ['output.xml', 'examples'])
+def test_parsers_parity(output, examples_output):    # pylint: disable=redefined-outer-name
+    """ Both parsers return the same results, for old (RF 3) and current Robot Framework outputs """
+    if output == 'examples':
+        xml_output = examples_output
+    else:
+        xml_output = os.path.join(robotframework2testrail.PATH, 'test', output)
+    results = robotframework2testrail.get_testcases(xml_output, parser='stream')
+    assert results
+    assert results == robotframework2testrail.get_testcases(xml_output, parser='visitor')
+
+
+def test_expand_outputs(tmp_path):
+    """ Test of function `expand_outputs` """
+    for name in ('output-2.xml', 'output-1.xml', 'log.html'):
+        (tmp_path / name).write_text('')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'output-3.xml').write_text('')
+    output_1 = str(tmp_path / 'output-1.xml')
+    assert robotframework2testrail.expand_outputs([output_1, str(tmp_path / '**' / 'output*.xml')]) == [
+        output_1, str(tmp_path / 'output-2.xml'), str(tmp_path / 'sub' / 'output-3.xml')
+    ]
+    with pytest.raises(ValueError):
+        robotframework2testrail.expand_outputs([str(tmp_path / '*.json')])
+    with pytest.raises(ValueError):
+        robotframework2testrail.expand_outputs([str(tmp_path / 'output.xml')])
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_get_testcases_from_files(max_workers, examples_output):    # pylint: disable=redefined-outer-name
+    """ Test of function `get_testcases_from_files` """
+    output = os.path.join(robotframework2testrail.PATH, 'test', 'output.xml')
+    results = robotframework2testrail.get_testcases_from_files([output, examples_output, output],
+                                                                parser='stream',
+                                                                max_workers=max_workers)
+    assert len(results) == 3
+    assert results[0] == results[2] == RESULTS
+    assert results[1] == robotframework2testrail.get_testcases(examples_output)
+
+
+def test_get_testcases_from_files_cached(tmp_path, examples_output):    # pylint: disable=redefined-outer-name
+    """ Only outputs not cached are parsed """
+    output = os.path.join(robotframework2testrail.PATH, 'test', 'output.xml')
+    cache = ParseCache(str(tmp_path))
+    cache.set(output, 'stream', False, RESULTS[:1])
+    results = robotframework2testrail.get_testcases_from_files([output, examples_output], parser='stream', cache=cache)
+    assert results == [RESULTS[:1], robotframework2testrail.get_testcases(examples_output, parser='stream')]
+    assert cache.get(examples_output, 'stream') == results[1]
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('all', RESULTS + [{'id': 'C344', 'status': 'PASS'}, {'id': '366', 'status': 'FAIL'}]),
+    ('first', [RESULTS[0]] + RESULTS[2:]),
+    ('last', [{'id': 'C344', 'status': 'PASS'}] + RESULTS[2:3] + [{'id': '366', 'status': 'FAIL'}] + RESULTS[4:]),
+    ('worst', [RESULTS[1]] + RESULTS[2:3] + [{'id': '366', 'status': 'FAIL'}] + RESULTS[4:]),
+])
+def test_merge_testcases(policy, expected):
+    """ Test of function `merge_testcases` """
+    other_shard = [{'id': 'C344', 'status': 'PASS'}, {'id': '366', 'status': 'FAIL'}]
+    assert robotframework2testrail.merge_testcases([RESULTS, other_shard], policy) == expected
+
+
+def test_get_api():
+    """ Test of function `get_api` """
+    config = io.StringIO('[API]\nurl = {}\nemail = user@example.com\npassword = key\nmax_attempts = 3\n'
+                         'rate_limit = 2.5\nrate_burst = 5\ncompress_requests = yes\n'.format(TESTRAIL_URL))
+    api = robotframework2testrail.get_api(config, password='other_key')
+    assert (api.user, api.password) == ('user@example.com', 'other_key')
+    assert api.retry_policy.max_attempts == 3
+    assert (api.rate_limiter.rate, api.rate_limiter.capacity) == (2.5, 5)
+    assert api.compress_requests is True
+
+    config = io.StringIO('[API]\nurl = {}\nemail = user@example.com\npassword = key\n'.format(TESTRAIL_URL))
+    api = robotframework2testrail.get_api(config)
+    assert api.password == 'key'
+    assert api.retry_policy.max_attempts == 5
+    assert api.rate_limiter is None
+    assert api.compress_requests is False
+
+
+def _mock_api():
+    """ Return a mocked API where `add_results` returns one result per testcase """
+    api = Mock()
+    api.add_results.side_effect = lambda run_id, version, testcases: [{'id': 1}] * len(testcases)
+    return api
+
+
 def test_publish_testrun():
     """ Test of function `publish_results` """
-    api = Mock()
-    api.get_tests.return_value = [{'case_id': 344}, {'case_id': 345}]    # Other case_ids are missing
+    api = _mock_api()
+    api.iter_tests.return_value = [{'case_id': 344}, {'case_id': 345}]    # Other case_ids are missing
     testrun_id = 100
-    robotframework2testrail.publish_results(api, RESULTS, run_id=testrun_id, version='1.2.3.4')
+    assert robotframework2testrail.publish_results(api, RESULTS, run_id=testrun_id, version='1.2.3.4') is True
     api.is_testrun_available.assert_called_with(testrun_id)
-    assert api.add_result.call_args_list[0] == call(testrun_id, RESULTS[0])
-    assert api.add_result.call_args_list[1] == call(testrun_id, RESULTS[1])
-    assert api.add_result.call_args_list[2] == call(testrun_id, RESULTS[2])
-    assert len(api.add_result.call_args_list) == 3    # Other case_ids are missing so not published
+    # Other case_ids are missing so not published
+    api.add_results.assert_called_once_with(testrun_id, '1.2.3.4', RESULTS[0:3])
 
 
-def test_publish_testplan():
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_publish_testplan(max_workers):
     """ Test of function `publish_results` """
-    api = Mock()
-    api.get_tests.return_value = [{
+    api = _mock_api()
+    api.iter_tests.return_value = [{
         'case_id': 9876
     }, {
         'case_id': 344
@@ -82,24 +264,62 @@ def test_publish_testplan():
         'case_id': 348
     }]
     api.get_available_testruns.return_value = [101, 102]
-    robotframework2testrail.publish_results(api, RESULTS, plan_id=100)
-    assert api.add_result.call_args_list[0] == call(101, RESULTS[0])
-    assert api.add_result.call_args_list[1] == call(101, RESULTS[1])
-    assert api.add_result.call_args_list[2] == call(101, RESULTS[2])
-    assert api.add_result.call_args_list[3] == call(101, RESULTS[3])
-    assert api.add_result.call_args_list[4] == call(101, RESULTS[5])
-    assert api.add_result.call_args_list[5] == call(102, RESULTS[0])
-    assert api.add_result.call_args_list[6] == call(102, RESULTS[1])
-    assert api.add_result.call_args_list[7] == call(102, RESULTS[2])
-    assert api.add_result.call_args_list[8] == call(102, RESULTS[3])
-    assert api.add_result.call_args_list[9] == call(102, RESULTS[5])
+    assert robotframework2testrail.publish_results(api, RESULTS, plan_id=100, max_workers=max_workers) is True
+    expected = RESULTS[0:4] + RESULTS[5:]
+    assert sorted(api.add_results.call_args_list) == [call(101, '', expected), call(102, '', expected)]
+
+
+def test_publish_testplan_errors(caplog):
+    """ Errors in a Test Run don't prevent publishing in other Test Runs of the Test Plan, and are logged """
+    api = _mock_api()
+    api.iter_tests.return_value = [{'case_id': 344}]
+    api.get_available_testruns.return_value = [101, 102, 103]
+    api.is_testrun_available.side_effect = lambda run_id: run_id != 103
+
+    def add_results(run_id, _version, testcases):
+        if run_id == 101:
+            raise APIError('TestRail API returned HTTP 500')
+        return [{'id': 1}] * len(testcases)
+
+    api.add_results.side_effect = add_results
+    caplog.set_level(logging.INFO)
+    outcomes = robotframework2testrail.publish_testplan(api, RESULTS, 100, max_workers=3)
+    assert list(outcomes) == [101, 102, 103]
+    assert isinstance(outcomes[101], APIError)
+    assert outcomes[102] == 2
+    assert outcomes[103] is None
+    assert 'Test Plan #100: 2 result(s) published in 1/3 Test Run(s)' in caplog.messages
+    assert 'Test Run #103 is not available' in caplog.messages
+    assert robotframework2testrail.publish_results(api, RESULTS, plan_id=100, max_workers=3) is True
+
+
+def test_publish_targets(caplog):
+    """ Test Runs of all targets are published once, with a summary per target """
+    api = _mock_api()
+    api.iter_tests.return_value = [{'case_id': 344}]
+    api.is_testrun_available.side_effect = lambda run_id: run_id != 103
+    api.is_testplan_available.side_effect = lambda plan_id: plan_id != 202
+    api.get_available_testruns.side_effect = lambda plan_id: {200: [101, 100], 201: [102, 101]}[plan_id]
+    caplog.set_level(logging.INFO)
+    assert robotframework2testrail.publish_targets(
+        api, RESULTS, run_ids=[100, 100], plan_ids=[200, 201], version='1.0', max_workers=2) is True
+    assert sorted(call_args[0][0] for call_args in api.add_results.call_args_list) == [100, 101, 102]
+    assert 'Publish in 3 Test Run(s) of 3 target(s)' in caplog.messages
+    assert 'Test Plan #200: 4 result(s) published in 2/2 Test Run(s) (2 shared with other targets)' in caplog.messages
+    assert 'Test Plan #201: 4 result(s) published in 2/2 Test Run(s) (1 shared with other targets)' in caplog.messages
+
+    api.add_results.reset_mock()
+    assert robotframework2testrail.publish_targets(api, RESULTS, run_ids=[103], plan_ids=[202, 200]) is False
+    assert sorted(call_args[0][0] for call_args in api.add_results.call_args_list) == [100, 101]
+    assert 'Test Run #103 is not available' in caplog.messages
+    assert 'Test Plan #202 is not available' in caplog.messages
 
 
 def test_dont_publish_blocked():
     """ Test when blocked testcases are not published """
-    api = Mock()
+    api = _mock_api()
     testrun_id = 100
-    api.get_tests.return_value = [{
+    api.iter_tests.return_value = [{
         'case_id': 344,
         'status_id': 1
     }, {
@@ -111,7 +331,92 @@ def test_dont_publish_blocked():
     }]
     api.extract_testcase_id = TestRailApiUtils.extract_testcase_id    # don't mock this method
     robotframework2testrail.publish_results(api, RESULTS, run_id=100, publish_blocked=False)
-    assert len(api.add_result.call_args_list) == 3
-    assert api.add_result.call_args_list[0] == call(testrun_id, RESULTS[0])
-    assert api.add_result.call_args_list[1] == call(testrun_id, RESULTS[1])
-    assert api.add_result.call_args_list[2] == call(testrun_id, RESULTS[5])
+    api.add_results.assert_called_once_with(testrun_id, '', [RESULTS[0], RESULTS[1], RESULTS[5]])
+
+
+def test_publish_skip_unchanged():
+    """ Results whose status is already the status of the test are not published """
+    api = _mock_api()
+    api.iter_tests.return_value = [{
+        'case_id': 344,
+        'status_id': 1
+    }, {
+        'case_id': 345,
+        'status_id': 1
+    }, {
+        'case_id': 366,
+        'status_id': 3
+    }]
+    robotframework2testrail.publish_results(api, RESULTS, run_id=100, skip_unchanged=True)
+    # C344 failed once and C366 is untested
+    api.add_results.assert_called_once_with(100, '', [RESULTS[1], RESULTS[3]])
+
+
+def test_publish_skip_unchanged_nothing_to_send():
+    """ No request is sent when all results are unchanged """
+    api = _mock_api()
+    api.iter_tests.return_value = [{'case_id': 345, 'status_id': 1}]
+    assert robotframework2testrail.publish_results(api, RESULTS, run_id=100, skip_unchanged=True) is True
+    api.add_results.assert_not_called()
+
+
+def test_publish_new_testrun():
+    """ A Test Run of Test Cases of results is created in project, then results are published without reading tests """
+    api = _mock_api()
+    api.extract_testcase_id = TestRailApiUtils.extract_testcase_id
+    api.add_run.return_value = {'id': 500}
+    assert robotframework2testrail.publish_new_testrun(api, RESULTS, 'Nightly', project_id=3, version='1.0') == 500
+    api.add_run.assert_called_once_with(3, 'Nightly', [344, 345, 366, 347, 348], None)
+    api.add_results.assert_called_once_with(500, '1.0', RESULTS)
+    api.iter_tests.assert_not_called()
+    api.get_tests.assert_not_called()
+
+
+def test_publish_new_testrun_unidentified():
+    """ Results without valid Test Case ID are not published in the created Test Run """
+    api = _mock_api()
+    api.extract_testcase_id = TestRailApiUtils.extract_testcase_id
+    api.add_run.return_value = {'id': 500}
+    results = RESULTS + [{'id': 'C-none', 'status': 'PASS'}]
+    assert robotframework2testrail.publish_new_testrun(api, results, 'Nightly', project_id=3) == 500
+    api.add_results.assert_called_once_with(500, '', RESULTS)
+
+    api.add_results.return_value = None    # Results not encoded
+    assert robotframework2testrail.publish_new_testrun(api, results, 'Nightly', project_id=3) == 500
+
+
+def test_publish_new_testrun_in_testplan():
+    """ A Test Run is created in Test Plan, in the suite of the first Test Case if not given """
+    api = _mock_api()
+    api.extract_testcase_id = TestRailApiUtils.extract_testcase_id
+    api.get_case.return_value = {'id': 344, 'suite_id': 8}
+    api.add_plan_entry.return_value = {'id': 501}
+    assert robotframework2testrail.publish_new_testrun(api, RESULTS, 'Nightly', plan_id=200) == 501
+    api.is_testplan_available.assert_called_once_with(200)
+    api.get_case.assert_called_once_with(344)
+    api.add_plan_entry.assert_called_once_with(200, 8, 'Nightly', [344, 345, 366, 347, 348])
+    api.add_results.assert_called_once_with(501, '', RESULTS)
+
+
+def test_publish_new_testrun_error():
+    """ Nothing is published if Test Run can't be created """
+    api = _mock_api()
+    api.extract_testcase_id = TestRailApiUtils.extract_testcase_id
+    api.add_run.side_effect = APIError('TestRail API returned HTTP 400 ("Field :case_ids contains invalid cases")')
+    assert robotframework2testrail.publish_new_testrun(api, RESULTS, 'Nightly', project_id=3) == 0
+    api.add_results.assert_not_called()
+
+
+def test_lazy_import(tmp_path):
+    """ Importing the module as a library doesn't import Robot Framework and optional modules, nor write a log file """
+    script = 'import sys, robotframework2testrail; print(sorted(set(sys.modules) & {"robot", "colorama", "asyncio"}))'
+    path = os.path.dirname(os.path.abspath(robotframework2testrail.__file__))
+    process = subprocess.run([sys.executable, '-c', script],
+                             cwd=str(tmp_path),
+                             env=dict(os.environ, PYTHONPATH=path),
+                             stdout=subprocess.PIPE,
+                             universal_newlines=True,
+                             check=True)
+    assert process.stdout.strip() == '[]'
+    assert not list(tmp_path.iterdir())
+    assert issubclass(robotframework2testrail.TestRailResultVisitor, ResultVisitor)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`testrail` """
+import base64
+import http.client
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import testrail
+from benchmark.fake_testrail import DROP_CONNECTION, FakeTestRail
+
+
+@pytest.fixture
+def server():
+    """ Return a running stand-in of TestRail API """
+    with FakeTestRail() as fake:
+        fake.responses['get_run/1'] = {'id': 1, 'is_completed': False}
+        yield fake
+
+
+@pytest.fixture
+def client(server):    # pylint: disable=redefined-outer-name
+    """ Return a client connected to the stand-in server """
+    inst = testrail.APIClient(server.url)
+    inst.user = 'user@example.com'
+    inst.password = 'api_key'
+    yield inst
+    inst.close()
+
+
+def test_connection_reused(server, client):    # pylint: disable=redefined-outer-name
+    """ Several requests are sent on the same kept-alive connection """
+    server.responses['add_results_for_cases/1'] = [[{'id': 10}]]
+    for _ in range(5):
+        assert client.send_get('get_run/1') == {'id': 1, 'is_completed': False}
+    assert client.send_post('add_results_for_cases/1', {'results': []}) == [{'id': 10}]
+    assert len(server.requests) == 6
+    assert server.connections == 1
+    assert server.requests[-1].data == {'results': []}
+
+
+def test_connection_closed_by_server(server, client):    # pylint: disable=redefined-outer-name
+    """ A new connection is opened when server doesn't keep the connection alive """
+    server.responses['get_run/2'] = (200, {'id': 2}, {'Connection': 'close'})
+    client.send_get('get_run/2')
+    client.send_get('get_run/1')
+    client.send_get('get_run/1')
+    assert server.connections == 2
+
+
+def test_connection_dropped_after_post(server, client):    # pylint: disable=redefined-outer-name
+    """ A POST on a reused connection dropped once the request is processed is not sent again, unlike a GET """
+    server.responses['add_results_for_cases/1'] = [DROP_CONNECTION, []]
+    server.responses['get_run/2'] = [DROP_CONNECTION, {'id': 2}]
+    client.retry_policy = testrail.RetryPolicy(max_attempts=3, backoff=0.01)
+    client.send_get('get_run/1')
+    with pytest.raises(http.client.RemoteDisconnected):
+        client.send_post('add_results_for_cases/1', {'results': []})
+    client.send_get('get_run/1')
+    assert client.send_get('get_run/2') == {'id': 2}
+    assert [request.uri for request in server.requests] == [
+        'get_run/1', 'add_results_for_cases/1', 'get_run/1', 'get_run/2', 'get_run/2'
+    ]
+
+
+def test_auth_header(server, client):    # pylint: disable=redefined-outer-name
+    """ Authorization header follows credentials """
+    client.send_get('get_run/1')
+    client.password = 'new_key'
+    client.send_get('get_run/1')
+    auths = [request.headers['Authorization'] for request in server.requests]
+    assert auths == [
+        'Basic ' + base64.b64encode(b'user@example.com:api_key').decode(),
+        'Basic ' + base64.b64encode(b'user@example.com:new_key').decode()
+    ]
+
+
+def test_request_timing(client):    # pylint: disable=redefined-outer-name
+    """ Timing of each request is exposed """
+    timings = []
+    client.timing_callback = timings.append
+    client.send_get('get_run/1')
+    client.send_get('get_run/1')
+    assert [(timing.method, timing.uri, timing.status, timing.reused) for timing in timings] == [
+        ('GET', 'get_run/1', 200, False), ('GET', 'get_run/1', 200, True)
+    ]
+    assert all(timing.elapsed > 0 for timing in timings)
+    assert client.last_timing == timings[-1]
+
+
+def test_request_timing_sizes_and_retries(server, client):    # pylint: disable=redefined-outer-name
+    """ Timing exposes sizes of bodies, attempt and time waited before a retry """
+    server.responses['add_results_for_cases/1'] = [(503, None), [{'id': 10}]]
+    client.retry_policy = testrail.RetryPolicy(backoff=0.01, jitter=0)
+    timings = []
+    client.timing_callback = timings.append
+    client.send_post('add_results_for_cases/1', {'results': []})
+    assert [(timing.status, timing.attempt, timing.sent, timing.received) for timing in timings] == [
+        (503, 1, len(b'{"results": []}'), 0), (200, 2, len(b'{"results": []}'), len(b'[{"id": 10}]'))
+    ]
+    assert timings[0].backoff == 0
+    assert timings[1].backoff > 0
+
+
+def test_upload_streamed(server, client, tmp_path):    # pylint: disable=redefined-outer-name
+    """ Files are uploaded in multipart bodies read by blocks, sent again on retries """
+    path = tmp_path / 'screenshot.png'
+    path.write_bytes(bytes(range(256)) * 1000)
+    body = testrail.MultipartFile(str(path), block_size=100000)
+    assert [len(block) for block in body][1:-1] == [100000, 100000, 56000]
+    assert sum(len(block) for block in body) == len(body)
+
+    server.responses['add_attachment_to_result/7'] = [(503, None), {'attachment_id': 1}]
+    client.retry_policy = testrail.RetryPolicy(backoff=0.01)
+    timings = []
+    client.timing_callback = timings.append
+    assert client.send_post('add_attachment_to_result/7', str(path)) == {'attachment_id': 1}
+    assert [request.data for request in server.requests] == [{
+        'name': 'attachment',
+        'filename': 'screenshot.png',
+        'content': path.read_bytes()
+    }] * 2
+    assert timings[1].sent > 256000
+
+
+def test_compressed_requests(server, client):    # pylint: disable=redefined-outer-name
+    """ Large request bodies are compressed if enabled, responses are decompressed """
+    server.gzip = True
+    server.responses['add_results_for_cases/1'] = lambda request: [{'id': 10, 'comment': 'x' * 2000}]
+    client.compress_requests = True
+    timings = []
+    client.timing_callback = timings.append
+    data = {'results': [{'case_id': case_id, 'status_id': 1} for case_id in range(100)]}
+    assert client.send_post('add_results_for_cases/1', data) == [{'id': 10, 'comment': 'x' * 2000}]
+    assert server.requests[-1].data == data
+    assert server.requests[-1].headers['Content-Encoding'] == 'gzip'
+    assert timings[-1].sent < len(json.dumps(data))
+    assert timings[-1].received < 2000
+
+    client.send_post('add_results_for_cases/1', {'results': []})    # Too small to be compressed
+    assert 'Content-Encoding' not in server.requests[-1].headers
+
+
+def test_compressed_requests_refused(server, client):    # pylint: disable=redefined-outer-name
+    """ Compression is disabled, and request sent again uncompressed, if server doesn't accept it """
+    server.responses['add_results_for_cases/1'] = [[{'id': 10}]]
+    client.compress_requests = True
+    client.retry_policy = testrail.RetryPolicy(max_attempts=1)
+    data = {'results': [{'case_id': case_id, 'status_id': 1} for case_id in range(100)]}
+    assert client.send_post('add_results_for_cases/1', data) == [{'id': 10}]
+    assert client.compress_requests is False
+    assert [request.data for request in server.requests] == [data]
+
+
+def test_send_get_fields(server, client):    # pylint: disable=redefined-outer-name
+    """ Fields of a successful response are projected, not the ones of an error """
+    assert client.send_get('get_run/1', fields={'is_completed'}) == {'is_completed': False}
+    with pytest.raises(testrail.APIError, match='Unknown method'):
+        client.send_get('get_run/2', fields={'is_completed'})
+
+
+def test_api_error(client):    # pylint: disable=redefined-outer-name
+    """ HTTP errors raise `APIError` with the message of TestRail """
+    with pytest.raises(testrail.APIError, match='HTTP 400 \\("Unknown method"\\)'):
+        client.send_get('get_run/3')
+    assert client.send_get('get_run/1')['id'] == 1
+
+
+def test_retry_transient_errors(server, client):    # pylint: disable=redefined-outer-name
+    """ Requests failing with HTTP 429 or 5xx are sent again, without recursion """
+    client.retry_policy = testrail.RetryPolicy(max_attempts=4, backoff=0.01)
+    server.responses['get_run/2'] = [(503, {'error': 'Maintenance'}), (429, {}, {'Retry-After': '0'}),
+                                     (502, None), {'id': 2}]
+    assert client.send_get('get_run/2') == {'id': 2}
+    assert len(server.requests) == 4
+
+
+def test_retry_max_attempts(server, client):    # pylint: disable=redefined-outer-name
+    """ Errors are raised once all attempts failed, or for non-retryable status """
+    client.retry_policy = testrail.RetryPolicy(max_attempts=3, backoff=0.01)
+    server.responses['get_run/2'] = [(503, {'error': 'Maintenance'})]
+    with pytest.raises(testrail.APIError, match='HTTP 503'):
+        client.send_get('get_run/2')
+    assert len(server.requests) == 3
+
+    server.responses['get_run/3'] = [(403, {'error': 'Forbidden'}), {'id': 3}]
+    with pytest.raises(testrail.APIError, match='HTTP 403'):
+        client.send_get('get_run/3')
+    assert len(server.requests) == 4
+
+
+def test_retry_connection_error():
+    """ Connection errors are retried """
+    with FakeTestRail() as fake:
+        url = fake.url    # Port is free once server is stopped
+    inst = testrail.APIClient(url)
+    inst.retry_policy = testrail.RetryPolicy(max_attempts=2, backoff=0.01)
+    with mock.patch('testrail.time.sleep') as sleep:
+        with pytest.raises(ConnectionRefusedError):
+            inst.send_get('get_run/1')
+        with pytest.raises(ConnectionRefusedError):
+            inst.send_post('add_results_for_cases/1', {'results': []})    # Not sent: retried too
+    assert sleep.call_count == 2
+
+
+def test_retry_sent_posts(server):    # pylint: disable=redefined-outer-name
+    """ A POST that may have been processed (timeout once sent, HTTP 502) is not sent again, unlike a GET or a
+        POST refused with HTTP 503, unless `retry_sent_posts` is set
+    """
+    server.responses['add_results_for_cases/1'] = lambda request: time.sleep(0.3) or []
+    server.responses['add_results_for_cases/2'] = [(503, {}), (502, {}), []]
+    server.responses['get_run/2'] = [lambda request: time.sleep(0.3) or {}, {'id': 2}]
+    inst = testrail.APIClient(server.url, timeout=0.1)
+    inst.retry_policy = testrail.RetryPolicy(max_attempts=3, backoff=0.01)
+    with pytest.raises(TimeoutError):
+        inst.send_post('add_results_for_cases/1', {'results': []})
+    assert len(server.requests) == 1
+    assert inst.send_get('get_run/2') == {'id': 2}
+    assert len(server.requests) == 3
+    with pytest.raises(testrail.APIError, match='HTTP 502'):
+        inst.send_post('add_results_for_cases/2', {'results': []})
+    assert len(server.requests) == 5
+
+    inst.retry_policy.retry_sent_posts = True
+    with pytest.raises(TimeoutError):
+        inst.send_post('add_results_for_cases/1', {'results': []})
+    assert len(server.requests) == 8
+    inst.close()
+
+
+def test_rate_limiter(server, client):    # pylint: disable=redefined-outer-name
+    """ A token bucket shared by threads paces requests """
+    client.rate_limiter = testrail.TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    threads = [threading.Thread(target=client.send_get, args=('get_run/1', )) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(server.requests) == 12
+    assert time.monotonic() - start >= 10 / 50 * 0.9    # 2 requests at once, then 50 per second
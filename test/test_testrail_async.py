@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`testrail_async` """
+import asyncio
+import threading
+import time
+
+import pytest
+
+import testrail
+from benchmark.fake_testrail import DROP_CONNECTION, FakeTestRail
+from testrail_async import AsyncTestRailApiUtils, publish_results_async, publish_targets_async
+from testrail_cache import MetadataCache
+from testrail_utils import BatchError
+
+
+@pytest.fixture
+def server():
+    """ Return a running stand-in of TestRail API """
+    with FakeTestRail() as fake:
+        fake.responses['get_run/1'] = {'id': 1, 'is_completed': False}
+        yield fake
+
+
+def _run(server, coroutine_function, **kwargs):    # pylint: disable=redefined-outer-name
+    """ Run `coroutine_function(api)` with a client connected to the stand-in server """
+
+    async def _main():
+        api = AsyncTestRailApiUtils(server.url, **kwargs)
+        api.user = 'user@example.com'
+        api.password = 'api_key'
+        api.retry_policy = testrail.RetryPolicy(max_attempts=3, backoff=0.01)
+        try:
+            return await coroutine_function(api)
+        finally:
+            await api.close()
+
+    return asyncio.run(_main())
+
+
+def test_connection_reused(server):    # pylint: disable=redefined-outer-name
+    """ Sequential requests are sent on the same kept-alive connection """
+    server.responses['add_results_for_cases/1'] = [[{'id': 10}]]
+
+    async def _requests(api):
+        runs = [await api.send_get('get_run/1') for _ in range(5)]
+        return runs, await api.send_post('add_results_for_cases/1', {'results': []})
+
+    runs, results = _run(server, _requests)
+    assert runs == [{'id': 1, 'is_completed': False}] * 5
+    assert results == [{'id': 10}]
+    assert server.connections == 1
+    assert server.requests[-1].data == {'results': []}
+
+
+def test_concurrency_bounded(server):    # pylint: disable=redefined-outer-name
+    """ No more than `pool_size` requests are sent at once, and connections are reused """
+    lock = threading.Lock()
+    active = [0, 0]    # current, maximum
+
+    def _slow(request):    # pylint: disable=unused-argument
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {'id': 1}
+
+    server.responses['get_run/1'] = _slow
+
+    async def _requests(api):
+        return await asyncio.gather(*[api.send_get('get_run/1') for _ in range(12)])
+
+    assert len(_run(server, _requests, pool_size=3)) == 12
+    assert active[1] == 3
+    assert server.connections == 3
+
+
+def test_errors(server):    # pylint: disable=redefined-outer-name
+    """ HTTP errors raise `APIError`, transient ones being retried """
+    server.responses['get_run/2'] = [(503, None), {'id': 2}]
+
+    async def _requests(api):
+        run = await api.send_get('get_run/2')
+        with pytest.raises(testrail.APIError, match='Unknown method'):
+            await api.send_get('get_run/3')
+        return run
+
+    assert _run(server, _requests) == {'id': 2}
+    assert [request.uri for request in server.requests] == ['get_run/2', 'get_run/2', 'get_run/3']
+
+
+def test_retry_sent_posts(server):    # pylint: disable=redefined-outer-name
+    """ A POST timing out once sent is not sent again (it may have been processed), unlike a GET """
+    server.responses['add_results_for_cases/1'] = lambda request: time.sleep(0.3) or []
+    server.responses['get_run/2'] = [lambda request: time.sleep(0.3) or {}, {'id': 2}]
+
+    async def _requests(api):
+        with pytest.raises(asyncio.TimeoutError):
+            await api.send_post('add_results_for_cases/1', {'results': []})
+        return await api.send_get('get_run/2')
+
+    assert _run(server, _requests, timeout=0.1) == {'id': 2}
+    assert [request.uri for request in server.requests] == ['add_results_for_cases/1', 'get_run/2', 'get_run/2']
+
+
+def test_connection_dropped_after_post(server):    # pylint: disable=redefined-outer-name
+    """ A POST on a reused connection dropped once the request is processed is not sent again, unlike a GET """
+    server.responses['add_results_for_cases/1'] = [DROP_CONNECTION, []]
+    server.responses['get_run/2'] = [DROP_CONNECTION, {'id': 2}]
+
+    async def _requests(api):
+        await api.send_get('get_run/1')
+        with pytest.raises((ConnectionError, asyncio.IncompleteReadError)):
+            await api.send_post('add_results_for_cases/1', {'results': []})
+        await api.send_get('get_run/1')
+        return await api.send_get('get_run/2')
+
+    assert _run(server, _requests) == {'id': 2}
+    assert [request.uri for request in server.requests] == [
+        'get_run/1', 'add_results_for_cases/1', 'get_run/1', 'get_run/2', 'get_run/2'
+    ]
+
+
+def test_iter_tests_paginated(server):    # pylint: disable=redefined-outer-name
+    """ All pages of tests are read """
+    server.responses['get_tests/1'] = [
+        {'tests': [{'id': 1, 'case_id': 11}], '_links': {'next': '/api/v2/get_tests/1&offset=1'}},
+        {'tests': [{'id': 2, 'case_id': 12}], '_links': {'next': None}},
+    ]
+    tests = _run(server, lambda api: api.get_tests(1))
+    assert [test['case_id'] for test in tests] == [11, 12]
+    assert [request.uri for request in server.requests] == ['get_tests/1', 'get_tests/1&offset=1']
+
+
+def test_compression_and_fields(server):    # pylint: disable=redefined-outer-name
+    """ Compressed requests are sent if accepted by server, responses are decompressed and projected """
+    server.responses['get_tests/1'] = {'tests': [{'id': 1, 'case_id': 11, 'status_id': 3, 'title': 'Test'}]}
+    server.responses['add_results_for_cases/1'] = lambda request: [{'id': result['case_id']}
+                                                                   for result in request.data['results']]
+    testcases = [{'id': 'C%d' % case_id, 'status': 'PASS'} for case_id in range(1, 101)]
+
+    async def _publish(api):
+        api.compress_requests = True
+        tests = await api.get_tests(1)
+        server.gzip = False
+        results = await api.add_results(1, '1.0', testcases)
+        return tests, results, api.compress_requests
+
+    server.gzip = True
+    tests, results, compress_requests = _run(server, _publish)
+    assert tests == [{'id': 1, 'case_id': 11, 'status_id': 3}]
+    assert len(results) == 100
+    assert compress_requests is False    # Refused by server
+    assert [request.uri for request in server.requests] == ['get_tests/1', 'add_results_for_cases/1']
+
+
+def test_add_results_batches(server):    # pylint: disable=redefined-outer-name
+    """ Results are sent in batches, and returned in order """
+    server.responses['add_results_for_cases/1'] = lambda request: [{'id': result['case_id']}
+                                                                   for result in request.data['results']]
+    testcases = [{'id': 'C%d' % case_id, 'status': 'PASS'} for case_id in range(1, 8)]
+
+    async def _add(api):
+        api.batch_size = 3
+        return await api.add_results(1, '1.0', testcases)
+
+    assert _run(server, _add) == [{'id': case_id} for case_id in range(1, 8)]
+    assert sorted(len(request.data['results']) for request in server.requests) == [1, 3, 3]
+
+
+def test_add_results_batch_error(server):    # pylint: disable=redefined-outer-name
+    """ Results of successful batches are kept when a batch fails """
+    server.responses['add_results_for_cases/1'] = lambda request: (400, {'error': 'Bad case'}) if any(
+        result['case_id'] == 2 for result in request.data['results']) else [{'id': 1}]
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}]
+
+    async def _add(api):
+        api.batch_size = 1
+        return await api.add_results(1, '', testcases)
+
+    with pytest.raises(BatchError) as error:
+        _run(server, _add)
+    assert error.value.results == [{'id': 1}]
+    assert [index for index, _ in error.value.errors] == [1]
+    assert len(server.requests) == 2    # Batch with a bad case not sent again
+
+
+def test_add_results_server_down():
+    """ Connection errors are raised as is, not as failed batches """
+    with FakeTestRail() as fake:
+        pass    # Port is free once server is stopped
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}]
+
+    async def _add(api):
+        api.batch_size = 1
+        api.retry_policy = testrail.RetryPolicy(max_attempts=1)
+        return await api.add_results(1, '', testcases)
+
+    with pytest.raises(ConnectionRefusedError):
+        _run(fake, _add)
+
+
+def test_publish_testplan(server):    # pylint: disable=redefined-outer-name
+    """ Results are published in all available Test Runs of a Test Plan """
+    server.responses['get_plan/10'] = {
+        'is_completed': False,
+        'entries': [{'runs': [{'id': 1, 'is_completed': False}, {'id': 2, 'is_completed': False}]},
+                    {'runs': [{'id': 3, 'is_completed': True}]}]
+    }
+    server.responses['get_run/2'] = {'id': 2, 'is_completed': False}
+    server.responses['get_tests/1'] = [[{'id': 100, 'case_id': 1, 'status_id': 3}]]
+    server.responses['get_tests/2'] = [[{'id': 200, 'case_id': 2, 'status_id': 2}]]
+    server.responses['add_results_for_cases/1'] = [[{'id': 1000}]]
+    server.responses['add_results_for_cases/2'] = [[{'id': 2000}]]
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}]
+
+    assert _run(server, lambda api: publish_results_async(api, testcases, plan_id=10, version='1.0')) is True
+    posts = {request.uri: request.data['results'] for request in server.requests if request.method == 'POST'}
+    assert posts == {
+        'add_results_for_cases/1': [{'status_id': 1, 'version': '1.0', 'case_id': 1}],
+        'add_results_for_cases/2': [{'status_id': 5, 'version': '1.0', 'case_id': 2}],
+    }
+
+
+def test_publish_skip_unchanged(server):    # pylint: disable=redefined-outer-name
+    """ Only changed results are published """
+    server.responses['get_tests/1'] = [[{'id': 100, 'case_id': 1, 'status_id': 1},
+                                        {'id': 101, 'case_id': 2, 'status_id': 1}]]
+    server.responses['add_results_for_cases/1'] = [[{'id': 1000}]]
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}]
+
+    assert _run(server, lambda api: publish_results_async(api, testcases, run_id=1, skip_unchanged=True)) is True
+    posts = [request.data['results'] for request in server.requests if request.method == 'POST']
+    assert posts == [[{'status_id': 5, 'case_id': 2}]]
+
+
+def test_publish_targets(server):    # pylint: disable=redefined-outer-name
+    """ Test Runs of several targets are published once each """
+    server.add_run(1, [1, 2])
+    server.add_run(2, [1, 2])
+    server.add_plan(10, [1, 2])
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}]
+    assert _run(server, lambda api: publish_targets_async(api, testcases, run_ids=[1], plan_ids=[10])) is True
+    assert sorted(request.uri for request in server.requests if request.method == 'POST') == [
+        'add_results_for_cases/1', 'add_results_for_cases/2'
+    ]
+    assert server.added_results == 4
+    assert _run(server, lambda api: publish_targets_async(api, testcases, plan_ids=[11])) is False
+
+
+def test_publish_targets_cached(server):    # pylint: disable=redefined-outer-name
+    """ Test Runs and Test Plans are read once, even when a Test Run is checked again before being published """
+    server.add_run(1, [1])
+    server.add_plan(2, [1])
+    testcases = [{'id': 'C1', 'status': 'PASS'}]
+
+    async def _publish(api):
+        api.cache = MetadataCache()
+        return await publish_targets_async(api, testcases, run_ids=[1], plan_ids=[2])
+
+    assert _run(server, _publish) is True
+    gets = [request.uri for request in server.requests if request.uri in ('get_plan/2', 'get_run/1')]
+    assert sorted(gets) == ['get_plan/2', 'get_run/1']
+
+
+def test_publish_unavailable_run(server):    # pylint: disable=redefined-outer-name
+    """ Publishing fails if Test Run is closed """
+    server.responses['get_run/1'] = {'id': 1, 'is_completed': True}
+    assert _run(server, lambda api: publish_results_async(api, [], run_id=1)) is False
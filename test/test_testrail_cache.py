@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`testrail_cache` """
+from unittest.mock import Mock, patch
+
+import testrail_utils as tr
+from testrail_cache import MetadataCache
+
+TESTRAIL_URL = 'https://example.testrail.net'
+
+
+def test_memory_cache():
+    """ Responses are cached in memory until they expire """
+    cache = MetadataCache(ttl=10)
+    fetch = Mock(return_value={'id': 1})
+    assert cache.get_or_fetch('get_run/1', fetch) == {'id': 1}
+    assert cache.get_or_fetch('get_run/1', fetch) == {'id': 1}
+    assert fetch.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with patch('testrail_cache.time.time', return_value=10**10):
+        assert cache.get('get_run/1') is None
+
+
+def test_disk_cache(tmp_path):
+    """ Responses are shared between instances using the same directory """
+    cache = MetadataCache(str(tmp_path), ttl=10)
+    cache.set('get_run/1', {'id': 1})
+    cache.close()
+
+    cache = MetadataCache(str(tmp_path), ttl=10)
+    assert cache.get('get_run/1') == {'id': 1}
+    assert cache.get('get_run/2') is None
+    cache.close()
+
+
+def test_invalidate(tmp_path):
+    """ Responses of a key and of its pages are invalidated """
+    cache = MetadataCache(str(tmp_path))
+    for key in ('get_tests/1', 'get_tests/1&offset=250', 'get_tests/10', 'get_run/1'):
+        cache.set(key, {'key': key})
+    cache.invalidate('get_tests/1')
+    assert [key for key in ('get_tests/1', 'get_tests/1&offset=250', 'get_tests/10', 'get_run/1')
+            if cache.get(key)] == ['get_tests/10', 'get_run/1']
+    cache.close()
+
+    cache = MetadataCache(str(tmp_path))
+    assert cache.get('get_tests/1&offset=250') is None
+    assert cache.get('get_tests/10') == {'key': 'get_tests/10'}
+    cache.invalidate()
+    assert cache.get('get_run/1') is None
+    cache.close()
+
+
+def test_api_uses_cache():
+    """ TestRail metadata is requested once per process """
+    api = tr.TestRailApiUtils(TESTRAIL_URL)
+    api.cache = MetadataCache()
+    api.send_get = Mock()
+    api.send_post = Mock(return_value=[{'id': 1}])
+    api.send_get.return_value = {'is_completed': False, 'entries': [{'runs': [{'id': 1, 'is_completed': False}]}]}
+    assert api.is_testplan_available(10)
+    assert api.get_available_testruns(10) == [1]
+    assert api.is_testrun_available(1)
+    assert api.is_testrun_available(1)
+    assert api.send_get.call_count == 2
+
+    api.send_get.return_value = [{'case_id': 1}]
+    assert api.get_tests(1) == api.get_tests(1) == [{'case_id': 1}]
+    assert api.send_get.call_count == 3
+    api.send_get.assert_called_with('get_tests/1', tr.TESTS_FIELDS)
+
+    # Tests of the Test Run are fetched again once results are added
+    api.add_results(1, '', [{'id': 'C1', 'status': 'PASS'}])
+    api.get_tests(1)
+    assert api.send_get.call_count == 4
+    assert api.cache.get(TESTRAIL_URL + '/get_run/1') == {
+        'is_completed': False,
+        'entries': [{'runs': [{'id': 1, 'is_completed': False}]}]
+    }
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`testrail_http` """
+import gzip
+import json
+
+import testrail_http
+
+
+def test_retry_policy_pause():
+    """ Test of `RetryPolicy.get_pause` """
+    policy = testrail_http.RetryPolicy(backoff=1, max_backoff=5, jitter=0)
+    assert [policy.get_pause(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+    assert policy.get_pause(1, retry_after='30') == 30
+    assert policy.get_pause(2, retry_after='Wed, 21 Oct 2015 07:28:00 GMT') == 2
+    policy.jitter = 0.5
+    assert all(1 <= policy.get_pause(2) <= 2 for _ in range(100))
+
+
+def test_retry_policy_can_retry():
+    """ Non-idempotent requests are retried only if they were not processed, unless `retry_sent_posts` is set """
+    policy = testrail_http.RetryPolicy()
+    assert policy.can_retry('GET') and policy.can_retry('GET', 502)
+    assert not policy.can_retry('GET', 400)
+    assert policy.can_retry('POST', sent=False)
+    assert policy.can_retry('POST', 429) and policy.can_retry('POST', 503)
+    assert not policy.can_retry('POST') and not policy.can_retry('POST', 502) and not policy.can_retry('POST', 400)
+    policy.retry_sent_posts = True
+    assert policy.can_retry('POST') and policy.can_retry('POST', 502)
+    assert not policy.can_retry('POST', 400)
+
+
+def test_decode_response_fields():
+    """ Only requested fields of JSON objects are kept """
+    content = json.dumps({
+        'size': 2,
+        '_links': {'next': None, 'prev': None},
+        'tests': [{'id': 1, 'case_id': 11, 'status_id': 1, 'title': 'Test', 'custom_steps': [{'content': 'Step'}]}]
+    }).encode()
+    assert testrail_http.decode_response(content, fields={'size', '_links', 'next', 'tests', 'id', 'case_id'}) == {
+        'size': 2,
+        '_links': {'next': None},
+        'tests': [{'id': 1, 'case_id': 11}]
+    }
+    assert testrail_http.decode_response(gzip.compress(content), 'gzip') == json.loads(content)
+    assert testrail_http.decode_response(b'') == {}
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Test of module mod:`testrail_listener` """
+import io
+import os
+import time
+from unittest.mock import Mock
+
+import robot
+
+import robotframework2testrail
+from testrail_listener import TestRailListener
+
+
+def _mock_api(case_ids):
+    """ Return a mocked API with a Test Run containing given cases """
+    api = Mock()
+    api.iter_tests.return_value = [{'case_id': case_id, 'status_id': 3} for case_id in case_ids]
+    api.add_results.side_effect = lambda run_id, version, testcases: [{'id': 1}] * len(testcases)
+    return api
+
+
+def _published(api):
+    """ Return the list of results published with `add_results` """
+    return [testcase for args in api.add_results.call_args_list for testcase in args[0][2]]
+
+
+def test_listener_publishes_results():
+    """ Results of an execution are published, with IDs from tags and metadata """
+    api = _mock_api([344, 345, 366, 347])
+    listener = TestRailListener('testrail.cfg', '100', version='1.0', api=api)
+    robot.run(
+        os.path.join(robotframework2testrail.PATH, 'test', 'examples'),
+        listener=listener,
+        output=None,
+        log=None,
+        report=None,
+        stdout=io.StringIO(),
+        stderr=io.StringIO())
+    published = _published(api)
+    assert {call[0][0:2] for call in api.add_results.call_args_list} == {(100, '1.0')}
+    assert [(testcase['id'], testcase['status']) for testcase in published] == [
+        ('C344', 'PASS'), ('C344', 'FAIL'), ('C345', 'PASS'), ('C366', 'PASS'), ('C347', 'FAIL')
+    ]
+    assert published[1]['comment'] == '# Robot Framework result: #\n    Only With Metadata'
+    assert listener.published_count == 5
+
+
+def _end_test(listener, suite_name, metadata, test_name, tags, status='PASS'):
+    # pylint: disable=too-many-arguments
+    """ Simulate the end of a test """
+    suite = robot.result.TestSuite(name=suite_name, metadata=metadata)
+    test = suite.tests.create(name=test_name, tags=tags, status=status)
+    listener.end_test(None, test)
+
+
+def test_listener_batches():
+    """ Results are published by batches of `batch_size` results, or after `flush_interval` """
+    api = _mock_api(range(1, 10))
+    listener = TestRailListener('testrail.cfg', 100, flush_interval=0.2, batch_size=2, api=api)
+    for i in range(1, 4):
+        _end_test(listener, 'Suite', {}, 'Test %d' % i, ['test_case_id=C%d' % i])
+    _end_test(listener, 'Suite', {'TEST_CASE_ID': 'C9'}, 'Test 9', [])
+    _end_test(listener, 'Suite', {}, 'Test without ID', [])
+    _end_test(listener, 'Suite', {}, 'Test not in run', ['test_case_id=C50'])
+    time.sleep(0.5)    # Last result is published after `flush_interval`
+    assert [len(args[0][2]) for args in api.add_results.call_args_list] == [2, 2]
+    assert api.iter_tests.call_count == 1
+    listener.close()
+    assert [testcase['id'] for testcase in _published(api)] == ['C1', 'C2', 'C3', 'C9']
+    api.iter_tests.assert_called_once_with(100, prefetch=True)
+
+
+def test_listener_close_flushes():
+    """ Remaining results are published when execution ends """
+    api = _mock_api([1])
+    listener = TestRailListener('testrail.cfg', 100, flush_interval=60, publish_blocked='False', api=api)
+    _end_test(listener, 'Suite', {}, 'Test 1', ['test_case_id=C1'], status='FAIL')
+    listener.close()
+    assert [(testcase['id'], testcase['status']) for testcase in _published(api)] == [('C1', 'FAIL')]
+    assert listener.publish_blocked is False
+
+
+def test_listener_survives_errors():
+    """ An error while publishing (e.g. TestRail unreachable) is logged, next results are still published """
+    api = _mock_api([1, 2])
+    errors = [ConnectionRefusedError(111, 'Connection refused')]
+
+    def _add_results(run_id, version, testcases):    # pylint: disable=unused-argument
+        if errors:
+            raise errors.pop()
+        return [{'id': 1}] * len(testcases)
+
+    api.add_results.side_effect = _add_results
+    listener = TestRailListener('testrail.cfg', 100, batch_size=1, api=api)
+    _end_test(listener, 'Suite', {}, 'Test 1', ['test_case_id=C1'])
+    _end_test(listener, 'Suite', {}, 'Test 2', ['test_case_id=C2'])
+    listener.close()
+    assert [testcase['id'] for testcase in _published(api)] == ['C1', 'C2']
+    assert listener.published_count == 1
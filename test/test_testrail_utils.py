@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 """ Test of module mod:`testrail_utils` """
+import json
+import re
 from unittest.mock import Mock
 
 import pytest
 
 import testrail_utils as tr
+from benchmark.fake_testrail import FakeTestRail
+from result_record import ResultRecord
 from testrail import APIError
 
 TESTRAIL_URL = 'https://example.testrail.net'
@@ -83,6 +87,101 @@ def test_add_result(api):    # pylint: disable=redefined-outer-name
          'elapsed': '60s'})
 
 
+def test_add_results(api):    # pylint: disable=redefined-outer-name
+    """ Test of method `add_results` """
+    api.send_post.side_effect = lambda uri, data: [{'id': result['case_id']} for result in json.loads(data)['results']]
+    assert api.add_results(1, '1.0', TESTCASES) == [{'id': 9876}, {'id': 344}, {'id': 1111}]
+    assert api.send_post.call_count == 1
+    assert api.send_post.call_args[0][0] == tr.API_ADD_RESULT_CASES_URL.format(run_id=1)
+    assert json.loads(api.send_post.call_args[0][1]) == {
+        'results': [{
+            'status_id': 5,
+            'version': '1.0',
+            'comment': 'ERROR!',
+            'case_id': 9876
+        }, {
+            'status_id': 1,
+            'version': '1.0',
+            'case_id': 344
+        }, {
+            'status_id': 1,
+            'version': '1.0',
+            'elapsed': '60s',
+            'case_id': 1111
+        }]
+    }
+
+    # Bad formatted ID
+    assert api.add_results(1, '', [{'id': 'test', 'status': 'PASS'}]) is None
+
+
+@pytest.mark.parametrize('batch_size, batch_max_bytes, batch_workers, expected', [
+    (2, 0, 1, [2, 2, 2, 1]),
+    (0, 100, 1, [3, 3, 1]),
+    (2, 30, 4, [1, 1, 1, 1, 1, 1, 1]),
+    (0, 0, 4, [7]),
+])
+def test_add_results_batches(api, batch_size, batch_max_bytes, batch_workers, expected):
+    # pylint: disable=redefined-outer-name, too-many-arguments
+    """ Results are sent in batches, in parallel or not, and returned in order """
+    testcases = [{'id': 'C{}'.format(i), 'status': 'PASS'} for i in range(100, 107)]    # 28 bytes each
+    api.batch_size = batch_size
+    api.batch_max_bytes = batch_max_bytes
+    api.batch_workers = batch_workers
+    api.send_post.side_effect = lambda uri, data: [{'id': result['case_id']} for result in json.loads(data)['results']]
+    assert api.add_results(1, '', testcases) == [{'id': i} for i in range(100, 107)]
+    assert sorted(len(json.loads(args[0][1])['results']) for args in api.send_post.call_args_list) == sorted(expected)
+
+
+def test_add_results_batch_error(api):    # pylint: disable=redefined-outer-name
+    """ Failed batches are not sent again (transient errors are retried by the client), they are reported with
+        results of other batches
+    """
+    testcases = [{'id': 'C{}'.format(i), 'status': 'PASS'} for i in range(100, 104)]
+    api.batch_size = 2
+    api.send_post.side_effect = [APIError('HTTP 400'), [{'id': 102}, {'id': 103}]]
+    with pytest.raises(tr.BatchError) as error:
+        api.add_results(1, '', testcases)
+    assert api.send_post.call_count == 2
+    assert error.value.results == [{'id': 102}, {'id': 103}]
+    assert [index for index, _error in error.value.errors] == [0]
+
+
+def test_add_results_attachments(tmp_path):
+    """ Files of testcases are uploaded to their results once per Test Run, if not too large.
+        Errors don't stop other uploads.
+    """
+    log, small, large, other = (tmp_path / name for name in ('log.html', 'small.png', 'large.png', 'other.png'))
+    log.write_bytes(b'log')
+    small.write_bytes(b'small')
+    large.write_bytes(b'large' * 100)
+    other.write_bytes(b'other')
+    testcases = [ResultRecord('C{}'.format(i), 'FAIL', 'Test') for i in range(1, 5)]
+    testcases[0].attachments = [str(small), str(log)]
+    testcases[1].attachments = [str(large), str(tmp_path / 'missing.png'), str(log)]
+    testcases[2].attachments = [str(small)]
+    testcases[3].attachments = [str(other)]
+    with FakeTestRail() as server:
+        server.responses['add_results_for_cases/1'] = lambda request: [{
+            'id': 100 + result['case_id']
+        } for result in request.data['results']]
+        server.responses['add_attachment_to_result/101'] = {'attachment_id': 1}
+        server.responses['add_attachment_to_result/104'] = (400, {'error': 'Field :result_id is not valid'})
+        inst = tr.TestRailApiUtils(server.url)
+        inst.batch_size = 2
+        inst.attachments = True
+        inst.attachment_max_bytes = 100
+        inst.get_file_digest = Mock(side_effect=tr.TestRailApiUtils.get_file_digest)
+        assert len(inst.add_results(1, '', testcases)) == 4
+        inst.close()
+    digested = [args[0][0] for args in inst.get_file_digest.call_args_list]
+    assert sorted(digested) == sorted({str(log), str(small), str(other)})    # Each file is read once
+    uploads = sorted((request.uri, request.data['filename']) for request in server.requests
+                     if request.uri.startswith('add_attachment'))
+    assert uploads == [('add_attachment_to_result/101', 'log.html'), ('add_attachment_to_result/101', 'small.png'),
+                       ('add_attachment_to_result/104', 'other.png')]
+
+
 def test_is_testrun_available(api):    # pylint: disable=redefined-outer-name
     """ Test of method `is_testrun_available` """
     api.send_get.return_value = {'is_completed': False}
@@ -113,6 +212,29 @@ def test_get_available_testruns(api):    # pylint: disable=redefined-outer-name
     assert api.get_available_testruns(100) == [59, 61]
 
 
+def test_add_run(api):    # pylint: disable=redefined-outer-name
+    """ Test of method `add_run` """
+    api.send_post.return_value = {'id': 70}
+    assert api.add_run(5, 'Nightly', [344, 9876]) == {'id': 70}
+    api.send_post.assert_called_once_with('add_run/5', {'name': 'Nightly', 'include_all': False,
+                                                         'case_ids': [344, 9876]})
+    api.add_run(5, 'Nightly', [344], suite_id=8, description='CI job')
+    assert api.send_post.call_args[0][1] == {'name': 'Nightly', 'include_all': False, 'case_ids': [344],
+                                             'suite_id': 8, 'description': 'CI job'}
+
+
+def test_add_plan_entry(api):    # pylint: disable=redefined-outer-name
+    """ Test of method `add_plan_entry`: the created Test Run is returned, and cached Test Plan is invalidated """
+    api.cache = Mock()
+    api.send_post.return_value = {'id': 'ce2f3c8f', 'runs': [{'id': 71, 'is_completed': False}]}
+    assert api.add_plan_entry(58, 8, 'Nightly', [344]) == {'id': 71, 'is_completed': False}
+    api.send_post.assert_called_once_with('add_plan_entry/58', {'suite_id': 8, 'name': 'Nightly',
+                                                                'include_all': False, 'case_ids': [344]})
+    api.cache.invalidate.assert_called_once_with(TESTRAIL_URL + '/get_plan/58')
+    api.add_plan_entry(58, 8, 'Nightly', [344], description='CI job')
+    assert api.send_post.call_args[0][1]['description'] == 'CI job'
+
+
 def test_extract_testcase_id(api):    # pylint: disable=redefined-outer-name
     """ Test of method `extract_testcase_id` """
     assert api.extract_testcase_id('C1234') == 1234
@@ -127,8 +249,93 @@ def test_extract_testcase_id(api):    # pylint: disable=redefined-outer-name
 
 
 def test_get_tests(api):    # pylint: disable=redefined-outer-name
-    """ Test of method `extract_testcase_id` """
+    """ Test of method `get_tests` """
     run_id = 100
-    api.get_tests(testrun_id=run_id)
-    print(api.send_get.call_args_list)
-    api.send_get.assert_called_once_with(tr.API_GET_TESTS_URL.format(run_id=run_id))
+    api.send_get.return_value = [{'case_id': 1}]
+    assert api.get_tests(testrun_id=run_id) == [{'case_id': 1}]
+    api.send_get.assert_called_once_with(tr.API_GET_TESTS_URL.format(run_id=run_id), tr.TESTS_FIELDS)
+
+    api.send_get.side_effect = APIError('Test Run not found')
+    assert api.get_tests(testrun_id=run_id) is None
+
+
+def _paginate(key, items, limit):
+    """ Return a response of stand-in server, paginating items like TestRail >= 6.7 """
+
+    def response(request):
+        offset = int((re.findall('&offset=([0-9]+)', request.uri) or [0])[0])
+        uri = '/api/v2/' + request.uri.split('&')[0]
+        next_link = uri + '&limit={}&offset={}'.format(limit, offset + limit) if offset + limit < len(items) else None
+        return {
+            'offset': offset,
+            'limit': limit,
+            'size': len(items[offset:offset + limit]),
+            '_links': {
+                'next': next_link,
+                'prev': None
+            },
+            key: items[offset:offset + limit]
+        }
+
+    return response
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_tests_paginated(prefetch):
+    """ Test of method `iter_tests` when TestRail paginates responses """
+    tests = [{'id': 1000 + i, 'case_id': i, 'status_id': 3} for i in range(620)]
+    with FakeTestRail() as server:
+        server.responses['get_tests/100'] = _paginate('tests', tests, 250)
+        inst = tr.TestRailApiUtils(server.url)
+        pages = inst.iter_tests(100, prefetch=prefetch)
+        assert next(pages) == tests[0]
+        assert list(pages) == tests[1:]
+        assert [request.uri for request in server.requests] == [
+            'get_tests/100', 'get_tests/100&limit=250&offset=250', 'get_tests/100&limit=250&offset=500'
+        ]
+        assert inst.get_tests(100) == tests
+        inst.close()
+
+
+def test_iter_pages(api):    # pylint: disable=redefined-outer-name
+    """ Test of paginated methods `iter_plans`, `iter_runs` and `iter_cases` """
+    api.send_get.side_effect = [{
+        'plans': [{'id': 1}],
+        '_links': {'next': '/api/v2/get_plans/3&limit=1&offset=1'}
+    }, {
+        'plans': [{'id': 2}],
+        '_links': {'next': None}
+    }]
+    assert list(api.iter_plans(3)) == [{'id': 1}, {'id': 2}]
+    assert api.send_get.call_args_list[1][0][0] == 'get_plans/3&limit=1&offset=1'
+
+    api.send_get.side_effect = [{'runs': [{'id': 1}], '_links': {'next': None}}]
+    assert list(api.iter_runs(3)) == [{'id': 1}]
+    api.send_get.assert_called_with('get_runs/3')
+
+    api.send_get.side_effect = [[{'id': 1}]]    # TestRail < 6.7
+    assert list(api.iter_cases(3, suite_id=4)) == [{'id': 1}]
+    api.send_get.assert_called_with('get_cases/3&suite_id=4')
+
+
+def test_run_index():
+    """ Test of class `RunIndex` """
+    index = tr.RunIndex([{'id': 1, 'case_id': 9876, 'status_id': 1}, {'id': 2, 'case_id': 344, 'status_id': 2}])
+    assert len(index) == 2
+    assert 344 in index
+    assert 1111 not in index
+    assert index.get_test_id(9876) == 1
+    assert index.get_status_id(1111) is None
+    assert index.is_blocked(344)
+    assert index.get_blocked_case_ids() == [344]
+    assert index.filter(TESTCASES) == TESTCASES[0:2]
+    assert index.filter(TESTCASES, publish_blocked=False) == TESTCASES[0:1]
+
+
+def test_run_index_filter_changed():
+    """ Only testcases whose status differs from the status in Test Run are kept """
+    index = tr.RunIndex([{'id': 1, 'case_id': 1, 'status_id': 1}, {'id': 2, 'case_id': 2, 'status_id': 5},
+                         {'id': 3, 'case_id': 3, 'status_id': 3}, {'id': 4, 'case_id': 4, 'status_id': 1}])
+    testcases = [{'id': 'C1', 'status': 'PASS'}, {'id': 'C2', 'status': 'FAIL'}, {'id': 'C3', 'status': 'PASS'},
+                 {'id': 'C4', 'status': 'FAIL'}]
+    assert index.filter_changed(testcases) == testcases[2:]
@@ -10,19 +10,41 @@
 # Copyright Gurock Software GmbH. See license.md for details.
 #
 # pylint: skip-file
-import urllib.request, urllib.error
+import http.client, urllib.parse
 import json, base64
 import time
 import logging
 
+# Pool of connections, retries, rate limiting, uploads and compression are
+# first-party code, shared with `testrail_async` (names kept here for
+# compatibility).
+from testrail_http import (COMPRESS_MIN_BYTES, ConnectionPool, MultipartFile, RequestTiming, RetryPolicy,
+                           TokenBucket, compress_body, decode_response)
+
 
 class APIClient:
-    def __init__(self, base_url):
+    def __init__(self, base_url, pool_size=4, timeout=None):
         self.user = ''
         self.password = ''
         if not base_url.endswith('/'):
             base_url += '/'
         self.__url = base_url + 'index.php?/api/v2/'
+        url = urllib.parse.urlsplit(self.__url)
+        self.__path = url.path + '?' + url.query
+        self.__pool = ConnectionPool(url.scheme, url.hostname, url.port, pool_size, timeout)
+        self.__auth = (None, None)
+        # Timing of the last request (see `RequestTiming`), and optional
+        # callable called with the timing of each request.
+        self.last_timing = None
+        self.timing_callback = None
+        # Retries of failed requests (see `RetryPolicy`), and optional rate
+        # limiter (see `TokenBucket`).
+        self.retry_policy = RetryPolicy()
+        self.rate_limiter = None
+        # Compression of JSON request bodies (gzip), disabled if the server
+        # doesn't accept it (HTTP 415). Responses are always accepted
+        # compressed.
+        self.compress_requests = False
 
     #
     # Send Get
@@ -34,9 +56,12 @@ class APIClient:
     #
     # uri                 The API method to call including parameters
     #                     (e.g. get_case/1)
+    # fields              Names of the fields to keep in JSON objects of the
+    #                     result (see `decode_response`). All fields are
+    #                     kept if not set.
     #
-    def send_get(self, uri):
-        return self.__send_request('GET', uri, None)
+    def send_get(self, uri, fields=None):
+        return self.__send_request('GET', uri, None, fields)
 
     #
     # Send POST
@@ -49,47 +74,143 @@ class APIClient:
     # uri                 The API method to call including parameters
     #                     (e.g. add_case/1)
     # data                The data to submit as part of the request (as
-    #                     Python dict, strings must be UTF-8 encoded)
+    #                     Python dict, strings must be UTF-8 encoded, or
+    #                     as bytes already encoded in JSON). For
+    #                     add_attachment_* methods, the path of the file to
+    #                     upload (or a `MultipartFile`).
     #
     def send_post(self, uri, data):
         return self.__send_request('POST', uri, data)
 
-    def __send_request(self, method, uri, data):
-        url = self.__url + uri
-        request = urllib.request.Request(url)
-        if (method == 'POST'):
-            request.data = bytes(json.dumps(data), 'utf-8')
-        auth = str(base64.b64encode(bytes('%s:%s' % (self.user, self.password), 'utf-8')), 'ascii').strip()
-        request.add_header('Authorization', 'Basic %s' % auth)
-        request.add_header('Content-Type', 'application/json')
+    #
+    # Close the kept-alive connections.
+    #
+    def close(self):
+        self.__pool.close()
+
+    def __get_auth_header(self):
+        credentials = (self.user, self.password)
+        if self.__auth[0] != credentials:
+            auth = str(base64.b64encode(bytes('%s:%s' % credentials, 'utf-8')), 'ascii').strip()
+            self.__auth = (credentials, 'Basic %s' % auth)
+        return self.__auth[1]
 
-        e = None
-        try:
-            response = urllib.request.urlopen(request).read()
-        except urllib.error.HTTPError as ex:
-            response = ex.read()
-            e = ex
+    def __send_request(self, method, uri, data, fields=None):
+        headers = {
+            'Authorization': self.__get_auth_header(),
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip'
+        }
+        body = None
+        json_body = None
+        if (method == 'POST' and uri.startswith('add_attachment')):
+            body = data if isinstance(data, MultipartFile) else MultipartFile(data)
+            headers['Content-Type'] = body.content_type
+            headers['Content-Length'] = str(len(body))
+        elif (method == 'POST'):
+            body = json_body = data if isinstance(data, bytes) else bytes(json.dumps(data), 'utf-8')
+            if self.compress_requests and len(body) >= COMPRESS_MIN_BYTES:
+                body = compress_body(body)
+                headers['Content-Encoding'] = 'gzip'
 
-        if response:
-            result = json.loads(response.decode())
-        else:
-            result = {}
-
-        if e != None:
-            if e.code == 429:    # Too many requests
-                pause = int(e.headers.get('Retry-After', 60))
-                logging.warning("Too many requests: pause for %ss", pause)
-                time.sleep(pause)
-                return self.__send_request(method, uri, data)
+        attempt = 0
+        backoff = 0.0
+        while True:
+            attempt += 1
+            throttled = self.rate_limiter.acquire() if self.rate_limiter else 0.0
+            start = time.perf_counter()
+            try:
+                status, response_headers, response, reused = self.__urlopen(method, self.__path + uri, body, headers)
+            except (OSError, http.client.HTTPException) as error:    # Connection reset, timeout...
+                # A request sent may have been processed: see `RetryPolicy.can_retry`
+                sent = getattr(error, 'request_sent', True)
+                if attempt >= self.retry_policy.max_attempts or not self.retry_policy.can_retry(method, sent=sent):
+                    raise
+                backoff += self.__pause_before_retry(attempt, method, uri, error)
+                continue
+
+            self.last_timing = RequestTiming(method, uri, status, time.perf_counter() - start, reused,
+                                             len(body or b''), len(response), attempt, throttled, backoff)
+            if self.timing_callback:
+                self.timing_callback(self.last_timing)
+
+            if status == 415 and 'Content-Encoding' in headers:
+                # Compressed requests not accepted: sent again uncompressed
+                logging.warning('TestRail doesn\'t accept compressed requests: compression disabled')
+                self.compress_requests = False
+                body = json_body
+                del headers['Content-Encoding']
+                attempt -= 1
+                continue
+            if attempt < self.retry_policy.max_attempts and self.retry_policy.can_retry(method, status):
+                backoff = self.__pause_before_retry(attempt, method, uri, 'HTTP %s' % status,
+                                                    response_headers.get('Retry-After'))
+                continue
+            break
+
+        # Errors are decoded with all their fields
+        result = decode_response(response, response_headers.get('Content-Encoding'), fields if status < 300 else None)
+
+        if status >= 300:
+            if result and 'error' in result:
+                error = '"' + result['error'] + '"'
             else:
-                if result and 'error' in result:
-                    error = '"' + result['error'] + '"'
-                else:
-                    error = 'No additional error message received'
-                raise APIError('TestRail API returned HTTP %s (%s)' % (e.code, error))
+                error = 'No additional error message received'
+            raise APIError('TestRail API returned HTTP %s (%s)' % (status, error))
 
         return result
 
+    def __pause_before_retry(self, attempt, method, uri, error, retry_after=None):
+        pause = self.retry_policy.get_pause(attempt, retry_after)
+        logging.warning('%s %s failed (%s): retry %d/%d in %.1fs', method, uri, error, attempt,
+                        self.retry_policy.max_attempts - 1, pause)
+        time.sleep(pause)
+        return pause
+
+    #
+    # Send the request on a kept-alive connection of the pool. A reused
+    # connection may have been closed by the server meanwhile: in this case
+    # the request is sent again on a new connection, unless it may have been
+    # processed (see `RetryPolicy.can_retry`).
+    #
+    def __urlopen(self, method, path, body, headers):
+        connection = self.__pool.get()
+        reused = connection.sock is not None
+        try:
+            response, content = self.__request(connection, method, path, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as error:
+            if not reused or not self.retry_policy.can_retry(method, sent=error.request_sent):
+                raise
+            connection = self.__pool.new_connection()
+            reused = False
+            response, content = self.__request(connection, method, path, body, headers)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.__pool.put(connection)
+        return response.status, response.headers, content, reused
+
+    #
+    # Errors raised once the request was written are marked with
+    # `request_sent`: the request may have been processed by TestRail.
+    #
+    @staticmethod
+    def __request(connection, method, path, body, headers):
+        try:
+            connection.request(method, path, body, headers)
+        except BaseException as error:
+            connection.close()
+            error.request_sent = False
+            raise
+        try:
+            response = connection.getresponse()
+            return response, response.read()
+        except BaseException as error:
+            connection.close()
+            error.request_sent = True
+            raise
+
 
 class APIError(Exception):
     pass
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Asyncio counterpart of `testrail.APIClient` and `testrail_utils.TestRailApiUtils` """
+import asyncio
+import base64
+import json
+import logging
+import ssl
+import time
+import urllib.parse
+
+import testrail
+import testrail_http
+from testrail_utils import (API_ADD_RESULT_CASES_URL, API_GET_PLAN_URL, API_GET_RUN_URL, API_GET_TESTS_URL,
+                            BATCH_MAX_BYTES, BATCH_SIZE, PLAN_FIELDS, RUN_FIELDS, TESTS_FIELDS, RunIndex,
+                            TestRailApiUtils, log_targets_summary)
+
+
+class AsyncAPIClient:
+    """ Client of TestRail API, sending requests from an asyncio event loop
+
+        Like `testrail.APIClient`, connections are kept alive and reused, failed requests are retried
+        according to `retry_policy` and paced by `rate_limiter` (if any), and errors raise `testrail.APIError`.
+        At most `pool_size` requests are sent concurrently.
+    """
+    # Same settings as `testrail.APIClient`, plus the parts of the URL and the idle connections of the event loop
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, base_url, pool_size=4, timeout=None):
+        """ Init
+
+        :param base_url: URL of TestRail
+        :param pool_size: Maximum number of concurrent requests (and of connections)
+        :param timeout: Timeout of a request, in seconds
+        """
+        self.user = ''
+        self.password = ''
+        if not base_url.endswith('/'):
+            base_url += '/'
+        url = urllib.parse.urlsplit(base_url + 'index.php?/api/v2/')
+        self._path = url.path + '?' + url.query
+        self._host = url.hostname
+        self._port = url.port or (443 if url.scheme == 'https' else 80)
+        self._host_header = url.netloc.rsplit('@', 1)[-1]
+        self._ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retry_policy = testrail_http.RetryPolicy()
+        self.rate_limiter = None
+        self.compress_requests = False
+        self.last_timing = None
+        self.timing_callback = None
+        self._idle = []
+        self._semaphore = None
+
+    async def send_get(self, uri, fields=None):
+        """ Issue a GET request (read) against the API and return the result, keeping only `fields` of its JSON
+            objects if set (see `testrail_http.decode_response`)
+        """
+        return await self._send_request('GET', uri, None, fields)
+
+    async def send_post(self, uri, data):
+        """ Issue a POST request (write) against the API and return the result. `data` may be already encoded
+            in JSON (bytes).
+        """
+        return await self._send_request('POST', uri, data)
+
+    async def close(self):
+        """ Close the kept-alive connections """
+        idle, self._idle = self._idle, []
+        for _reader, writer in idle:
+            writer.close()
+
+    async def _send_request(self, method, uri, data, fields=None):
+        """ Send a request, retrying it on transient errors """
+        # pylint: disable=too-many-locals
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+        json_body = b''
+        if method == 'POST':
+            json_body = data if isinstance(data, bytes) else bytes(json.dumps(data), 'utf-8')
+        compressed = self.compress_requests and len(json_body) >= testrail_http.COMPRESS_MIN_BYTES
+        body, request = self._get_request(method, uri, json_body, compressed)
+
+        attempt = 0
+        backoff = 0.0
+        while True:
+            attempt += 1
+            throttled = self.rate_limiter.reserve() if self.rate_limiter else 0.0
+            if throttled:
+                await asyncio.sleep(throttled)
+            start = time.perf_counter()
+            sent = []    # Set once the request is written: it may then have been processed by TestRail
+            try:
+                async with self._semaphore:
+                    status, headers, response, reused = await asyncio.wait_for(self._exchange(method, request, sent),
+                                                                               self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+                if attempt >= self.retry_policy.max_attempts or not self.retry_policy.can_retry(method,
+                                                                                                sent=bool(sent)):
+                    raise
+                backoff += await self._pause_before_retry(attempt, method, uri, error)
+                continue
+
+            self.last_timing = testrail_http.RequestTiming(method, uri, status, time.perf_counter() - start, reused,
+                                                      len(body), len(response), attempt, throttled, backoff)
+            if self.timing_callback:
+                self.timing_callback(self.last_timing)
+
+            if status == 415 and compressed:
+                logging.warning('TestRail doesn\'t accept compressed requests: compression disabled')
+                self.compress_requests = compressed = False
+                body, request = self._get_request(method, uri, json_body, compressed)
+                attempt -= 1    # Not a failure of the request
+                continue
+            if attempt < self.retry_policy.max_attempts and self.retry_policy.can_retry(method, status):
+                backoff = await self._pause_before_retry(attempt, method, uri, 'HTTP %s' % status,
+                                                         headers.get('retry-after'))
+                continue
+            break
+
+        # Errors are decoded with all their fields
+        result = testrail_http.decode_response(response, headers.get('content-encoding'),
+                                               fields if status < 300 else None)
+        if status >= 300:
+            if result and 'error' in result:
+                error = '"' + result['error'] + '"'
+            else:
+                error = 'No additional error message received'
+            raise testrail.APIError('TestRail API returned HTTP %s (%s)' % (status, error))
+        return result
+
+    def _get_request(self, method, uri, json_body, compressed):
+        """ Return the body and the bytes of a request, its body being compressed with gzip if `compressed` """
+        body = testrail_http.compress_body(json_body) if compressed else json_body
+        auth = str(base64.b64encode(bytes('%s:%s' % (self.user, self.password), 'utf-8')), 'ascii').strip()
+        head = ('%s %s HTTP/1.1\r\nHost: %s\r\nAuthorization: Basic %s\r\nContent-Type: application/json\r\n'
+                'Accept-Encoding: gzip\r\n%sContent-Length: %d\r\n\r\n' %
+                (method, self._path + uri, self._host_header, auth, 'Content-Encoding: gzip\r\n' if compressed else '',
+                 len(body)))
+        return body, head.encode('latin-1') + body
+
+    async def _pause_before_retry(self, attempt, method, uri, error, retry_after=None):
+        # pylint: disable=too-many-arguments
+        """ Wait before sending again a failed request, and return the time waited """
+        pause = self.retry_policy.get_pause(attempt, retry_after)
+        logging.warning('%s %s failed (%s): retry %d/%d in %.1fs', method, uri, error, attempt,
+                        self.retry_policy.max_attempts - 1, pause)
+        await asyncio.sleep(pause)
+        return pause
+
+    async def _exchange(self, method, request, sent):
+        """ Send a request on a kept-alive connection and read its response. A reused connection may have been
+            closed by the server meanwhile: in this case the request is sent again on a new connection, unless it
+            may have been processed (see `testrail_http.RetryPolicy.can_retry`).
+
+        :param method: HTTP method of the request
+        :param sent: List filled once the request is written
+        :return: Tuple (status, headers, body, reused)
+        """
+        while self._idle:
+            connection = self._idle.pop()
+            if connection[0].at_eof():    # Closed by the server
+                connection[1].close()
+                continue
+            try:
+                return (*await self._exchange_on(connection, request, sent), True)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not self.retry_policy.can_retry(method, sent=bool(sent)):
+                    raise
+            break
+        connection = await asyncio.open_connection(self._host, self._port, ssl=self._ssl)
+        return (*await self._exchange_on(connection, request, sent), False)
+
+    async def _exchange_on(self, connection, request, sent):
+        """ Send a request on a connection and read its response
+
+        :param sent: List filled once the request is written
+        :return: Tuple (status, headers, body)
+        """
+        reader, writer = connection
+        try:
+            writer.write(request)
+            await writer.drain()
+            sent.append(True)
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError('Connection closed by TestRail')
+            version, status = status_line.decode('latin-1').split()[0:2]
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            will_close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                body = await self._read_chunked(reader)
+            elif 'content-length' in headers:
+                body = await reader.readexactly(int(headers['content-length']))
+            else:
+                body = await reader.read()
+                will_close = True
+        except BaseException:
+            writer.close()
+            raise
+
+        if will_close or len(self._idle) >= self.pool_size:
+            writer.close()
+        else:
+            self._idle.append(connection)
+        return int(status), headers, body
+
+    @staticmethod
+    async def _read_chunked(reader):
+        """ Read a body sent with chunked transfer encoding """
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        while (await reader.readline()).strip():    # Trailers
+            pass
+        return b''.join(chunks)
+
+
+class AsyncTestRailApiUtils(AsyncAPIClient):
+    """ Asyncio counterpart of `testrail_utils.TestRailApiUtils` """
+
+    def __init__(self, base_url, **kwargs):
+        """ Init
+
+        :param base_url: URL of TestRail
+        :param kwargs: Other arguments of `AsyncAPIClient`
+        """
+        super().__init__(base_url, **kwargs)
+        self.base_url = base_url
+        self.batch_size = BATCH_SIZE
+        self.batch_max_bytes = BATCH_MAX_BYTES
+        # Optional `testrail_cache.MetadataCache` of responses of get_run and get_plan, with the same keys as
+        # `TestRailApiUtils.cache`
+        self.cache = None
+
+    async def get_run(self, testrun_id):
+        """ Return a Test Run, with fields of `RUN_FIELDS` only """
+        return await self._cached_get(API_GET_RUN_URL.format(run_id=testrun_id), RUN_FIELDS)
+
+    async def get_plan(self, testplan_id):
+        """ Return a Test Plan, with fields of `PLAN_FIELDS` only """
+        return await self._cached_get(API_GET_PLAN_URL.format(plan_id=testplan_id), PLAN_FIELDS)
+
+    async def is_testrun_available(self, testrun_id):
+        """ Ask if Test Run is available in TestRail.
+
+        :param testrun_id: Testrail ID of the Test Run
+        :return: True if Test Run exists AND is open
+        """
+        try:
+            return (await self.get_run(testrun_id))['is_completed'] is False
+        except testrail.APIError as error:
+            logging.error(error)
+            return False
+
+    async def is_testplan_available(self, testplan_id):
+        """ Ask if Test Plan is available in TestRail.
+
+        :param testplan_id: Testrail ID of the Test Plan
+        :return: True if Test Plan exists AND is open
+        """
+        try:
+            return (await self.get_plan(testplan_id))['is_completed'] is False
+        except testrail.APIError as error:
+            logging.error(error)
+            return False
+
+    async def get_available_testruns(self, testplan_id):
+        """ Get the list of available Test Runs contained in a Test Plan
+
+        :param testplan_id: Testrail ID of the Test Plan
+        :return: List of available Test Runs associated to a Test Plan in TestRail.
+        """
+        response = await self.get_plan(testplan_id)
+        return [run['id'] for entry in response['entries'] for run in entry['runs'] if not run['is_completed']]
+
+    async def iter_tests(self, testrun_id):
+        """ Yield tests containing in a Test Run, page by page. Only fields of `TESTS_FIELDS` are decoded.
+
+        :param testrun_id: TestRail ID of the Test Run
+        """
+        page = await self.send_get(API_GET_TESTS_URL.format(run_id=testrun_id), TESTS_FIELDS)
+        while True:
+            if isinstance(page, list):    # Not paginated
+                for test in page:
+                    yield test
+                return
+            for test in page.get('tests', []):
+                yield test
+            # pylint: disable=protected-access
+            next_uri = TestRailApiUtils._get_next_page_uri(page)
+            if not next_uri:
+                return
+            page = await self.send_get(next_uri, TESTS_FIELDS)
+
+    async def get_tests(self, testrun_id):
+        """ Return the list of tests containing in a Test Run.
+
+        :param testrun_id: TestRail ID of the Test Run
+        """
+        try:
+            return [test async for test in self.iter_tests(testrun_id)]
+        except testrail.APIError as error:
+            logging.error(error)
+            return None
+
+    async def add_results(self, testrun_id, version, testcase_infos):
+        """ Add a results to the given Test Run, sending batches concurrently
+
+        :param testrun_id: Testrail ID of the Test Run to feed
+        :param version: Test version
+        :param testcase_infos: List of dict containing info on testcase
+        :return: List of added results, in the order of `testcase_infos`
+        :raise testrail_utils.BatchError: if some batches can't be added
+        :raise OSError: if TestRail can't be reached
+        """
+        # pylint: disable=protected-access
+        data = TestRailApiUtils._encode_results(version, testcase_infos)
+        if data is None:
+            return None
+        batches = TestRailApiUtils._split_in_batches(data, self.batch_size, self.batch_max_bytes)
+        outcomes = await asyncio.gather(*[self._add_results_batch(testrun_id, batch) for batch in batches],
+                                        return_exceptions=True)
+        # Like `TestRailApiUtils.add_results`, only failed batches (`testrail.APIError`) are reported in BatchError
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException) and not isinstance(outcome, testrail.APIError):
+                raise outcome
+        return TestRailApiUtils._merge_batch_outcomes(testrun_id, outcomes)
+
+    async def _add_results_batch(self, testrun_id, batch):
+        """ Send a batch of results. Transient errors are retried by the client (see `retry_policy`). """
+        # pylint: disable=protected-access
+        return await self.send_post(API_ADD_RESULT_CASES_URL.format(run_id=testrun_id),
+                                    TestRailApiUtils._get_body(batch))
+
+    async def _cached_get(self, uri, fields=None):
+        """ Issue a GET request, unless its response is in `cache` (see `TestRailApiUtils._cached_get`) """
+        if self.cache is None:
+            return await self.send_get(uri, fields)
+        key = self.base_url.rstrip('/') + '/' + uri
+        response = self.cache.get(key)
+        if response is None:
+            response = await self.send_get(uri, fields)
+            self.cache.set(key, response)
+        return response
+
+
+async def publish_results_async(api, testcases, run_id=0, plan_id=0, version='', publish_blocked=True,
+                                skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases with provided Test Run or Test Plan, like `robotframework2testrail.publish_results`,
+        all Test Runs of a Test Plan being published concurrently from the event loop.
+
+        :param api: `AsyncTestRailApiUtils` client
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param run_id: TestRail ID of Test Run to update
+        :param plan_id: TestRail ID of Test Plan to update
+        :param version: Version to indicate in Test Case result
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
+        :return: True if publishing was done. False in case of error.
+    """
+    if run_id:
+        if not await api.is_testrun_available(run_id):
+            logging.error('Test Run #%d is not available', run_id)
+            return False
+        try:
+            await _publish_testrun_async(api, testcases, run_id, version, publish_blocked, skip_unchanged)
+        except testrail.APIError:
+            logging.exception('Error while publishing results')
+
+    elif plan_id:
+        if not await api.is_testplan_available(plan_id):
+            logging.error('Test Plan #%d is not available', plan_id)
+            return False
+        logging.info('Publish in Test Plan #%d', plan_id)
+        run_ids = await api.get_available_testruns(plan_id)
+        outcomes = await asyncio.gather(
+            *[_publish_testrun_of_testplan_async(api, testcases, _run_id, version, publish_blocked, skip_unchanged)
+              for _run_id in run_ids],
+            return_exceptions=True)
+        log_targets_summary({'Test Plan #%d' % plan_id: run_ids}, dict(zip(run_ids, outcomes)))
+
+    else:
+        logging.error("You have to indicate a Test Run or a Test Plan ID")
+        return False
+
+    return True
+
+
+async def publish_targets_async(api, testcases, run_ids=(), plan_ids=(), version='', publish_blocked=True,
+                                skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in several Test Runs and Test Plans, like `robotframework2testrail.publish_targets`,
+        all Test Runs being published concurrently from the event loop.
+
+        :param api: `AsyncTestRailApiUtils` client
+        :param testcases: List of testcases with status, returned by `get_testcases`
+        :param run_ids: TestRail IDs of Test Runs to update
+        :param plan_ids: TestRail IDs of Test Plans to update
+        :param version: Version to indicate in Test Case result
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param skip_unchanged: If True, results whose status is already the status of the test in TestRail are not
+                               published
+        :return: True if all targets are available. False otherwise.
+    """
+
+    async def _get_target_runs(plan_id):
+        if not await api.is_testplan_available(plan_id):
+            return None
+        try:
+            return await api.get_available_testruns(plan_id)
+        except testrail.APIError:
+            logging.exception('Error while reading Test Plan #%d', plan_id)
+            return None
+
+    run_ids, plan_ids = list(dict.fromkeys(run_ids)), list(dict.fromkeys(plan_ids))
+    available = await asyncio.gather(*[api.is_testrun_available(run_id) for run_id in run_ids])
+    plan_runs = await asyncio.gather(*[_get_target_runs(plan_id) for plan_id in plan_ids])
+    target_runs = {'Test Run #%d' % run_id: [run_id] if is_available else None
+                   for run_id, is_available in zip(run_ids, available)}
+    target_runs.update(('Test Plan #%d' % plan_id, runs) for plan_id, runs in zip(plan_ids, plan_runs))
+
+    unique_run_ids = list(dict.fromkeys(run_id for ids in target_runs.values() if ids for run_id in ids))
+    logging.info('Publish in %d Test Run(s) of %d target(s)', len(unique_run_ids), len(target_runs))
+    outcomes = await asyncio.gather(
+        *[_publish_testrun_of_testplan_async(api, testcases, run_id, version, publish_blocked, skip_unchanged)
+          for run_id in unique_run_ids],
+        return_exceptions=True)
+    return log_targets_summary(target_runs, dict(zip(unique_run_ids, outcomes)))
+
+
+async def _publish_testrun_of_testplan_async(api, testcases, run_id, version, publish_blocked, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in a Test Run of a Test Plan
+
+        :return: Number of published results. `None` if Test Run is not available.
+    """
+    if not await api.is_testrun_available(run_id):
+        return None
+    return await _publish_testrun_async(api, testcases, run_id, version, publish_blocked, skip_unchanged)
+
+
+async def _publish_testrun_async(api, testcases, run_id, version, publish_blocked, skip_unchanged=False):
+    # pylint: disable=too-many-arguments
+    """ Update testcases in an available Test Run
+
+        :return: Number of published results
+    """
+    logging.info('Publish in Test Run #%d', run_id)
+    index = RunIndex([test async for test in api.iter_tests(run_id)])
+    if publish_blocked is False:
+        logging.info('Blocked testcases excluded: %s', ', '.join(str(elt) for elt in index.get_blocked_case_ids()))
+    testcases = index.filter(testcases, publish_blocked)
+    if skip_unchanged:
+        changed = index.filter_changed(testcases)
+        logging.info('%d result(s) unchanged in Test Run #%d: skipped, %d result(s) to publish',
+                     len(testcases) - len(changed), run_id, len(changed))
+        testcases = changed
+    result = []
+    if testcases or not skip_unchanged:    # Nothing to send if all results are unchanged
+        result = await api.add_results(run_id, version, testcases)
+    logging.info('%d result(s) published in Test Run #%d.', len(result), run_id)
+    return len(result)
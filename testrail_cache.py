@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Cache of TestRail metadata (runs, plans, tests) """
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILENAME = 'testrail-metadata.sqlite'
+
+
+class MetadataCache:
+    """ Cache of responses of TestRail API, each response expiring after a time to live
+
+        Responses are kept in memory, so that a lookup is done once per process.
+        If a cache directory is given, they are also stored in a SQLite database, shared between invocations.
+        Keys are the base URL of TestRail followed by the API method (e.g. 'https://x.testrail.net/get_run/1').
+    """
+
+    def __init__(self, cache_dir=None, ttl=300):
+        """ Init
+
+        :param cache_dir: Directory of the database. If not set, responses are only cached in memory.
+        :param ttl: Time to live of a response, in seconds
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._database = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._database = sqlite3.connect(
+                os.path.join(cache_dir, CACHE_FILENAME), timeout=30, check_same_thread=False)
+            self._database.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value TEXT)')
+            self._database.execute('DELETE FROM cache WHERE expires <= ?', (time.time(), ))
+            self._database.commit()
+
+    def get(self, key):
+        """ Return the cached response of a key. `None` if not cached or expired. """
+        now = time.time()
+        with self._lock:
+            expires, value = self._memory.get(key, (0, None))
+            if expires <= now and self._database:
+                row = self._database.execute('SELECT expires, value FROM cache WHERE key = ?', (key, )).fetchone()
+                if row:
+                    expires, value = row[0], json.loads(row[1])
+                    self._memory[key] = (expires, value)
+            if expires > now:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """ Cache the response of a key """
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._memory[key] = (expires, value)
+            if self._database:
+                self._database.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                                       (key, expires, json.dumps(value)))
+                self._database.commit()
+
+    def get_or_fetch(self, key, fetch):
+        """ Return the cached response of a key, calling `fetch` to get and cache it if needed """
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """ Remove the response of a key, with responses of the same API method with other parameters
+            (e.g. 'get_tests/1&offset=250' for 'get_tests/1'). All responses are removed if key is not set.
+        """
+        with self._lock:
+            for cached_key in list(self._memory):
+                if key is None or cached_key == key or cached_key.startswith(key + '&'):
+                    del self._memory[cached_key]
+            if self._database:
+                if key is None:
+                    self._database.execute('DELETE FROM cache')
+                else:
+                    self._database.execute('DELETE FROM cache WHERE key = ? OR substr(key, 1, ?) = ?',
+                                           (key, len(key) + 1, key + '&'))
+                self._database.commit()
+
+    def log_statistics(self):
+        """ Log number of hits and misses """
+        logging.info('Metadata cache: %d hit(s), %d miss(es)', self.hits, self.misses)
+
+    def close(self):
+        """ Close the database """
+        if self._database:
+            self._database.close()
+            self._database = None
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" HTTP facilities of the clients of TestRail API (`testrail.APIClient`, `testrail_async.AsyncAPIClient`):
+    kept-alive connections, retries, rate limiting, streamed uploads and compressed bodies
+"""
+import collections
+import gzip
+import http.client
+import json
+import os
+import random
+import select
+import threading
+import time
+
+# Timing of one request, as exposed by `last_timing` of clients and given to their `timing_callback`:
+# - method: HTTP method (GET or POST)
+# - uri: API method called (e.g. get_case/1)
+# - status: HTTP status code of the response
+# - elapsed: duration of the request, in seconds
+# - reused: True if a kept-alive connection was reused
+# - sent, received: sizes of the request and response bodies, in bytes
+# - attempt: attempt of the request (1, then 2... on retries)
+# - throttled: time waited for the rate limiter before the request, in seconds
+# - backoff: time waited before the request after a failed attempt, in seconds
+RequestTiming = collections.namedtuple('RequestTiming',
+                                       'method uri status elapsed reused sent received attempt throttled backoff',
+                                       defaults=(0, 0, 1, 0.0, 0.0))
+
+# Methods whose requests may be sent twice without changing the result
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+# HTTP statuses telling that a request was not processed (rate limit, maintenance)
+UNPROCESSED_STATUSES = frozenset((429, 503))
+
+# Request bodies smaller than this size (in bytes) are not compressed: gzip would save less than it costs
+COMPRESS_MIN_BYTES = 1024
+
+
+class RetryPolicy:
+    """ Policy to send again requests that failed on a transient error: HTTP status in `retry_statuses`,
+        connection reset or timeout. A `Retry-After` header sent by the server takes precedence over the backoff.
+
+        A request of a non-idempotent method (e.g. POST add_results_for_cases) that may have been processed by
+        TestRail (timeout while waiting for its response, HTTP 502 from a proxy...) is not sent again, unless
+        `retry_sent_posts` is set: its results would be added twice.
+    """
+
+    def __init__(self, max_attempts=5, backoff=1.0, max_backoff=60.0, retry_statuses=(429, 500, 502, 503, 504),
+                 jitter=0.5, retry_sent_posts=False):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param max_attempts: Maximum number of attempts of a request (1: no retry)
+        :param backoff: Pause before the first retry, in seconds. The pause is doubled at each retry, up to
+                        `max_backoff`.
+        :param retry_statuses: HTTP status codes of responses to retry
+        :param jitter: Pause is randomly reduced by up to this ratio, so that concurrent clients don't retry all
+                       together
+        :param retry_sent_posts: If True, requests of non-idempotent methods are retried even if they may have been
+                                 processed
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.jitter = jitter
+        self.retry_sent_posts = retry_sent_posts
+
+    def can_retry(self, method, status=None, sent=True):
+        """ Return True if a failed request may be sent again (whatever the number of attempts left)
+
+        :param method: HTTP method of the request
+        :param status: HTTP status of the response. `None` for a connection error or a timeout.
+        :param sent: False if the request was not sent (e.g. connection refused)
+        """
+        if status is not None and status not in self.retry_statuses:
+            return False
+        if not sent or method in IDEMPOTENT_METHODS or self.retry_sent_posts:
+            return True
+        return status in UNPROCESSED_STATUSES
+
+    def get_pause(self, attempt, retry_after=None):
+        """ Return the pause in seconds before the next attempt
+
+        :param attempt: Number of the failed attempt (1 for the first one)
+        :param retry_after: Value of the `Retry-After` header, if any
+        """
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        pause = min(self.max_backoff, self.backoff * 2**(attempt - 1))
+        return pause * (1 - self.jitter * random.random())
+
+
+class TokenBucket:
+    """ Client-side rate limiter: at most `capacity` requests at once, then `rate` requests per second.
+        Thread-safe, it may be shared by several clients.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """ Init
+
+        :param rate: Number of requests per second
+        :param capacity: Number of requests that may be sent at once
+        """
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Take a token, waiting for it if needed. Return the time waited, in seconds. """
+        pause = self.reserve()
+        if pause:
+            time.sleep(pause)
+        return pause
+
+    def reserve(self):
+        """ Take a token without waiting. Return the time to wait before using it, in seconds (for callers that
+            can't block, e.g. coroutines).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class ConnectionPool:
+    """ Pool of persistent HTTP/1.1 connections to one host. Connections are kept alive between requests so that
+        TCP and TLS handshakes are done only once. At most `maxsize` idle connections are kept, other ones are
+        closed. The pool is thread-safe.
+    """
+
+    def __init__(self, scheme, host, port=None, maxsize=4, timeout=None):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param scheme: 'http' or 'https'
+        :param host: Host name
+        :param port: Port. Default port of `scheme` if not set.
+        :param maxsize: Maximum number of idle connections kept
+        :param timeout: Timeout of connections, in seconds
+        """
+        if scheme == 'https':
+            self._connection_class = http.client.HTTPSConnection
+        else:
+            self._connection_class = http.client.HTTPConnection
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """ Return an idle connection, or a new one if none is available. Idle connections closed by the server
+            meanwhile are dropped: a request sent on them could fail once sent, and not be retried.
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+            if not is_connection_dropped(connection.sock):
+                return connection
+            connection.close()
+        return self.new_connection()
+
+    def new_connection(self):
+        """ Return a new connection (connected when it sends its first request) """
+        return self._connection_class(self.host, self.port, timeout=self.timeout)
+
+    def put(self, connection):
+        """ Give back a connection after its response was fully read """
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """ Close idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class MultipartFile:
+    """ Body of a multipart/form-data request uploading a file (e.g. with add_attachment_to_result), read from disk
+        by blocks while it is sent: the file is never loaded in memory. The body may be iterated several times, to
+        be sent again when a request is retried.
+    """
+
+    def __init__(self, path, field='attachment', block_size=64 * 1024):
+        """ Init
+
+        :param path: Path of the file to upload
+        :param field: Name of the form field of the file
+        :param block_size: Size of the blocks read from the file, in bytes
+        """
+        self.path = path
+        self.block_size = block_size
+        self.size = os.path.getsize(path)
+        boundary = os.urandom(16).hex()
+        filename = os.path.basename(path).replace('"', '%22')
+        self.content_type = 'multipart/form-data; boundary=' + boundary
+        self._head = bytes(
+            '--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n' % (boundary, field, filename), 'utf-8')
+        self._tail = bytes('\r\n--%s--\r\n' % boundary, 'ascii')
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.path, 'rb') as file:
+            remaining = self.size    # Content-Length is sent first
+            while remaining > 0:
+                block = file.read(min(self.block_size, remaining))
+                if not block:
+                    raise OSError('%s was truncated while being sent' % self.path)
+                remaining -= len(block)
+                yield block
+        yield self._tail
+
+
+def is_connection_dropped(sock):
+    """ Return True if an idle connection was closed by the server: its socket is readable (end of stream) """
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def compress_body(body):
+    """ Compress a JSON request body with gzip """
+    return gzip.compress(body, compresslevel=5)
+
+
+def decode_response(content, content_encoding=None, fields=None):
+    """ Decode a JSON response
+
+    :param content: Body of the response (bytes)
+    :param content_encoding: Value of the `Content-Encoding` header of the response, if any (e.g. gzip)
+    :param fields: Names of the fields to keep in JSON objects (e.g. {'id', 'case_id'}): other fields are dropped
+                   as soon as their object is decoded. All fields are kept if not set.
+    :return: Decoded response, `{}` if body is empty
+    """
+    if content and content_encoding and content_encoding.strip().lower() == 'gzip':
+        content = gzip.decompress(content)
+    if not content:
+        return {}
+    if fields is None:
+        return json.loads(content)
+    return json.loads(content, object_pairs_hook=lambda pairs: {key: value for key, value in pairs if key in fields})
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+""" Robot Framework listener publishing results in TestRail during execution
+
+Usage::
+
+    robot --listener testrail_listener.TestRailListener:testrail.cfg:196 tests/
+
+Arguments of the listener are, in this order: TestRail configuration file, ID of the Test Run,
+version to indicate in results, maximum delay in seconds before publishing a result (default: 10),
+maximum number of results published at once (default: 100), and `False` to not publish results
+of "blocked" testcases.
+"""
+import logging
+import queue
+import threading
+import time
+
+from result_visitor import get_test_case_id_from_metadata, get_test_case_ids_from_test, get_testrail_result
+from robotframework2testrail import get_api
+from testrail_utils import RunIndex
+
+_CLOSE = object()
+
+
+class TestRailListener:
+    """ Listener (API v3) queueing results as tests end, and publishing them from a background thread
+
+        Results are published in batches, as soon as `batch_size` results are queued or `flush_interval`
+        seconds after the oldest queued result. Remaining results are published when execution ends.
+    """
+    # pylint: disable=too-many-instance-attributes
+    ROBOT_LISTENER_API_VERSION = 3
+
+    def __init__(self, config, run_id, version='', flush_interval=10, batch_size=100, publish_blocked=True,
+                 api=None):
+        # pylint: disable=too-many-arguments
+        """ Init
+
+        :param config: Path of TestRail configuration file
+        :param run_id: TestRail ID of Test Run to update
+        :param version: Version to indicate in Test Case result
+        :param flush_interval: Maximum delay in seconds between the end of a test and the publishing of its result
+        :param batch_size: Maximum number of results published at once
+        :param publish_blocked: If False, results of "blocked" Test cases in TestRail are not published
+        :param api: Client to TestRail API. Created from `config` if not set.
+        """
+        if api is None:
+            with open(config, encoding='UTF-8') as config_file:
+                api = get_api(config_file)
+        self.api = api
+        self.run_id = int(run_id)
+        self.version = version
+        self.flush_interval = float(flush_interval)
+        self.batch_size = int(batch_size)
+        self.publish_blocked = str(publish_blocked).lower() not in ('false', 'no', '0')
+        self.published_count = 0
+        self._index = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._publish_loop, name='TestRailListener', daemon=True)
+        self._thread.start()
+
+    def end_test(self, data, result):    # pylint: disable=unused-argument
+        """ Called when a test ends: queue its results """
+        suite = result.parent
+        suite_testcase_id = get_test_case_id_from_metadata(suite.metadata)
+        for name, test, testcase_id in get_test_case_ids_from_test(suite.name, suite_testcase_id, result):
+            self._queue.put(get_testrail_result(name, test, testcase_id))
+
+    def close(self):
+        """ Called when execution ends: publish remaining results """
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        logging.info('%d result(s) published in Test Run #%d.', self.published_count, self.run_id)
+
+    def _publish_loop(self):
+        """ Publish queued results by batches, until listener is closed """
+        pending = []
+        deadline = None
+        while True:
+            timeout = max(0, deadline - time.monotonic()) if pending else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _CLOSE:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+            if pending and (item is _CLOSE or len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._publish(pending)
+                pending = []
+            if item is _CLOSE:
+                return
+
+    def _publish(self, testcases):
+        """ Publish results present in Test Run. Errors are logged: they must not stop the background thread, or
+            all next results would be queued and never published.
+        """
+        try:
+            if self._index is None:
+                self._index = RunIndex(self.api.iter_tests(self.run_id, prefetch=True))
+            testcases = self._index.filter(testcases, self.publish_blocked)
+            if testcases:
+                self.published_count += len(self.api.add_results(self.run_id, self.version, testcases))
+        except Exception:    # pylint: disable=broad-except
+            logging.exception('Error while publishing %d result(s)', len(testcases))
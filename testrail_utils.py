@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 """ Various useful class using TestRail API """
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import json
 import logging
+import os
 import string
 
 import testrail
@@ -11,15 +17,184 @@ API_ADD_RESULT_CASES_URL = 'add_results_for_cases/{run_id}'
 API_GET_RUN_URL = 'get_run/{run_id}'
 API_GET_PLAN_URL = 'get_plan/{plan_id}'
 API_GET_TESTS_URL = 'get_tests/{run_id}'
+API_GET_PLANS_URL = 'get_plans/{project_id}'
+API_GET_RUNS_URL = 'get_runs/{project_id}'
+API_GET_CASES_URL = 'get_cases/{project_id}'
+API_GET_CASE_URL = 'get_case/{case_id}'
+API_ADD_RUN_URL = 'add_run/{project_id}'
+API_ADD_PLAN_ENTRY_URL = 'add_plan_entry/{plan_id}'
+API_ADD_ATTACHMENT_TO_RESULT_URL = 'add_attachment_to_result/{result_id}'
+API_PREFIX = '/api/v2/'
+
+# Default limits of a batch of results sent by `add_results`
+BATCH_SIZE = 500
+BATCH_MAX_BYTES = 2 * 1024 * 1024
+
+# Default limits of attachments uploaded by `add_results`
+ATTACHMENT_MAX_BYTES = 10 * 1024 * 1024
+ATTACHMENTS_PER_RESULT = 10
+
+# Fields of Test Runs, Test Plans and tests read to publish results: other fields are dropped while decoding
+# responses (see `testrail_http.decode_response`)
+RUN_FIELDS = frozenset(('id', 'is_completed'))
+PLAN_FIELDS = frozenset(('id', 'is_completed', 'entries', 'runs'))
+TESTS_FIELDS = frozenset(('offset', 'limit', 'size', '_links', 'next', 'tests', 'id', 'case_id', 'status_id'))
 
 ROBOTFWK_TO_TESTRAIL_STATUS = {
     "PASS": 1,
     "FAIL": 5,
 }
 
+TESTRAIL_STATUS_BLOCKED = 2
+
+
+def get_case_id(testcase):
+    """ Return the Test Case ID (int) of a testcase: `case_id` of a `result_record.ResultRecord`, else extracted
+        from its `id`. `None` if bad formatted.
+    """
+    if hasattr(testcase, 'case_id'):
+        return testcase.case_id
+    return TestRailApiUtils.extract_testcase_id(testcase['id'])
+
+
+class BatchError(testrail.APIError):
+    """ Error raised when some batches of results can't be added, even after retries """
+
+    def __init__(self, message, results, errors):
+        """ Init
+
+        :param message: Error message
+        :param results: Results added by successful batches
+        :param errors: List of tuples (batch index, error) of failed batches
+        """
+        super().__init__(message)
+        self.results = results
+        self.errors = errors
+
+
+def log_targets_summary(target_runs, outcomes):
+    """ Log the results published in each target (Test Run or Test Plan), and errors of Test Runs
+
+    :param target_runs: Dict giving for each target (e.g. 'Test Plan #200') the IDs of its available Test Runs,
+                        `None` if target is not available
+    :param outcomes: Dict giving for each Test Run ID the number of published results, `None` if Test Run is not
+                     available, or the error raised while publishing
+    :return: True if all targets are available
+    """
+    targets_by_run = collections.Counter(run_id for run_ids in target_runs.values() if run_ids for run_id in run_ids)
+    for target, run_ids in target_runs.items():
+        if run_ids is None:
+            logging.error('%s is not available', target)
+            continue
+        published = [outcomes[run_id] for run_id in run_ids if isinstance(outcomes.get(run_id), int)]
+        shared = sum(1 for run_id in run_ids if targets_by_run[run_id] > 1)
+        logging.info('%s: %d result(s) published in %d/%d Test Run(s)%s', target, sum(published), len(published),
+                     len(run_ids), ' ({} shared with other targets)'.format(shared) if shared else '')
+    for run_id, outcome in outcomes.items():
+        if outcome is None:
+            logging.error('Test Run #%d is not available', run_id)
+        elif isinstance(outcome, Exception):
+            logging.error('Error while publishing results in Test Run #%d: %s', run_id, outcome)
+    return all(run_ids is not None for run_ids in target_runs.values())
+
+
+class RunIndex:
+    """ Index of the tests of a Test Run by case ID, built once from `TestRailApiUtils.iter_tests` """
+
+    def __init__(self, tests=()):
+        """ Init
+
+        :param tests: Iterable of tests returned by TestRail (only `id`, `case_id` and `status_id` are kept)
+        """
+        self._tests = {}
+        for test in tests:
+            self.add(test)
+
+    def add(self, test):
+        """ Add a test returned by TestRail """
+        self._tests[test['case_id']] = (test.get('id'), test.get('status_id'))
+
+    def __contains__(self, case_id):
+        return case_id in self._tests
+
+    def __len__(self):
+        return len(self._tests)
+
+    def get_test_id(self, case_id):
+        """ Return TestRail ID of the test of a case. `None` if case is not in Test Run. """
+        return self._tests.get(case_id, (None, None))[0]
+
+    def get_status_id(self, case_id):
+        """ Return TestRail status of the test of a case. `None` if case is not in Test Run. """
+        return self._tests.get(case_id, (None, None))[1]
+
+    def is_blocked(self, case_id):
+        """ Return True if the test of a case is "blocked" """
+        return self.get_status_id(case_id) == TESTRAIL_STATUS_BLOCKED
+
+    def get_blocked_case_ids(self):
+        """ Return the list of case IDs whose test is "blocked" """
+        return [case_id for case_id, (_, status_id) in self._tests.items() if status_id == TESTRAIL_STATUS_BLOCKED]
+
+    def filter(self, testcases, publish_blocked=True):
+        """ Return testcases present in Test Run
+
+        :param testcases: List of testcases, returned by `get_testcases`
+        :param publish_blocked: If False, testcases whose test is "blocked" are also excluded
+        """
+        result = []
+        for testcase in testcases:
+            case_id = get_case_id(testcase)
+            if case_id not in self._tests:
+                continue
+            if not publish_blocked and self._tests[case_id][1] == TESTRAIL_STATUS_BLOCKED:
+                continue
+            result.append(testcase)
+        return result
+
+    def filter_changed(self, testcases):
+        """ Return testcases whose status differs from the current status of their test in Test Run.
+            Testcases of untested tests are kept.
+
+        :param testcases: List of testcases present in Test Run, returned by `filter`
+        """
+        result = []
+        for testcase in testcases:
+            case_id = get_case_id(testcase)
+            if self.get_status_id(case_id) != ROBOTFWK_TO_TESTRAIL_STATUS.get(testcase.get('status')):
+                result.append(testcase)
+        return result
+
 
 class TestRailApiUtils(testrail.APIClient):
     """ Class adding facilities to manipulate Testrail API """
+    # Each publishing setting (cache, journal, batches, attachments) is an attribute, set from its CLI option
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, base_url, **kwargs):
+        """ Init
+
+        :param base_url: URL of TestRail
+        :param kwargs: Other arguments of `testrail.APIClient`
+        """
+        super().__init__(base_url, **kwargs)
+        self.base_url = base_url
+        # Optional `testrail_cache.MetadataCache` of responses of get_run, get_plan and get_tests
+        self.cache = None
+        # Optional `publish_journal.PublishJournal` recording batches of results sent by `add_results`
+        self.journal = None
+        # Results sent by `add_results` are split in batches of at most `batch_size` results
+        # and `batch_max_bytes` bytes (0 means no limit), sent by `batch_workers` threads.
+        self.batch_size = BATCH_SIZE
+        self.batch_max_bytes = BATCH_MAX_BYTES
+        self.batch_workers = 1
+        # If `attachments` is set, files attached to testcases (see `result_record.ResultRecord.attachments`) are
+        # uploaded by `add_results` to their results, by `attachment_workers` threads. Files larger than
+        # `attachment_max_bytes` are skipped, and at most `attachments_per_result` files are uploaded per result.
+        self.attachments = False
+        self.attachment_max_bytes = ATTACHMENT_MAX_BYTES
+        self.attachments_per_result = ATTACHMENTS_PER_RESULT
+        self.attachment_workers = 4
 
     def add_result(self, testrun_id, testcase_info):
         """ Add a result to the given Test Run
@@ -45,30 +220,228 @@ class TestRailApiUtils(testrail.APIClient):
     def add_results(self, testrun_id, version, testcase_infos):
         """ Add a results to the given Test Run
 
+        Results are sent in batches (see `batch_size`, `batch_max_bytes` and `batch_workers`).
+        If a `journal` is set, batches already acknowledged by TestRail are not sent again.
+        If `attachments` is set, files of testcases are then uploaded to the results of sent batches
+        (see `add_attachments`).
+
         :param testrun_id: Testrail ID of the Test Run to feed
         :param version: Test version
         :param testcase_infos: List of dict containing info on testcase
+        :return: List of added results, in the order of `testcase_infos`
+        :raise BatchError: if some batches can't be added
+
+        """
+        data = self._encode_results(version, testcase_infos)
+        if data is None:
+            return None
+
+        batches = self._split_in_batches(data, self.batch_size, self.batch_max_bytes)
+        if len(batches) > 1:
+            logging.info('%d results are sent in %d batches to Test Run #%s', len(data), len(batches), testrun_id)
+
+        outcomes = [None] * len(batches)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.batch_workers)) as executor:
+            futures = {}
+            for index, batch in enumerate(batches):
+                digest = None
+                if self.journal is not None:
+                    digest = self.journal.get_batch_digest(batch)
+                    outcomes[index] = self.journal.plan_batch(testrun_id, digest, index, len(batch))
+                    if outcomes[index] is not None:
+                        continue
+                futures[executor.submit(self._add_results_batch, testrun_id, batch, digest)] = index
+            if len(futures) < len(batches):
+                logging.info('%d batch(es) already added to Test Run #%s: skipped', len(batches) - len(futures),
+                             testrun_id)
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    outcomes[futures[future]] = future.result()
+                except testrail.APIError as error:
+                    outcomes[futures[future]] = error
+
+        if self.cache is not None:
+            # Status of tests changed
+            self.cache.invalidate(self._get_cache_key(API_GET_TESTS_URL.format(run_id=testrun_id)))
+
+        results = self._merge_batch_outcomes(testrun_id, outcomes)
+        if self.attachments:
+            sent = set(futures.values())
+            offset = 0
+            result_testcases = []
+            for index, batch in enumerate(batches):
+                if index in sent:
+                    result_testcases.extend(
+                        zip(results[offset:offset + len(batch)], testcase_infos[offset:offset + len(batch)]))
+                offset += len(batch)
+            self.add_attachments(testrun_id, result_testcases)
+        return results
+
+    def add_attachments(self, testrun_id, result_testcases):
+        """ Upload files attached to testcases to their results, in parallel (see `attachment_workers`)
+
+            A file is uploaded once per Test Run: a file whose content was already uploaded (e.g. log.html, shared
+            by all failed tests) is skipped. Errors are logged, they don't stop other uploads.
+
+        :param testrun_id: Testrail ID of the fed Test Run
+        :param result_testcases: List of tuples (result added by TestRail, testcase)
+        :return: Number of uploaded files
+        """
+        uploads = []
+        digests = set()
+        path_digests = {}    # Digest of each attachable path (None if not attachable): a file is read once
+        for result, testcase in result_testcases:
+            paths = []
+            for path in getattr(testcase, 'attachments', None) or ():
+                if path not in path_digests:
+                    path_digests[path] = self.get_file_digest(path) if self._is_attachable(path) else None
+                if path_digests[path] is not None:
+                    paths.append(path)
+            for path in paths[:self.attachments_per_result]:
+                if path_digests[path] not in digests:
+                    digests.add(path_digests[path])
+                    uploads.append((result['id'], path))
+        if not uploads:
+            return 0
+
+        uploaded = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.attachment_workers)) as executor:
+            futures = {
+                executor.submit(self.add_attachment_to_result, result_id, path): (result_id, path)
+                for result_id, path in uploads
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                    uploaded += 1
+                except (testrail.APIError, OSError) as error:
+                    logging.error('Attachment %s not added to result #%s: %s', futures[future][1], futures[future][0],
+                                  error)
+        logging.info('%d/%d attachment(s) added to results of Test Run #%s', uploaded, len(uploads), testrun_id)
+        return uploaded
+
+    def add_attachment_to_result(self, result_id, path):
+        """ Upload a file as attachment of a result. The file is streamed from disk.
+
+        :param result_id: Testrail ID of the result
+        :param path: Path of the file
+        :return: Dict with `attachment_id`
+        """
+        return self.send_post(API_ADD_ATTACHMENT_TO_RESULT_URL.format(result_id=result_id), path)
+
+    def _is_attachable(self, path):
+        """ Return True if a file can be uploaded: it exists, and isn't larger than `attachment_max_bytes` """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            logging.warning('Attachment %s not found: skipped', path)
+            return False
+        if self.attachment_max_bytes and size > self.attachment_max_bytes:
+            logging.warning('Attachment %s is larger than %d bytes: skipped', path, self.attachment_max_bytes)
+            return False
+        return True
 
+    @staticmethod
+    def get_file_digest(path, block_size=64 * 1024):
+        """ Return the SHA-256 digest of the content of a file, read by blocks """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _merge_batch_outcomes(testrun_id, outcomes):
+        """ Return results added by batches, in order
+
+        :param testrun_id: Testrail ID of the fed Test Run
+        :param outcomes: List of results added by each batch, or `testrail.APIError` if batch was not added
+        :raise BatchError: if some batches were not added
+        """
+        results = []
+        errors = []
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, testrail.APIError):
+                errors.append((index, outcome))
+            else:
+                results.extend(outcome)
+        if errors:
+            raise BatchError(
+                '{}/{} batch(es) of results not added to Test Run #{} ({} result(s) added): {}'.format(
+                    len(errors), len(outcomes), testrun_id, len(results), errors[0][1]), results, errors)
+        return results
+
+    @staticmethod
+    def _encode_results(version, testcase_infos):
+        """ Return results to send with `add_results_for_cases`, each one encoded in JSON.
+            `None` if a Testcase ID is bad formatted.
+
+            Results are encoded one by one, without building a dict per result: size of a result is known before
+            building batches, and the body of a request is the concatenation of its results (see `_get_body`).
+
+        :param version: Test version
+        :param testcase_infos: List of testcases (`result_record.ResultRecord` or dict)
+        :return: List of results encoded in JSON (bytes)
         """
+        encoded_version = ', "version": ' + json.dumps(version) if version else ''
         data = []
         for testcase_info in testcase_infos:
-            testcase_data = {
-                'status_id': ROBOTFWK_TO_TESTRAIL_STATUS[testcase_info.get('status')]
-            }
-            if version:
-                testcase_data['version'] = version
-            if 'comment' in testcase_info:
-                testcase_data['comment'] = testcase_info.get('comment')
-            if 'duration' in testcase_info:
-                testcase_data['elapsed'] = str(testcase_info.get('duration')) + 's'
-            testcase_id = self.extract_testcase_id(testcase_info['id'])
+            testcase_id = get_case_id(testcase_info)
             if not testcase_id:
                 logging.error('Testcase ID is bad formatted: "%s"', testcase_info['id'])
                 return None
-            testcase_data['case_id'] = testcase_id
-            data.append(testcase_data)
+            result = '{"status_id": %d' % ROBOTFWK_TO_TESTRAIL_STATUS[testcase_info.get('status')] + encoded_version
+            if 'comment' in testcase_info:
+                result += ', "comment": ' + json.dumps(testcase_info.get('comment'))
+            if 'duration' in testcase_info:
+                result += ', "elapsed": ' + json.dumps(str(testcase_info.get('duration')) + 's')
+            result += ', "case_id": %d}' % testcase_id
+            data.append(result.encode('ascii'))    # json.dumps escapes non-ASCII characters
+        return data
+
+    @staticmethod
+    def _split_in_batches(data, batch_size, batch_max_bytes):
+        """ Split results in batches
+
+        :param data: List of encoded results to send
+        :param batch_size: Maximum number of results in a batch (0 for no limit)
+        :param batch_max_bytes: Maximum size of a batch (0 for no limit)
+        :return: List of batches (list of encoded results)
+        """
+        batches = []
+        batch = []
+        batch_bytes = 0
+        for testcase_data in data:
+            size = len(testcase_data) + 1    # With separator
+            if batch and ((batch_size and len(batch) >= batch_size) or
+                          (batch_max_bytes and batch_bytes + size > batch_max_bytes)):
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+            batch.append(testcase_data)
+            batch_bytes += size
+        if batch or not batches:
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def _get_body(batch):
+        """ Return the body of `add_results_for_cases` request sending a batch of encoded results """
+        return b'{"results": [' + b','.join(batch) + b']}'
 
-        return self.send_post(API_ADD_RESULT_CASES_URL.format(run_id=testrun_id), {'results': data})
+    def _add_results_batch(self, testrun_id, batch, digest=None):
+        """ Send a batch of results. Transient errors are retried by the client (see `retry_policy`): a batch
+            failing after that is not sent again, and other errors (e.g. HTTP 400 for a bad case ID) are permanent.
+
+        :param testrun_id: Testrail ID of the Test Run to feed
+        :param batch: List of encoded results to send
+        :param digest: Digest of the batch in `journal`, to acknowledge it
+        :return: List of added results
+        """
+        results = self.send_post(API_ADD_RESULT_CASES_URL.format(run_id=testrun_id), self._get_body(batch))
+        if digest is not None:
+            self.journal.acknowledge_batch(testrun_id, digest, results)
+        return results
 
     def is_testrun_available(self, testrun_id):
         """ Ask if Test Run is available in TestRail.
@@ -77,7 +450,7 @@ class TestRailApiUtils(testrail.APIClient):
         :return: True if Test Run exists AND is open
         """
         try:
-            response = self.send_get(API_GET_RUN_URL.format(run_id=testrun_id))
+            response = self._cached_get(API_GET_RUN_URL.format(run_id=testrun_id), RUN_FIELDS)
             return response['is_completed'] is False
         except testrail.APIError as error:
             logging.error(error)
@@ -90,7 +463,7 @@ class TestRailApiUtils(testrail.APIClient):
         :return: True if Test Plan exists AND is open
         """
         try:
-            response = self.send_get(API_GET_PLAN_URL.format(plan_id=testplan_id))
+            response = self._cached_get(API_GET_PLAN_URL.format(plan_id=testplan_id), PLAN_FIELDS)
             return response['is_completed'] is False
         except testrail.APIError as error:
             logging.error(error)
@@ -103,13 +476,54 @@ class TestRailApiUtils(testrail.APIClient):
         :return: List of available Test Runs associated to a Test Plan in TestRail.
         """
         testruns_list = []
-        response = self.send_get(API_GET_PLAN_URL.format(plan_id=testplan_id))
+        response = self._cached_get(API_GET_PLAN_URL.format(plan_id=testplan_id), PLAN_FIELDS)
         for entry in response['entries']:
             for run in entry['runs']:
                 if not run['is_completed']:
                     testruns_list.append(run['id'])
         return testruns_list
 
+    def add_run(self, project_id, name, case_ids, suite_id=None, **fields):
+        """ Create a Test Run containing only the given Test Cases
+
+        :param project_id: TestRail ID of the project
+        :param name: Name of the Test Run
+        :param case_ids: IDs (int) of the Test Cases of the Test Run
+        :param suite_id: TestRail ID of the suite (only needed for projects with several suites)
+        :param fields: Other fields of the Test Run (e.g. description, milestone_id)
+        :return: Created Test Run
+        """
+        data = {'name': name, 'include_all': False, 'case_ids': list(case_ids)}
+        if suite_id:
+            data['suite_id'] = suite_id
+        data.update(fields)
+        return self.send_post(API_ADD_RUN_URL.format(project_id=project_id), data)
+
+    def add_plan_entry(self, testplan_id, suite_id, name, case_ids, **fields):
+        """ Create a Test Run containing only the given Test Cases in a Test Plan
+
+        :param testplan_id: TestRail ID of the Test Plan
+        :param suite_id: TestRail ID of the suite of the Test Cases
+        :param name: Name of the Test Run
+        :param case_ids: IDs (int) of the Test Cases of the Test Run
+        :param fields: Other fields of the plan entry (e.g. description, milestone_id)
+        :return: Created Test Run
+        """
+        data = {'suite_id': suite_id, 'name': name, 'include_all': False, 'case_ids': list(case_ids)}
+        data.update(fields)
+        entry = self.send_post(API_ADD_PLAN_ENTRY_URL.format(plan_id=testplan_id), data)
+        if self.cache is not None:
+            # Test Runs of Test Plan changed
+            self.cache.invalidate(self._get_cache_key(API_GET_PLAN_URL.format(plan_id=testplan_id)))
+        return entry['runs'][0]
+
+    def get_case(self, testcase_id):
+        """ Return a Test Case
+
+        :param testcase_id: TestRail ID of the Test Case
+        """
+        return self.send_get(API_GET_CASE_URL.format(case_id=testcase_id))
+
     @staticmethod
     def extract_testcase_id(str_content):
         """ Extract testcase ID (TestRail) from the given string.
@@ -138,6 +552,94 @@ class TestRailApiUtils(testrail.APIClient):
 
         """
         try:
-            return self.send_get(API_GET_TESTS_URL.format(run_id=testrun_id))
+            return list(self.iter_tests(testrun_id))
         except testrail.APIError as error:
             logging.error(error)
+
+    def iter_tests(self, testrun_id, prefetch=False):
+        """ Yield tests containing in a Test Run, page by page. Only fields of `TESTS_FIELDS` are decoded.
+
+        :param testrun_id: TestRail ID of the Test Run
+        :param prefetch: If True, next page is fetched while current one is processed
+        """
+        return self.iter_pages(
+            API_GET_TESTS_URL.format(run_id=testrun_id), 'tests', prefetch, cached=True, fields=TESTS_FIELDS)
+
+    def iter_plans(self, project_id, prefetch=False):
+        """ Yield Test Plans of a project, page by page.
+
+        :param project_id: TestRail ID of the project
+        :param prefetch: If True, next page is fetched while current one is processed
+        """
+        return self.iter_pages(API_GET_PLANS_URL.format(project_id=project_id), 'plans', prefetch)
+
+    def iter_runs(self, project_id, prefetch=False):
+        """ Yield Test Runs of a project, page by page.
+
+        :param project_id: TestRail ID of the project
+        :param prefetch: If True, next page is fetched while current one is processed
+        """
+        return self.iter_pages(API_GET_RUNS_URL.format(project_id=project_id), 'runs', prefetch)
+
+    def iter_cases(self, project_id, suite_id=None, prefetch=False):
+        """ Yield Test Cases of a project, page by page.
+
+        :param project_id: TestRail ID of the project
+        :param suite_id: TestRail ID of the suite (only needed for projects with several suites)
+        :param prefetch: If True, next page is fetched while current one is processed
+        """
+        uri = API_GET_CASES_URL.format(project_id=project_id)
+        if suite_id:
+            uri += '&suite_id={}'.format(suite_id)
+        return self.iter_pages(uri, 'cases', prefetch)
+
+    def iter_pages(self, uri, key, prefetch=False, cached=False, fields=None):
+        # pylint: disable=too-many-arguments
+        """ Yield items returned by a paginated API method, following `_links.next` of each page.
+            Responses of TestRail < 6.7, that are not paginated, are also managed.
+
+        :param uri: API method to call (e.g. get_tests/1)
+        :param key: Key of items in a page (e.g. 'tests')
+        :param prefetch: If True, next page is fetched in background while current one is processed
+        :param cached: If True, pages are read from `cache`, if any
+        :param fields: Fields of the JSON objects of pages to keep (see `testrail_http.decode_response`), all if not set
+        """
+        send_get = self._cached_get if cached else self.send_get
+        if fields is not None:
+            send_get = functools.partial(send_get, fields=fields)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = send_get(uri)
+            while True:
+                if isinstance(page, list):    # Not paginated
+                    yield from page
+                    return
+                next_uri = self._get_next_page_uri(page)
+                next_page = executor.submit(send_get, next_uri) if (executor and next_uri) else None
+                yield from page.get(key, [])
+                if not next_uri:
+                    return
+                page = next_page.result() if next_page else send_get(next_uri)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def _cached_get(self, uri, fields=None):
+        """ Issue a GET request, unless its response is in `cache`. A cached response keeps only the fields it was
+            requested with: a same API method must always be requested with the same `fields`.
+        """
+        if self.cache is None:
+            return self.send_get(uri, fields)
+        return self.cache.get_or_fetch(self._get_cache_key(uri), lambda: self.send_get(uri, fields))
+
+    def _get_cache_key(self, uri):
+        """ Return the key of a response in `cache` """
+        return self.base_url.rstrip('/') + '/' + uri
+
+    @staticmethod
+    def _get_next_page_uri(page):
+        """ Return URI of the next page of a paginated response. `None` for last page. """
+        next_link = (page.get('_links') or {}).get('next')
+        if not next_link:
+            return None
+        return next_link.split(API_PREFIX, 1)[-1]